@@ -1,33 +1,187 @@
-
-
 # connections/admin.py
 
 from django.contrib import admin
-from .models import AirportData, PilotProfile, Message, PilotEvent
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from . import ratelimit
+from .models import Club, AirportData, PilotProfile, Message, ArchivedMessage, PilotEvent, EventRSVP, Aircraft, RentalSlot, LogbookEntry, FlightTimeRollup
+
+
+def estimated_rows(model, using='default'):
+    """The planner's row count for model's table, or None if the database has no statistics for it."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # Written by ANALYZE, which archive_messages runs after compacting
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the table statistics instead of COUNT(*) for unfiltered changelists of big tables.
+
+    Filtered and searched lists, and tables under EXACT_BELOW rows, are still counted
+    exactly. The estimate can be off by a little, so the last page may come up short.
+    """
+    EXACT_BELOW = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.EXACT_BELOW:
+                return estimate
+        return super().count
+
+
+# Drills down by date without scanning the table, see templatetags/admin_calendar.py
+CALENDAR_CHANGE_LIST = 'admin/connections/calendar_change_list.html'
+
+
+class ClubAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'domain')
+    search_fields = ('name', 'slug', 'domain')
+    prepopulated_fields = {'slug': ('name',)}
+
+admin.site.register(Club, ClubAdmin)
 
 class AirportDataAdmin(admin.ModelAdmin):
     list_display = ('icao', 'airport', 'state', 'city')
     search_fields = ('icao', 'airport', 'state', 'city')
+    ordering = ('icao',)
 
 admin.site.register(AirportData, AirportDataAdmin)
 
 class PilotProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'home_airport', 'flight_hours', 'last_activity_date')
-    search_fields = ('user__username', 'home_airport__airport', 'flight_hours')
-    list_filter = ('last_activity_date', 'private_pilot', 'instrument_rating', 'commercial_pilot_single_engine')
+    list_select_related = ('user', 'home_airport')
+    search_fields = ('user__username', 'home_airport__icao', 'home_airport__airport')
+    list_filter = ('club', 'private_pilot', 'instrument_rating', 'commercial_pilot_single_engine')
+    date_hierarchy = 'last_activity_date'
+    change_list_template = CALENDAR_CHANGE_LIST
+    autocomplete_fields = ('user', 'home_airport')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(PilotProfile, PilotProfileAdmin)
 
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('sender', 'recipient', 'subject', 'timestamp')
-    search_fields = ('sender__username', 'recipient__username', 'subject')
-    list_filter = ('timestamp',)
+    list_select_related = ('sender', 'recipient')
+    search_fields = ('subject',)
+    # Partial usernames aren't searched, that would join users onto every message
+    search_help_text = 'Matches words in the subject, or exact usernames of the sender or recipient.'
+    # Its change_list.html extends CALENDAR_CHANGE_LIST
+    date_hierarchy = 'timestamp'
+    # Newest first, read straight off message_time_idx with or without a date range
+    ordering = ('-timestamp',)
+    autocomplete_fields = ('sender', 'recipient', 'deleted_for_user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Searching for usernames resolves them first, then finds their messages through
+        # the sender and recipient indexes instead of joining users onto every message
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        user_ids = list(User.objects.filter(username__in=search_term.split()).values_list('pk', flat=True))
+        if user_ids:
+            results |= queryset.filter(Q(sender__in=user_ids) | Q(recipient__in=user_ids))
+        return results, may_have_duplicates
+
+    def changelist_view(self, request, extra_context=None):
+        # Rate limit counters live in the cache, not a table, so show them above the messages
+        extra_context = {**(extra_context or {}), 'rate_limit_counters': ratelimit.counters()}
+        return super().changelist_view(request, extra_context=extra_context)
 
 admin.site.register(Message, MessageAdmin)
 
+class ArchivedMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sender_id', 'recipient_id', 'subject', 'timestamp', 'reason', 'archived_at')
+    list_filter = ('reason',)
+    # The archive has no indexes besides the id, keep the sender and recipient as plain ids
+    raw_id_fields = ('sender', 'recipient')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+admin.site.register(ArchivedMessage, ArchivedMessageAdmin)
+
 class PilotEventAdmin(admin.ModelAdmin):
-    list_display = ('event_name', 'event_start_date', 'host_airport', 'host_name')
-    search_fields = ('event_name', 'host_airport__airport', 'host_name__username')
-    list_filter = ('event_start_date', 'host_airport', 'host_name')
+    list_display = ('event_name', 'event_start_date', 'host_airport', 'host_name', 'attendee_count')
+    list_select_related = ('host_airport', 'host_name')
+    search_fields = ('event_name', 'host_airport__icao', 'host_airport__airport', 'host_name__username')
+    list_filter = ('club',)
+    date_hierarchy = 'event_start_date'
+    change_list_template = CALENDAR_CHANGE_LIST
+    autocomplete_fields = ('host_airport', 'second_airport', 'third_airport', 'host_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 admin.site.register(PilotEvent, PilotEventAdmin)
+
+class EventRSVPAdmin(admin.ModelAdmin):
+    list_display = ('event', 'user', 'created_at')
+    list_select_related = ('event__host_name', 'user')
+    search_fields = ('event__event_name', 'user__username')
+    date_hierarchy = 'created_at'
+    change_list_template = CALENDAR_CHANGE_LIST
+    autocomplete_fields = ('event', 'user')
+
+admin.site.register(EventRSVP, EventRSVPAdmin)
+
+class AircraftAdmin(admin.ModelAdmin):
+    list_display = ('tail_number', 'make_model', 'engine_class', 'home_airport', 'owner')
+    list_select_related = ('home_airport', 'owner__user')
+    search_fields = ('tail_number', 'make_model', 'owner__user__username')
+    list_filter = ('engine_class',)
+    autocomplete_fields = ('owner', 'home_airport')
+
+admin.site.register(Aircraft, AircraftAdmin)
+
+class RentalSlotAdmin(admin.ModelAdmin):
+    list_display = ('aircraft', 'start', 'end', 'booked_by', 'booked_at')
+    list_select_related = ('aircraft', 'booked_by')
+    search_fields = ('aircraft__tail_number', 'booked_by__username')
+    date_hierarchy = 'start'
+    change_list_template = CALENDAR_CHANGE_LIST
+    autocomplete_fields = ('aircraft', 'booked_by')
+
+admin.site.register(RentalSlot, RentalSlotAdmin)
+
+class LogbookEntryAdmin(admin.ModelAdmin):
+    list_display = ('pilot', 'date', 'aircraft_class', 'departure', 'arrival', 'duration', 'conditions')
+    list_select_related = ('pilot', 'departure', 'arrival')
+    search_fields = ('pilot__username',)
+    list_filter = ('aircraft_class', 'conditions')
+    date_hierarchy = 'date'
+    change_list_template = CALENDAR_CHANGE_LIST
+    autocomplete_fields = ('pilot', 'departure', 'arrival')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+admin.site.register(LogbookEntry, LogbookEntryAdmin)
+
+class FlightTimeRollupAdmin(admin.ModelAdmin):
+    list_display = ('pilot', 'flights', 'total_hours', 'hours_90', 'multi_engine_hours', 'ifr_hours', 'last_flight_date', 'windows_as_of')
+    list_select_related = ('pilot',)
+    search_fields = ('pilot__username',)
+    # Maintained from the logbooks, see connections/logbook.py
+    readonly_fields = [field.name for field in FlightTimeRollup._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(FlightTimeRollup, FlightTimeRollupAdmin)
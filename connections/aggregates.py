@@ -0,0 +1,194 @@
+# connections/aggregates.py
+
+import operator
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import tenancy
+from .directory import DIRECTORY_FLAGS
+from .models import AirportData, AirportStats, PilotEvent, PilotProfile, StateStats, TableVersion
+
+
+def _any_flag(flags):
+    return reduce(operator.or_, (Q(**{flag: True}) for flag in flags))
+
+
+# Counter name -> which profiles it counts. An empty Q counts every profile.
+PROFILE_COUNTERS = {
+    'pilots': Q(),
+    'instrument_rated': Q(instrument_rating=True),
+    'instructors': _any_flag(['flight_instructor_cfi', 'flight_instructor_cfii', 'flight_instructor_multi_engine_mei']),
+}
+PROFILE_COUNTERS.update(
+    (f'{role}_{direction}', _any_flag(flag for _, flag in columns))
+    for role, directions in DIRECTORY_FLAGS.items() if role != 'pilot'
+    for direction, columns in directions.items()
+)
+
+COUNTERS = list(PROFILE_COUNTERS) + ['upcoming_events']
+
+COUNTER_LABELS = {
+    'pilots': 'Pilots',
+    'instrument_rated': 'Instrument rated',
+    'instructors': 'Flight instructors',
+    'safety_need': 'Need a safety pilot',
+    'safety_offer': 'Offer to safety pilot',
+    'instructor_need': 'Looking for instruction',
+    'instructor_offer': 'Offering instruction',
+    'rental_need': 'Looking to rent',
+    'rental_offer': 'Offering rentals',
+    'upcoming_events': 'Upcoming events',
+}
+
+EVENT_AIRPORTS = ('host_airport', 'second_airport', 'third_airport')
+
+
+def _q_fields(q):
+    return {name for child in q.children for name in (_q_fields(child) if isinstance(child, Q) else [child[0]])}
+
+
+# Model -> the fields a save has to write for the counts to change
+COUNTED_FIELDS = {
+    PilotProfile: frozenset(['home_airport', 'club', *(name for q in PROFILE_COUNTERS.values() for name in _q_fields(q))]),
+    PilotEvent: frozenset([*EVENT_AIRPORTS, 'club', 'event_finish_date']),
+}
+
+_local = threading.local()
+
+
+@contextmanager
+def refresh_suspended():
+    """Skip the per-row refreshes (aggregates and home feeds) inside the block, for bulk jobs that rebuild after."""
+    previous = getattr(_local, 'suspended', False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+def is_suspended():
+    return getattr(_local, 'suspended', False)
+
+
+def current_scope():
+    """The scope of the aggregate rows to show: the active club's, or every club's together."""
+    return tenancy.current_club_id() or 0
+
+
+def _scopes(club_id):
+    # Everything counts towards the installation-wide rows, and towards its club's if it has one
+    return (0, club_id) if club_id else (0,)
+
+
+def _profile_counts(airport_ids=None):
+    """(scope, airport id) -> {counter: n} from one grouped pass over the profiles."""
+    queryset = PilotProfile.all_objects.filter(home_airport__isnull=False)
+    if airport_ids is not None:
+        queryset = queryset.filter(home_airport_id__in=airport_ids)
+    aggregates = {name: Count('pk', filter=q) if q else Count('pk') for name, q in PROFILE_COUNTERS.items()}
+    counts = defaultdict(Counter)
+    for row in queryset.order_by().values('club_id', 'home_airport_id').annotate(**aggregates):
+        club_id, airport_id = row.pop('club_id'), row.pop('home_airport_id')
+        for scope in _scopes(club_id):
+            counts[scope, airport_id].update(row)
+    return counts
+
+
+def _event_counts(airport_ids=None):
+    """(scope, airport id) -> upcoming events using it as host, second or third airport."""
+    queryset = PilotEvent.all_objects.filter(event_finish_date__gte=timezone.localdate())
+    if airport_ids is not None:
+        queryset = queryset.filter(reduce(operator.or_, (Q(**{f'{field}__in': airport_ids}) for field in EVENT_AIRPORTS)))
+    counts = Counter()
+    for club_id, *airports in queryset.values_list('club_id', *(f'{field}_id' for field in EVENT_AIRPORTS)):
+        # An event naming the same airport twice still counts once there
+        counts.update({(scope, airport_id) for airport_id in airports if airport_id for scope in _scopes(club_id)})
+    return counts
+
+
+def _airport_rows(airport_ids=None):
+    profiles = _profile_counts(airport_ids)
+    events = _event_counts(airport_ids)
+    if airport_ids is not None:
+        events = {key: n for key, n in events.items() if key[1] in airport_ids}
+
+    keys = set(profiles) | set(events)
+    ids = {airport_id for _, airport_id in keys}
+    airports = AirportData.objects.all() if airport_ids is None else AirportData.objects.filter(pk__in=ids)
+    states = dict(airports.values_list('id', 'state')) if ids else {}
+    now = timezone.now()
+    rows = []
+    for scope, airport_id in keys:
+        counts = dict.fromkeys(PROFILE_COUNTERS, 0)
+        counts.update(profiles.get((scope, airport_id), {}))
+        counts['upcoming_events'] = events.get((scope, airport_id), 0)
+        rows.append(AirportStats(scope=scope, airport_id=airport_id, state=states.get(airport_id, ''), updated_at=now, **counts))
+    return rows
+
+
+def _state_rows(states=None):
+    queryset = AirportStats.objects.all()
+    if states is not None:
+        queryset = queryset.filter(state__in=states)
+    rows = queryset.order_by().values('scope', 'state').annotate(airports=Count('pk'), **{name: Sum(name) for name in COUNTERS})
+    now = timezone.now()
+    return [StateStats(updated_at=now, **row) for row in rows]
+
+
+def _replace(model, existing, rows, key):
+    """Upsert rows over the existing queryset of model, deleting the existing rows no longer among them."""
+    kept = {tuple(getattr(row, field) for field in key) for row in rows}
+    stale = [pk for pk, *values in existing.values_list('pk', *key) if tuple(values) not in kept]
+    model.objects.filter(pk__in=stale).delete()
+    unique_fields = [field.removesuffix('_id') for field in key]
+    update_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key and field.name not in unique_fields]
+    model.objects.bulk_create(rows, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+
+
+def refresh_airports(airport_ids):
+    """
+    Recount the given airports and their states after a profile or event changed.
+
+    Each recount reads only the rows for those airports through the home airport
+    and event airport indexes, so it stays cheap however large the tables get.
+    Rows are upserted in place, for every club and for the whole installation;
+    airports and states left with no activity lose their row, which keeps the
+    heatmap small.
+    """
+    airport_ids = {airport_id for airport_id in airport_ids if airport_id}
+    if not airport_ids or is_suspended():
+        return
+
+    with transaction.atomic():
+        rows = _airport_rows(airport_ids)
+        existing = AirportStats.objects.filter(airport_id__in=airport_ids)
+        states = set(existing.values_list('state', flat=True))
+        states.update(row.state for row in rows)
+
+        _replace(AirportStats, existing, rows, ('scope', 'airport_id'))
+        _replace(StateStats, StateStats.objects.filter(state__in=states), _state_rows(states), ('scope', 'state'))
+
+    TableVersion.bump(AirportStats._meta.model_name)
+    TableVersion.bump(StateStats._meta.model_name)
+
+
+def recompute_all():
+    """Rebuild both aggregate tables from scratch. Returns (airport rows, state rows)."""
+    with transaction.atomic():
+        rows = _airport_rows()
+        AirportStats.objects.all().delete()
+        AirportStats.objects.bulk_create(rows, batch_size=1000)
+        state_rows = _state_rows()
+        StateStats.objects.all().delete()
+        StateStats.objects.bulk_create(state_rows, batch_size=1000)
+
+    TableVersion.bump(AirportStats._meta.model_name)
+    TableVersion.bump(StateStats._meta.model_name)
+    return len(rows), len(state_rows)
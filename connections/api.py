@@ -0,0 +1,257 @@
+# connections/api.py
+
+import hashlib
+from functools import wraps
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+
+from .aggregates import COUNTERS, current_scope
+from .tenancy import current_club_id
+from .directory import DEFAULT_RADIUS_NM, MAX_RADIUS_NM, directory_queryset, get_columns, parse_recency
+from .models import AirportData, AirportStats, PilotEvent, PilotProfile, StateStats, TableVersion
+
+API_VERSION = 'v1'
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+# Public field name -> ORM path, per resource. Responses are built from .values()
+# so only the selected columns are read and no model instances are created.
+AIRPORT_FIELDS = {
+    'id': 'id',
+    'icao': 'icao',
+    'iata': 'iata',
+    'airport': 'airport',
+    'city': 'city',
+    'state': 'state',
+    'country_code': 'country_code',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+}
+
+EVENT_FIELDS = {
+    'id': 'id',
+    'name': 'event_name',
+    'start_date': 'event_start_date',
+    'finish_date': 'event_finish_date',
+    'host_airport': 'host_airport__icao',
+    'second_airport': 'second_airport__icao',
+    'third_airport': 'third_airport__icao',
+    'host': 'host_name__username',
+    'description': 'event_description',
+    'attendees': 'attendee_count',
+}
+
+PROFILE_FIELDS = {
+    'id': 'id',
+    'user_id': 'user_id',
+    'username': 'user__username',
+    'home_airport': 'home_airport__icao',
+    'flight_hours': 'flight_hours',
+}
+
+PILOT_FIELDS = {
+    'id': 'id',
+    'user_id': 'id',
+    'username': 'username',
+    'home_airport': 'pilotprofile__home_airport__icao',
+}
+
+# Tables whose changes can alter each resource's output
+AIRPORT_TABLES = ('airportdata',)
+EVENT_TABLES = ('pilotevent', 'airportdata', 'user')
+DIRECTORY_TABLES = ('pilotprofile', 'airportdata', 'user', 'flighttimerollup')
+ACTIVITY_TABLES = ('airportstats', 'statestats')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _select_fields(request, available):
+    requested = request.GET.get('fields')
+    if not requested:
+        return available
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return {name: available[name] for name in names}
+
+
+def _int_param(request, name, default, minimum, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise ApiError(f"'{name}' must be an integer")
+    return min(max(value, minimum), maximum)
+
+
+def _keyset_page(request, queryset, fields):
+    """
+    Serialize one page ordered by primary key, starting after the ?after= key.
+
+    Seeking on the key keeps every page an index range scan, unlike OFFSET which
+    reads and discards all the rows before the page.
+    """
+    limit = _int_param(request, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+    after = _int_param(request, 'after', 0, 0, 2 ** 63 - 1)
+
+    paths = list(dict.fromkeys(['pk', *fields.values()]))
+    rows = list(queryset.filter(pk__gt=after).order_by('pk').values(*paths)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_url = None
+    if has_more:
+        query = request.GET.copy()
+        query['after'] = rows[-1]['pk']
+        next_url = f"{request.path}?{query.urlencode()}"
+
+    return {
+        'results': [{name: row[path] for name, path in fields.items()} for row in rows],
+        'next': next_url,
+    }
+
+
+def _table_versions(request, tables):
+    if not hasattr(request, '_table_versions'):
+        request._table_versions = TableVersion.current(tables)
+    return request._table_versions
+
+
+def _api_view(tables):
+    """
+    Wrap an API view with JSON error handling and conditional GET.
+
+    The ETag hashes the versions of the tables the resource reads plus the query
+    string, so a matching If-None-Match is answered with a 304 after reading only
+    the small TableVersion table. Views taking a scope also key on the user,
+    since the results depend on who is asking, and every resource keys on the
+    date, since which events are upcoming and who has flown recently change at
+    midnight without any table changing. There is no Last-Modified: the tables'
+    update times know nothing of the date, user or club, so If-Modified-Since would
+    answer 304 for results that have changed.
+    """
+    def etag(request, *args, **kwargs):
+        versions = _table_versions(request, tables)
+        key = [API_VERSION, request.path, request.GET.urlencode(), timezone.localdate().isoformat()]
+        key += [f"{table}:{versions[table].version if table in versions else 0}" for table in tables]
+        if 'scope' in kwargs:
+            key.append(f"user:{request.user.pk}")
+        # Each club sees different rows behind the same table versions
+        key.append(f"club:{current_club_id()}")
+        return '"%s"' % hashlib.sha1('|'.join(key).encode()).hexdigest()
+
+    def decorator(view):
+        @require_GET
+        @condition(etag_func=etag)
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            try:
+                return JsonResponse(view(request, *args, **kwargs))
+            except ApiError as e:
+                return JsonResponse({'error': str(e)}, status=e.status)
+
+        return wrapped
+
+    return decorator
+
+
+@_api_view(AIRPORT_TABLES)
+def airports(request):
+    queryset = AirportData.objects.all()
+    if request.GET.get('state'):
+        queryset = queryset.filter(state=request.GET['state'])
+    if request.GET.get('icao'):
+        queryset = queryset.filter(icao=request.GET['icao'].upper())
+    return _keyset_page(request, queryset, _select_fields(request, AIRPORT_FIELDS))
+
+
+@_api_view(EVENT_TABLES)
+def events(request):
+    queryset = PilotEvent.objects.filter(event_finish_date__gte=timezone.localdate())
+    state = request.GET.get('state')
+    if state:
+        queryset = queryset.filter(
+            Q(host_airport__state=state) | Q(second_airport__state=state) | Q(third_airport__state=state)
+        )
+    return _keyset_page(request, queryset, _select_fields(request, EVENT_FIELDS))
+
+
+@_api_view(DIRECTORY_TABLES)
+def directory(request, role, direction, scope):
+    if not request.user.is_authenticated:
+        raise ApiError('Authentication required', status=401)
+    try:
+        columns = get_columns(role, direction)
+    except ValueError:
+        raise ApiError('Unknown directory', status=404)
+
+    home_airport = None
+    if scope != 'all':
+        pilot_profile = PilotProfile.all_objects.select_related('home_airport').filter(user=request.user).first()
+        if pilot_profile is None or pilot_profile.home_airport is None:
+            raise ApiError('Set your home airport to use this scope', status=409)
+        home_airport = pilot_profile.home_airport
+
+    try:
+        recency = parse_recency(request.GET)
+    except ValueError as e:
+        raise ApiError(str(e))
+
+    try:
+        queryset = directory_queryset(
+            role, direction, scope,
+            home_airport=home_airport,
+            radius_nm=_int_param(request, 'radius', DEFAULT_RADIUS_NM, 1, MAX_RADIUS_NM),
+            recency=recency,
+        )
+    except ValueError:
+        raise ApiError('Unknown directory', status=404)
+
+    available = dict(PILOT_FIELDS if role == 'pilot' else PROFILE_FIELDS)
+    available.update((flag, flag) for _, flag in columns)
+    return _keyset_page(request, queryset, _select_fields(request, available))
+
+
+@_api_view(ACTIVITY_TABLES)
+def activity(request):
+    """
+    Heatmap points for one activity counter, per airport or per state.
+
+    Counts come from the aggregate tables, joined to airports by key for their
+    coordinates, so the whole map is one query however many profiles and events
+    sit behind it. Airports without activity have no row.
+    """
+    metric = request.GET.get('metric', 'pilots')
+    if metric not in COUNTERS:
+        raise ApiError(f"Unknown metric, choose one of: {', '.join(COUNTERS)}")
+    level = request.GET.get('level', 'airport')
+
+    if level == 'state':
+        rows = StateStats.objects.filter(scope=current_scope(), **{f'{metric}__gt': 0}).order_by('state').values_list('state', metric)
+        points = [{'state': state, 'value': value} for state, value in rows]
+    elif level == 'airport':
+        # Only the active club's counts, or every club's together installation-wide
+        queryset = AirportStats.objects.filter(scope=current_scope(), **{f'{metric}__gt': 0})
+        if request.GET.get('state'):
+            queryset = queryset.filter(state=request.GET['state'])
+        rows = queryset.order_by('airport_id').values_list('airport_id', 'airport__icao', 'airport__latitude', 'airport__longitude', metric)
+        points = [
+            {'id': pk, 'icao': icao, 'latitude': latitude, 'longitude': longitude, 'value': value}
+            for pk, icao, latitude, longitude, value in rows
+        ]
+    else:
+        raise ApiError("'level' must be 'airport' or 'state'")
+
+    return {
+        'metric': metric,
+        'level': level,
+        'max': max((point['value'] for point in points), default=0),
+        'points': points,
+    }
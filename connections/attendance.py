@@ -0,0 +1,39 @@
+# connections/attendance.py
+
+from django.db import transaction
+
+from .models import EventRSVP
+
+
+def attend(event, user):
+    """RSVP user to event. Returns False if they were already attending."""
+    with transaction.atomic():
+        # get_or_create absorbs the unique constraint race between two requests
+        _, created = EventRSVP.objects.get_or_create(event=event, user=user)
+    return created
+
+
+def unattend(event, user):
+    """Withdraw user's RSVP. Returns False if they were not attending."""
+    with transaction.atomic():
+        deleted, _ = EventRSVP.objects.filter(event=event, user=user).delete()
+    return bool(deleted)
+
+
+def attending_event_ids(user, events):
+    """
+    Ids of the events in a page of events that user has RSVPed to.
+
+    One query for the whole page, so templates can check membership instead of
+    asking per event.
+    """
+    if not user.is_authenticated:
+        return set()
+    event_ids = [event.pk for event in events]
+    if not event_ids:
+        return set()
+    return set(EventRSVP.objects.filter(user=user, event_id__in=event_ids).values_list('event_id', flat=True))
+
+
+def attendees(event):
+    return [rsvp.user for rsvp in event.rsvps.select_related('user').order_by('created_at')]
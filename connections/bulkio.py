@@ -0,0 +1,149 @@
+# connections/bulkio.py
+
+import csv
+import json
+import sys
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.base import CommandError
+
+from .directory import DIRECTORY_FLAGS
+from .models import AirportData, Club
+
+FORMATS = ('ndjson', 'csv')
+DEFAULT_CHUNK_SIZE = 1000
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'x', '✅'}
+
+# Every capability flag on PilotProfile, in the order they are exported
+PROFILE_FLAGS = [
+    'private_pilot',
+    'instrument_rating',
+    'commercial_pilot_single_engine',
+    'flight_instructor_cfi',
+    'flight_instructor_cfii',
+    'commercial_pilot_multi_engine',
+    'flight_instructor_multi_engine_mei',
+] + [
+    flag
+    for directions in DIRECTORY_FLAGS.values()
+    for columns in directions.values()
+    for _, flag in columns
+]
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'csv' if str(path).lower().endswith('.csv') else 'ndjson'
+
+
+@contextmanager
+def open_stream(path, mode):
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+    else:
+        with open(path, mode, encoding='utf-8', newline='') as stream:
+            yield stream
+
+
+def read_records(stream, fmt):
+    """Yield one dict per input row without reading the whole file."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def numbered_records(stream, fmt):
+    """Like read_records, as (line number, record) pairs for pointing at bad rows."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if line:
+                yield number, json.loads(line)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RecordWriter:
+    def __init__(self, stream, fmt, fields):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, fieldnames=fields)
+            self.writer.writeheader()
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            self.writer.writerow(record)
+        else:
+            self.stream.write(json.dumps(record, default=str, ensure_ascii=False))
+            self.stream.write('\n')
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def parse_text(value):
+    """value stripped, '' when missing. Numbers and other JSON values aren't text and raise ValueError."""
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f'expected text, got {value!r}')
+    return value.strip()
+
+
+def parse_int(value, default=0):
+    if value in (None, ''):
+        return default
+    return int(value)
+
+
+def add_club_argument(parser):
+    parser.add_argument('--club', required=True, help='Slug of the club whose rows are imported or exported')
+
+
+def club_by_slug(slug):
+    try:
+        return Club.objects.get(slug=slug)
+    except Club.DoesNotExist:
+        raise CommandError(f'No club {slug!r}.')
+
+
+def airport_map():
+    """ICAO code -> AirportData id for every airport, used to resolve imports without per-row lookups."""
+    return {icao.upper(): pk for icao, pk in AirportData.objects.exclude(icao='').values_list('icao', 'id')}
+
+
+class Throughput:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+
+    def add(self, rows):
+        self.rows += rows
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        return f'{self.rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s)'
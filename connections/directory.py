@@ -0,0 +1,194 @@
+# connections/directory.py
+
+import math
+import operator
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+
+from django.contrib.auth.models import User
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+from django.utils import timezone
+
+from . import tenancy
+from .models import PilotProfile
+
+
+# role -> direction -> ((column label, PilotProfile flag), ...)
+# The 'pilot' role has no capability flags and lists every user instead of profiles.
+DIRECTORY_FLAGS = {
+    'safety': {
+        'need': (
+            ('VFR Single Engine', 'safety_pilot_need_vfr_single_engine'),
+            ('IFR Single Engine', 'safety_pilot_need_ifr_single_engine'),
+            ('IFR Multi Engine', 'safety_pilot_need_ifr_multi_engine'),
+        ),
+        'offer': (
+            ('VFR Single Engine', 'safety_pilot_offer_vfr_single_engine'),
+            ('IFR Single Engine', 'safety_pilot_offer_ifr_single_engine'),
+            ('IFR Multi Engine', 'safety_pilot_offer_ifr_multi_engine'),
+        ),
+    },
+    'instructor': {
+        'need': (
+            ('CFI', 'instructor_need_cfi'),
+            ('Instrument CFII', 'instructor_need_instrument_cfii'),
+            ('Commercial SEI', 'instructor_need_commercial_single_engine'),
+            ('Commercial MEI', 'instructor_need_commercial_multi_engine_mei'),
+        ),
+        'offer': (
+            ('CFI', 'instructor_offer_cfi'),
+            ('Instrument CFII', 'instructor_offer_instrument_cfii'),
+            ('Commercial SEI', 'instructor_offer_commercial_single_engine'),
+            ('Commercial MEI', 'instructor_offer_commercial_multi_engine_mei'),
+        ),
+    },
+    'rental': {
+        'need': (
+            ('Single Engine', 'rent_need_single_engine'),
+            ('Multi Engine', 'rent_need_multi_engine'),
+        ),
+        'offer': (
+            ('Single Engine', 'rent_offer_single_engine'),
+            ('Multi Engine', 'rent_offer_multi_engine'),
+        ),
+    },
+    'pilot': {
+        'any': (),
+    },
+}
+
+SCOPES = ('all', 'state', 'airport', 'radius')
+
+DEFAULT_RADIUS_NM = 50
+MAX_RADIUS_NM = 500
+NM_PER_DEGREE = 60.0
+
+# Query parameter -> (label, FlightTimeRollup field). Each field is indexed, so a
+# threshold is a range lookup on the rollup table rather than a sum over logbooks.
+RECENCY_FILTERS = {
+    'flown_within': ('Flown in the last N days', 'last_flight_date'),
+    'min_hours_90': ('Hours in the last 90 days', 'hours_90'),
+    'min_multi': ('Multi-engine hours', 'multi_engine_hours'),
+    'min_ifr': ('IFR hours', 'ifr_hours'),
+}
+MAX_FLOWN_WITHIN_DAYS = 3650
+MAX_HOURS = 100000
+
+# Only the columns the directory templates actually render are loaded.
+AIRPORT_FIELDS = ('icao', 'airport', 'state')
+USER_FIELDS = ('username', 'last_login', 'date_joined')
+
+
+def get_columns(role, direction):
+    try:
+        return DIRECTORY_FLAGS[role][direction]
+    except KeyError:
+        raise ValueError(f"Unknown directory '{role}/{direction}'")
+
+
+def apply_scope(queryset, scope, prefix, home_airport, radius_nm):
+    if scope == 'all':
+        return queryset
+    if home_airport is None:
+        raise ValueError(f"Scope '{scope}' needs a home airport")
+    if scope == 'state':
+        return queryset.filter(**{f'{prefix}home_airport__state': home_airport.state})
+    if scope == 'airport':
+        return queryset.filter(**{f'{prefix}home_airport': home_airport})
+    return within_radius(queryset, f'{prefix}home_airport', home_airport, radius_nm)
+
+
+def within_radius(queryset, field, airport, radius_nm):
+    """Rows whose `field` airport lies within radius_nm of airport."""
+    # A latitude/longitude bounding box the database can range scan,
+    # refined by the flat-earth distance which is accurate enough at these ranges.
+    lat_delta = radius_nm / NM_PER_DEGREE
+    lon_scale = max(math.cos(math.radians(airport.latitude)), 0.01)
+    lon_delta = lat_delta / lon_scale
+    dlat = F(f'{field}__latitude') - airport.latitude
+    dlon = (F(f'{field}__longitude') - airport.longitude) * lon_scale
+    return queryset.alias(
+        distance_sq=ExpressionWrapper(dlat * dlat + dlon * dlon, output_field=FloatField()),
+    ).filter(**{
+        f'{field}__latitude__range': (airport.latitude - lat_delta, airport.latitude + lat_delta),
+        f'{field}__longitude__range': (airport.longitude - lon_delta, airport.longitude + lon_delta),
+        'distance_sq__lte': lat_delta * lat_delta,
+    })
+
+
+def parse_recency(params):
+    """The RECENCY_FILTERS set in params as {name: number}. Raises ValueError for bad values."""
+    recency = {}
+    for name in RECENCY_FILTERS:
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        maximum = MAX_FLOWN_WITHIN_DAYS if name == 'flown_within' else MAX_HOURS
+        try:
+            number = int(value) if name == 'flown_within' else Decimal(value)
+            in_range = 0 <= number <= maximum
+        except (ValueError, ArithmeticError):
+            # ArithmeticError covers Decimal's NaN, which can't even be compared
+            raise ValueError(f"'{name}' must be a number")
+        if not in_range:
+            raise ValueError(f"'{name}' must be between 0 and {maximum}")
+        recency[name] = number
+    return recency
+
+
+def apply_recency(queryset, prefix, recency):
+    """Keep the pilots whose logbook rollup meets every threshold in recency."""
+    lookups = {}
+    for name, value in recency.items():
+        field = RECENCY_FILTERS[name][1]
+        if name == 'flown_within':
+            # Within the last 1 day means today
+            lookups[f'{prefix}flight_time__{field}__gte'] = timezone.localdate() - timedelta(days=max(value - 1, 0))
+        else:
+            lookups[f'{prefix}flight_time__{field}__gte'] = value
+    return queryset.filter(**lookups)
+
+
+def directory_queryset(role, direction, scope, home_airport=None, radius_nm=DEFAULT_RADIUS_NM, exclude_user=None, recency=None):
+    """
+    Compile a directory request into a single ordered queryset.
+
+    Profiles are returned for the capability roles and users for the 'pilot' role.
+    Related user and airport rows are joined in and only the rendered columns are
+    selected, so a page of results costs one query regardless of its size. recency
+    thresholds (see parse_recency) join the pilots' flight time rollups by key.
+    """
+    columns = get_columns(role, direction)
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown directory scope '{scope}'")
+
+    if role == 'pilot':
+        prefix = 'pilotprofile__'
+        user_prefix = ''
+        queryset = User.objects.select_related('pilotprofile__home_airport').only(
+            *USER_FIELDS,
+            *(f'pilotprofile__home_airport__{field}' for field in AIRPORT_FIELDS),
+        ).order_by('username')
+        # Users are shared, their profiles say which club they are in
+        queryset = tenancy.scope(queryset, 'pilotprofile__')
+        if exclude_user is not None:
+            queryset = queryset.exclude(pk=exclude_user.pk)
+    else:
+        prefix = ''
+        user_prefix = 'user__'
+        queryset = PilotProfile.objects.select_related('user', 'home_airport').only(
+            'user__username',
+            *(f'home_airport__{field}' for field in AIRPORT_FIELDS),
+            *(flag for _, flag in columns),
+        ).order_by('user__username')
+        if exclude_user is not None:
+            queryset = queryset.exclude(user=exclude_user)
+
+    if columns:
+        queryset = queryset.filter(reduce(operator.or_, (Q(**{flag: True}) for _, flag in columns)))
+
+    if recency:
+        queryset = apply_recency(queryset, user_prefix, recency)
+
+    return apply_scope(queryset, scope, prefix, home_airport, radius_nm)
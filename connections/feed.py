@@ -0,0 +1,256 @@
+# connections/feed.py
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+from django.utils import timezone
+
+from . import tenancy
+from .aggregates import is_suspended
+from .directory import DIRECTORY_FLAGS, directory_queryset, within_radius
+from .models import AirportData, HomeFeed, Message, PilotEvent, PilotProfile
+
+logger = logging.getLogger(__name__)
+
+# Roles matched against the user's own profile: someone who needs a safety pilot
+# sees nearby pilots offering, someone offering sees nearby pilots who need one
+MATCHED_ROLES = ('safety', 'instructor')
+OPPOSITE = {'need': 'offer', 'offer': 'need'}
+
+SECTION_LIMIT = 5
+BUILD_BATCH = 200
+
+# The profile fields feeds show or match on. Saves that change none of them, like
+# recording activity, are not fanned out.
+PROFILE_FIELDS = frozenset(['home_airport', 'club', *(
+    flag for directions in DIRECTORY_FLAGS.values() for columns in directions.values() for _, flag in columns
+)])
+
+
+def profile_values(profile):
+    return {name: getattr(profile, PilotProfile._meta.get_field(name).attname) for name in PROFILE_FIELDS}
+
+
+def _wants(profile, role):
+    """The directory directions this profile should be shown for role, e.g. ['offer'] if it needs one."""
+    return [
+        OPPOSITE[direction] for direction, columns in DIRECTORY_FLAGS[role].items()
+        if any(getattr(profile, flag) for _, flag in columns)
+    ]
+
+
+class _Builder:
+    """Builds sections for a batch of users, sharing the nearby lookups of users at the same airport."""
+
+    def __init__(self):
+        self.today = timezone.localdate()
+        self.matches = {}
+        self.events = {}
+
+    def nearby_matches(self, airport, role, direction):
+        key = (airport.pk, role, direction)
+        if key not in self.matches:
+            columns = DIRECTORY_FLAGS[role][direction]
+            # One extra so the list is still full after leaving out the user themselves
+            profiles = directory_queryset(role, direction, 'radius', airport, settings.FEED_RADIUS_NM).order_by('-user__date_joined')
+            self.matches[key] = [
+                (profile.user_id, {
+                    'title': profile.user.username,
+                    'detail': ', '.join(label for label, flag in columns if getattr(profile, flag)),
+                    'where': profile.home_airport.icao if profile.home_airport else '',
+                    'url': reverse('view_pilot_profile', args=[profile.user_id]),
+                })
+                for profile in profiles[:SECTION_LIMIT + 1]
+            ]
+        return self.matches[key]
+
+    def nearby_events(self, airport):
+        if airport.pk not in self.events:
+            events = within_radius(
+                PilotEvent.objects.filter(event_finish_date__gte=self.today), 'host_airport', airport, settings.FEED_RADIUS_NM,
+            ).select_related('host_airport').only(
+                'event_name', 'event_start_date', 'event_finish_date', 'attendee_count', 'host_airport__icao',
+            ).order_by('event_start_date', 'pk')
+            self.events[airport.pk] = [
+                {
+                    'title': event.event_name,
+                    'detail': f'{event.attendee_count} going',
+                    'where': event.host_airport.icao,
+                    'when': event.event_start_date.isoformat(),
+                    'url': reverse('view_pilot_event', args=[event.event_name]),
+                }
+                for event in events[:SECTION_LIMIT]
+            ]
+        return self.events[airport.pk]
+
+    def unread_messages(self, seen):
+        """{user id: messages section} for a batch, seen being {user id: messages_seen_at or None}."""
+        through = Message.deleted_for_user.through
+        since = Q(recipient_id__in=[user_id for user_id, seen_at in seen.items() if seen_at is None])
+        for user_id, seen_at in seen.items():
+            if seen_at is not None:
+                since |= Q(recipient_id=user_id, timestamp__gt=seen_at)
+        unread = Message.objects.filter(since).filter(
+            ~Exists(through.objects.filter(message_id=OuterRef('pk'), user_id=OuterRef('recipient_id'))),
+        )
+
+        sections = {user_id: {'unread': 0, 'latest': []} for user_id in seen}
+        for user_id, count in unread.order_by().values_list('recipient_id').annotate(Count('pk')):
+            sections[user_id]['unread'] = count
+        # The newest few per recipient, for the whole batch in one query
+        latest = unread.annotate(
+            row=Window(RowNumber(), partition_by=F('recipient_id'), order_by=F('timestamp').desc()),
+        ).filter(row__lte=SECTION_LIMIT).select_related('sender').only(
+            'recipient_id', 'subject', 'timestamp', 'sender__username',
+        ).order_by('recipient_id', 'row')
+        for message in latest:
+            sections[message.recipient_id]['latest'].append({
+                'title': message.subject,
+                'detail': f'From {message.sender.username}',
+                'when': message.timestamp.isoformat(),
+                'url': reverse('view_messages'),
+            })
+        return sections
+
+    def build_sections(self, user, messages):
+        profile = getattr(user, 'pilotprofile', None)
+        airport = profile.home_airport if profile else None
+        sections = {'messages': messages}
+        if airport is not None:
+            for role in MATCHED_ROLES:
+                entries = []
+                for direction in _wants(profile, role):
+                    entries.extend(entry for user_id, entry in self.nearby_matches(airport, role, direction) if user_id != user.pk)
+                sections[role] = entries[:SECTION_LIMIT]
+            sections['events'] = self.nearby_events(airport)
+        return sections
+
+
+def _club_of(user):
+    profile = getattr(user, 'pilotprofile', None)
+    return profile.club_id if profile else tenancy.current_club_id()
+
+
+def build_feeds(user_ids):
+    """Recompute and store the feeds of user_ids. Returns {user id: HomeFeed}."""
+    builders = {}
+    feeds = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BUILD_BATCH):
+        batch = user_ids[start:start + BUILD_BATCH]
+        users = list(User.objects.filter(pk__in=batch).select_related('pilotprofile__home_airport'))
+        seen = dict.fromkeys((user.pk for user in users), None)
+        seen.update(HomeFeed.objects.filter(user_id__in=batch).values_list('user_id', 'messages_seen_at'))
+        clubs = {}
+        for user in users:
+            clubs.setdefault(_club_of(user), []).append(user)
+        now = timezone.now()
+        rows = []
+        # Each feed only shows its user's club, whichever club (if any) is building it
+        for club_id, members in clubs.items():
+            with tenancy.using(club_id):
+                builder = builders.setdefault(club_id, _Builder())
+                messages = builder.unread_messages({user.pk: seen[user.pk] for user in members})
+                rows.extend(
+                    HomeFeed(user=user, sections=builder.build_sections(user, messages[user.pk]), built_at=now, messages_seen_at=seen[user.pk])
+                    for user in members
+                )
+        # One upsert per batch; messages_seen_at is left alone in case the inbox was opened meanwhile
+        HomeFeed.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user'], update_fields=['sections', 'built_at'])
+        feeds.update((row.user_id, row) for row in rows)
+    return feeds
+
+
+def nearby_users(airport_ids):
+    """Ids of the users whose home airport is within the feed radius of any of airport_ids."""
+    user_ids = set()
+    for airport in AirportData.objects.filter(pk__in=airport_ids).only('latitude', 'longitude'):
+        user_ids.update(within_radius(PilotProfile.objects.all(), 'home_airport', airport, settings.FEED_RADIUS_NM).values_list('user_id', flat=True))
+    return user_ids
+
+
+def rebuild(user_ids=(), airport_ids=()):
+    user_ids = set(user_ids) | nearby_users(airport_ids)
+    return build_feeds(sorted(user_ids))
+
+
+class FeedWorker:
+    """One daemon thread that fans changes out to the affected feeds, batching whatever queued up meanwhile."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.user_ids = set()
+        self.airport_ids = set()
+        self.thread = None
+
+    def schedule(self, user_ids=(), airport_ids=()):
+        with self.lock:
+            self.user_ids |= set(user_ids)
+            self.airport_ids |= set(airport_ids)
+            if (self.user_ids or self.airport_ids) and self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='feed-rebuild', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    if not (self.user_ids or self.airport_ids):
+                        self.thread = None
+                        return
+                    user_ids, airport_ids = self.user_ids, self.airport_ids
+                    self.user_ids, self.airport_ids = set(), set()
+                try:
+                    rebuild(user_ids, airport_ids)
+                except Exception:
+                    # Feeds past FEED_MAX_AGE are rebuilt on demand, a failed pass only delays them
+                    logger.exception('Feed rebuild failed for %d users and %d airports', len(user_ids), len(airport_ids))
+        finally:
+            # This thread's connection isn't closed by the request cycle
+            connection.close()
+
+    def join(self, timeout=None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+worker = FeedWorker()
+
+
+def _dispatch(user_ids, airport_ids):
+    if settings.FEED_ASYNC:
+        worker.schedule(user_ids, airport_ids)
+    else:
+        rebuild(user_ids, airport_ids)
+
+
+def schedule(user_ids=(), airport_ids=()):
+    """Rebuild the feeds of user_ids and of everyone near airport_ids once the current transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    airport_ids = {airport_id for airport_id in airport_ids if airport_id}
+    if (user_ids or airport_ids) and not is_suspended():
+        transaction.on_commit(lambda: _dispatch(user_ids, airport_ids))
+
+
+def feed_for(user):
+    """The user's feed sections from one primary key read, computed on the spot if missing or too old."""
+    feed = HomeFeed.objects.filter(user=user).first()
+    if feed is None or feed.built_at is None or feed.built_at < timezone.now() - timedelta(seconds=settings.FEED_MAX_AGE):
+        feed = build_feeds([user.pk])[user.pk]
+    return feed.sections
+
+
+def mark_messages_read(user):
+    """Record that the user has seen their inbox, so the feed stops listing those messages."""
+    now = timezone.now()
+    if not HomeFeed.objects.filter(user=user).update(messages_seen_at=now):
+        HomeFeed.objects.get_or_create(user=user, defaults={'messages_seen_at': now})
+    schedule(user_ids=[user.pk])
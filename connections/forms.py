@@ -1,6 +1,8 @@
 # connections/forms.py
 from django import forms
-from .models import PilotProfile, AirportData, Message, PilotEvent
+from .models import PilotProfile, AirportData, Message, PilotEvent, Aircraft, RentalSlot
+from .directory import DEFAULT_RADIUS_NM, MAX_RADIUS_NM
+from .rentals import add_slot, overlapping_slots
 from django.contrib.auth.models import User
 from django.forms import DateInput
 
@@ -8,7 +10,8 @@ from django.forms import DateInput
 class PilotProfileForm(forms.ModelForm):
     class Meta:
         model = PilotProfile
-        exclude = ('user',)
+        # The club is set from the request's host when the profile is created, never by members
+        exclude = ('user', 'club')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -58,4 +61,71 @@ class PilotEventForm(forms.ModelForm):
         # Order the airport choices alphabetically
         self.fields['host_airport'].queryset = AirportData.objects.order_by('icao')
         self.fields['second_airport'].queryset = AirportData.objects.order_by('icao')
-        self.fields['third_airport'].queryset = AirportData.objects.order_by('icao')
\ No newline at end of file
+        self.fields['third_airport'].queryset = AirportData.objects.order_by('icao')
+
+
+class AircraftForm(forms.ModelForm):
+    class Meta:
+        model = Aircraft
+        fields = ['tail_number', 'make_model', 'engine_class', 'home_airport', 'hourly_rate']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['home_airport'].queryset = AirportData.objects.order_by('icao')
+
+
+class RentalSlotForm(forms.ModelForm):
+    class Meta:
+        model = RentalSlot
+        fields = ['aircraft', 'start', 'end']
+
+        widgets = {
+            'start': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+            'end': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        }
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if owner is not None:
+            self.fields['aircraft'].queryset = Aircraft.objects.filter(owner=owner).order_by('tail_number')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        aircraft = cleaned_data.get('aircraft')
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end:
+            if end <= start:
+                raise forms.ValidationError('The slot must end after it starts.')
+            if aircraft and overlapping_slots(aircraft, start, end).exclude(pk=self.instance.pk).exists():
+                raise forms.ValidationError('This aircraft already has a slot during that time.')
+        return cleaned_data
+
+    def save(self, commit=True):
+        # Checked again under a lock as the slot is saved, clean() only catches the common case
+        return add_slot(self.instance) if commit else super().save(commit=False)
+
+
+class RentalSearchForm(forms.Form):
+    airport = forms.CharField(max_length=4, required=False, help_text='ICAO code, leave blank to search everywhere')
+    engine_class = forms.ChoiceField(choices=[('', 'Any')] + Aircraft.ENGINE_CLASS_CHOICES, required=False)
+    start = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}))
+    end = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}))
+    radius = forms.IntegerField(min_value=1, max_value=MAX_RADIUS_NM, initial=DEFAULT_RADIUS_NM, required=False)
+
+    def clean_airport(self):
+        icao = self.cleaned_data['airport'].strip().upper()
+        if not icao:
+            return None
+        airport = AirportData.objects.filter(icao=icao).first()
+        if airport is None:
+            raise forms.ValidationError(f'Unknown airport {icao}.')
+        return airport
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end and end <= start:
+            raise forms.ValidationError('The end must be after the start.')
+        return cleaned_data
@@ -0,0 +1,185 @@
+# connections/ical.py
+"""
+iCalendar subscription feeds of upcoming events: every event, the events in a
+state, and the events one user hosts.
+
+Calendar clients poll feeds every few minutes. The ETag and Last-Modified come from
+the TableVersion rows of the tables a feed reads, so a poll with nothing new is a 304
+after reading only those rows. A changed feed is streamed to the first client as it
+is written and cached under the same versions for every client after it.
+"""
+
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_safe
+
+from . import tenancy
+from .models import AirportData, PilotEvent, TableVersion
+
+CONTENT_TYPE = 'text/calendar; charset=utf-8'
+
+# Events, plus the airport codes and host names shown in them
+FEED_TABLES = ('pilotevent', 'airportdata', 'user')
+
+FEED_NAMES = {
+    'all': 'PilotConnect events',
+    'state': 'PilotConnect events in {value}',
+    'host': 'PilotConnect events hosted by {value}',
+}
+
+# Hint for how often clients should poll, they are answered with a 304 when nothing changed
+REFRESH_INTERVAL = 'PT15M'
+LINE_OCTETS = 75
+CHUNK_SIZE = 500
+BUFFER_BYTES = 16384
+
+EVENT_FIELDS = (
+    'pk', 'event_name', 'event_start_date', 'event_finish_date', 'event_description',
+    'host_airport__icao', 'host_airport__airport', 'host_name__username',
+)
+
+
+def escape(text):
+    """Escape a TEXT value as RFC 5545 requires."""
+    text = str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+    return text.replace('\r\n', '\\n').replace('\r', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    """line as CRLF-terminated bytes, folded so no line is longer than 75 octets."""
+    data = line.encode()
+    parts = []
+    limit = LINE_OCTETS
+    while len(data) > limit:
+        cut = limit
+        # Never split a multi-byte UTF-8 character
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        # Continuation lines start with a space
+        limit = LINE_OCTETS - 1
+    parts.append(data)
+    return b'\r\n '.join(parts) + b'\r\n'
+
+
+def _date(value):
+    return value.strftime('%Y%m%d')
+
+
+def write_calendar(name, rows, stamp, base_url):
+    """
+    Yield a VCALENDAR of the event rows (EVENT_FIELDS tuples) in chunks of about BUFFER_BYTES.
+
+    stamp is the DTSTAMP of every event, so the same rows always give the same bytes.
+    """
+    stamp = stamp.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    buffer = [fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//PilotConnect//Events//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(name)}',
+        f'REFRESH-INTERVAL;VALUE=DURATION:{REFRESH_INTERVAL}',
+        f'X-PUBLISHED-TTL:{REFRESH_INTERVAL}',
+    )]
+    size = sum(map(len, buffer))
+    for pk, event_name, start, finish, description, icao, airport, host in rows:
+        details = f'{description}\n\nHosted by {host}' if description else f'Hosted by {host}'
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:pilotevent-{pk}@pilotconnect',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;VALUE=DATE:{_date(start)}',
+            # All-day events end on the day after they finish
+            f'DTEND;VALUE=DATE:{_date(finish + timedelta(days=1))}',
+            f'SUMMARY:{escape(event_name)}',
+            f'DESCRIPTION:{escape(details)}',
+            f'URL:{base_url}{reverse("view_pilot_event", args=[event_name])}',
+        ]
+        if icao:
+            lines.append(f'LOCATION:{escape(icao)} - {escape(airport)}')
+        lines.append('END:VEVENT')
+        for line in lines:
+            chunk = fold(line)
+            buffer.append(chunk)
+            size += len(chunk)
+        if size >= BUFFER_BYTES:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    buffer.append(fold('END:VCALENDAR'))
+    yield b''.join(buffer)
+
+
+def feed_events(kind, value='', host_id=None):
+    """The upcoming events of a feed, in the order they are written."""
+    events = PilotEvent.objects.filter(event_finish_date__gte=timezone.localdate())
+    if kind == 'state':
+        # Matching airport ids rather than joining airports lets each OR branch use its foreign key index
+        state_airports = AirportData.objects.filter(state=value).values('pk')
+        events = events.filter(
+            Q(host_airport__in=state_airports) | Q(second_airport__in=state_airports) | Q(third_airport__in=state_airports)
+        )
+    elif kind == 'host':
+        events = events.filter(host_name_id=host_id)
+    return events.order_by('event_start_date', 'pk')
+
+
+def _versions(request):
+    # etag and last_modified both need these, read them once per request
+    if not hasattr(request, '_table_versions'):
+        request._table_versions = TableVersion.current(FEED_TABLES)
+    return request._table_versions
+
+
+def _feed_key(request, kind='all', value=''):
+    versions = _versions(request)
+    # Events drop out of the feed as days pass, and their links carry the site's address
+    key = ['ical', kind, value, request.scheme, request.get_host(), timezone.localdate().isoformat(), f'club:{tenancy.current_club_id()}']
+    key += [f"{table}:{versions[table].version if table in versions else 0}" for table in FEED_TABLES]
+    return hashlib.sha1('|'.join(key).encode()).hexdigest()
+
+
+def _etag(request, kind='all', value=''):
+    return f'"{_feed_key(request, kind, value)}"'
+
+
+def _last_modified(request, kind='all', value=''):
+    return max((row.updated_at for row in _versions(request).values()), default=None)
+
+
+def _cache_when_done(chunks, key):
+    """Pass the chunks through, caching the whole body once the last one is written."""
+    written = []
+    for chunk in chunks:
+        written.append(chunk)
+        yield chunk
+    cache.set(key, b''.join(written), timeout=settings.ICAL_CACHE_TTL)
+
+
+@require_safe
+@condition(etag_func=_etag, last_modified_func=_last_modified)
+def event_calendar(request, kind='all', value=''):
+    key = tenancy.cache_key(f'ical:{_feed_key(request, kind, value)}')
+    body = cache.get(key)
+    if body is not None:
+        return HttpResponse(body, content_type=CONTENT_TYPE)
+
+    host_id = None
+    if kind == 'host':
+        host_id = tenancy.scope(User.objects, 'pilotprofile__').filter(username=value).values_list('pk', flat=True).first()
+        if host_id is None:
+            raise Http404('Unknown host')
+    rows = feed_events(kind, value, host_id).values_list(*EVENT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    stamp = _last_modified(request) or timezone.now()
+    chunks = write_calendar(FEED_NAMES[kind].format(value=value), rows, stamp, f'{request.scheme}://{request.get_host()}')
+    return StreamingHttpResponse(_cache_when_done(chunks, key), content_type=CONTENT_TYPE)
@@ -0,0 +1,133 @@
+# connections/loadtest.py
+
+import random
+import time
+from statistics import median
+
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Timings:
+    def __init__(self, name):
+        self.name = name
+        self.durations = []
+        self.queries = []
+        self.statuses = set()
+
+    def record(self, duration, queries, status=None):
+        self.durations.append(duration)
+        self.queries.append(queries)
+        if status is not None:
+            self.statuses.add(status)
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'requests': len(self.durations),
+            'status': ','.join(str(status) for status in sorted(self.statuses)),
+            'p50_ms': percentile(self.durations, 50) * 1000,
+            'p95_ms': percentile(self.durations, 95) * 1000,
+            'p99_ms': percentile(self.durations, 99) * 1000,
+            'queries': median(self.queries) if self.queries else 0,
+        }
+
+
+def timed(func, *args, **kwargs):
+    """Call func, returning (result, seconds, number of queries run)."""
+    # The query log is capped, start each call from an empty one so the count stays exact
+    reset_queries()
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        duration = time.perf_counter() - started
+    return result, duration, len(captured.captured_queries)
+
+
+def format_table(summaries):
+    lines = [f"{'view':<45} {'status':>8} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}"]
+    for row in summaries:
+        lines.append(
+            f"{row['name']:<45} {row['status']:>8} {row['requests']:>5} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['queries']:>8g}"
+        )
+    return '\n'.join(lines)
+
+
+def named_patterns(resolver=None, namespace=None, exclude_namespaces=('admin',)):
+    """Yield (url name, URLPattern) for every named route, skipping excluded namespaces."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace in exclude_namespaces:
+                continue
+            child = pattern.namespace if pattern.namespace else namespace
+            yield from named_patterns(pattern, child, exclude_namespaces)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield (f'{namespace}:{pattern.name}' if namespace else pattern.name), pattern
+
+
+# Routes that change state on GET, or end the session a run depends on
+SKIPPED_URLS = {'logout', 'delete_pilot_event', 'book_rental_slot'}
+
+DIRECTORY_SAMPLES = [
+    {'role': 'safety', 'direction': 'need', 'scope': 'radius'},
+    {'role': 'instructor', 'direction': 'offer', 'scope': 'state'},
+    {'role': 'rental', 'direction': 'offer', 'scope': 'all'},
+    {'role': 'pilot', 'direction': 'any', 'scope': 'airport'},
+]
+
+
+class UrlSampler:
+    """Picks a user to browse as and realistic arguments for every named route."""
+
+    def __init__(self, username=None, seed=None):
+        from .models import AirportStats, Message, PilotEvent, PilotProfile, RentalSlot
+
+        self.rng = random.Random(seed)
+        if username:
+            self.user = User.objects.get(username=username)
+        else:
+            user_ids = list(PilotProfile.objects.filter(home_airport__isnull=False).values_list('user_id', flat=True)[:1000])
+            if not user_ids:
+                raise User.DoesNotExist('No pilot has a home airport, run seed_synthetic first.')
+            self.user = User.objects.get(pk=self.rng.choice(user_ids))
+
+        user_ids = list(User.objects.exclude(pk=self.user.pk).values_list('pk', flat=True)[:200])
+        self.samples = {
+            'user_id': user_ids,
+            'recipient_id': user_ids,
+            'message_id': list(Message.objects.filter(recipient=self.user).values_list('pk', flat=True)[:50]),
+            'event_id': list(PilotEvent.objects.filter(host_name=self.user).values_list('pk', flat=True)[:50]),
+            'event_name': list(PilotEvent.objects.values_list('event_name', flat=True).distinct()[:50]),
+            'slot_id': list(RentalSlot.objects.values_list('pk', flat=True)[:50]),
+            'airport_id': list(AirportStats.objects.filter(scope=0).values_list('airport_id', flat=True)[:50]),
+        }
+
+    def routes(self, only=None):
+        """Yield (url name, [url kwargs, ...]) for each route that can be exercised."""
+        for name, pattern in named_patterns():
+            if name in SKIPPED_URLS or (only and name not in only):
+                continue
+            yield name, self.kwargs_for(name, pattern)
+
+    def kwargs_for(self, name, pattern):
+        params = set(pattern.pattern.converters)
+        if not params:
+            return [{}]
+        if name in ('directory', 'api_directory'):
+            return DIRECTORY_SAMPLES
+        if any(not self.samples.get(param) for param in params):
+            return None
+        return [{param: self.rng.choice(self.samples[param]) for param in params} for _ in range(20)]
@@ -0,0 +1,144 @@
+# connections/logbook.py
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .aggregates import is_suspended
+from .models import Aircraft, FlightTimeRollup, LogbookEntry, TableVersion
+
+WINDOWS = (30, 90, 365)
+
+CLASS_FIELDS = {
+    Aircraft.SINGLE_ENGINE: 'single_engine_hours',
+    Aircraft.MULTI_ENGINE: 'multi_engine_hours',
+}
+CONDITIONS_FIELDS = {
+    LogbookEntry.VFR: 'vfr_hours',
+    LogbookEntry.IFR: 'ifr_hours',
+}
+HOUR_FIELDS = ['total_hours', *CLASS_FIELDS.values(), *CONDITIONS_FIELDS.values(), *(f'hours_{days}' for days in WINDOWS)]
+
+
+def _window_start(days, today):
+    # The last 30 days are today and the 29 before it
+    return today - timedelta(days=days - 1)
+
+
+def _windows_as_of(entries):
+    """pilot id -> windows_as_of of their rollup, for the pilots of entries that have one."""
+    return dict(FlightTimeRollup.objects.filter(
+        pilot_id__in={entry.pilot_id for entry in entries},
+    ).values_list('pilot_id', 'windows_as_of'))
+
+
+def _deltas(entries, windows_as_of):
+    """
+    pilot id -> {field: hours added, 'flights': n, 'last_flight_date': latest date}.
+
+    Only counts the entries of pilots in windows_as_of, into the windows as of that date
+    so they match what the rest of the row was counted against.
+    """
+    deltas = defaultdict(lambda: {**dict.fromkeys(HOUR_FIELDS, Decimal(0)), 'flights': 0, 'last_flight_date': None})
+    for entry in entries:
+        if entry.pilot_id not in windows_as_of:
+            continue
+        as_of = windows_as_of[entry.pilot_id]
+        delta = deltas[entry.pilot_id]
+        hours = Decimal(entry.duration)
+        delta['flights'] += 1
+        delta['total_hours'] += hours
+        delta[CLASS_FIELDS[entry.aircraft_class]] += hours
+        delta[CONDITIONS_FIELDS[entry.conditions]] += hours
+        for days in WINDOWS:
+            if entry.date >= _window_start(days, as_of):
+                delta[f'hours_{days}'] += hours
+        if delta['last_flight_date'] is None or entry.date > delta['last_flight_date']:
+            delta['last_flight_date'] = entry.date
+    return deltas
+
+
+def add_entries(entries):
+    """
+    Count newly saved entries into their pilots' rollups with one UPDATE per pilot.
+
+    A pilot without a rollup row yet gets one recomputed from their logbook, which
+    already includes the new entries.
+    """
+    if is_suspended():
+        return
+    now = timezone.now()
+    windows_as_of = _windows_as_of(entries)
+    missing = list({entry.pilot_id for entry in entries} - set(windows_as_of))
+    for pilot_id, delta in _deltas(entries, windows_as_of).items():
+        last_flight = Value(delta.pop('last_flight_date'))
+        updates = {field: F(field) + value for field, value in delta.items() if value}
+        updates['last_flight_date'] = Greatest(Coalesce('last_flight_date', last_flight), last_flight)
+        if not FlightTimeRollup.objects.filter(pilot_id=pilot_id).update(updated_at=now, **updates):
+            missing.append(pilot_id)
+    if missing:
+        recompute_pilots(missing, bump=False)
+    TableVersion.bump(FlightTimeRollup._meta.model_name)
+
+
+def remove_entries(entries):
+    """
+    Take deleted or replaced entries back out of their pilots' rollups.
+
+    Only ever updates existing rows, so it is safe while a pilot is being deleted.
+    last_flight_date may now be later than any remaining flight until the next recompute.
+    """
+    if is_suspended():
+        return
+    for pilot_id, delta in _deltas(entries, _windows_as_of(entries)).items():
+        delta.pop('last_flight_date')
+        FlightTimeRollup.objects.filter(pilot_id=pilot_id).update(
+            updated_at=timezone.now(), **{field: F(field) - value for field, value in delta.items() if value}
+        )
+    TableVersion.bump(FlightTimeRollup._meta.model_name)
+
+
+def _hours(condition=None):
+    return Coalesce(Sum('duration', filter=condition), Value(Decimal(0)), output_field=DecimalField())
+
+
+def _rollup_rows(pilot_ids, today):
+    """One grouped pass over the logbooks of pilot_ids (or everyone) through the pilot/date index."""
+    entries = LogbookEntry.objects.all()
+    if pilot_ids is not None:
+        entries = entries.filter(pilot_id__in=pilot_ids)
+    aggregates = {
+        'flights': Count('pk'),
+        'total_hours': _hours(),
+        'last_flight_date': Max('date'),
+        **{field: _hours(Q(aircraft_class=value)) for value, field in CLASS_FIELDS.items()},
+        **{field: _hours(Q(conditions=value)) for value, field in CONDITIONS_FIELDS.items()},
+        **{f'hours_{days}': _hours(Q(date__gte=_window_start(days, today))) for days in WINDOWS},
+    }
+    now = timezone.now()
+    return [
+        FlightTimeRollup(pilot_id=row.pop('pilot_id'), windows_as_of=today, updated_at=now, **row)
+        for row in entries.order_by().values('pilot_id').annotate(**aggregates)
+    ]
+
+
+def recompute_pilots(pilot_ids=None, bump=True):
+    """
+    Rebuild rollups from the logbooks, for pilot_ids or everyone. Returns the rows written.
+
+    Windows are counted back from today, so running this daily rolls them forward.
+    """
+    today = timezone.localdate()
+    with transaction.atomic():
+        rows = _rollup_rows(pilot_ids, today)
+        stale = FlightTimeRollup.objects.all() if pilot_ids is None else FlightTimeRollup.objects.filter(pilot_id__in=pilot_ids)
+        stale.delete()
+        FlightTimeRollup.objects.bulk_create(rows, batch_size=1000)
+    if bump:
+        TableVersion.bump(FlightTimeRollup._meta.model_name)
+    return len(rows)
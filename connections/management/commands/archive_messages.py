@@ -0,0 +1,142 @@
+# connections/management/commands/archive_messages.py
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from connections.bulkio import Throughput
+from connections.models import ArchivedMessage, Message
+
+FIELDS = ('id', 'sender_id', 'recipient_id', 'subject', 'content', 'timestamp', 'club_id')
+
+
+class Command(BaseCommand):
+    help = (
+        'Move messages older than the retention period, or deleted by both participants, '
+        'out of the Message table into ArchivedMessage or a gzipped NDJSON file, then compact the database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Archive messages older than this many days')
+        parser.add_argument('--to-file', metavar='PATH', help='Append to this .ndjson.gz file instead of the archive table')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages moved per transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches so other writers get the lock')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+        parser.add_argument('--no-compact', action='store_true', help='Skip VACUUM and ANALYZE afterwards')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        candidates = self.candidates(cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} messages would be archived.')
+            return
+
+        size_before = self.database_size()
+        throughput = Throughput()
+        reasons = Counter()
+        archive = open(options['to_file'], 'ab') if options['to_file'] else None
+        try:
+            last_pk = 0
+            while True:
+                # Walk the primary key so each batch resumes where the last stopped instead of rescanning
+                rows = list(candidates.filter(pk__gt=last_pk).order_by('pk').values_list(*FIELDS)[:options['batch_size']])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                reasons.update(self.move(rows, cutoff, archive))
+                throughput.add(len(rows))
+                if options['pause']:
+                    time.sleep(options['pause'])
+        finally:
+            if archive:
+                archive.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {throughput}.'))
+        for reason, count in sorted(reasons.items()):
+            self.stdout.write(f'    {reason}: {count}')
+
+        if options['no_compact'] or not throughput.rows:
+            return
+        if connection.in_atomic_block:
+            self.stderr.write('Skipping VACUUM and ANALYZE inside a transaction.')
+            return
+        self.compact()
+        size_after = self.database_size()
+        if size_before is not None and size_after is not None:
+            self.stdout.write(f'Reclaimed {size_before - size_after} bytes ({size_before} -> {size_after}).')
+
+    def candidates(self, cutoff):
+        through = Message.deleted_for_user.through
+
+        def deleted_by(participant):
+            return Exists(through.objects.filter(message_id=OuterRef('pk'), user_id=OuterRef(participant)))
+
+        return Message.objects.filter(Q(timestamp__lt=cutoff) | (deleted_by('sender_id') & deleted_by('recipient_id')))
+
+    @transaction.atomic
+    def move(self, rows, cutoff, archive):
+        """Copy one batch to the archive and delete it, in one short write transaction."""
+        reasons = Counter()
+        archived = []
+        for row in rows:
+            record = dict(zip(FIELDS, row))
+            record['reason'] = ArchivedMessage.AGE if record['timestamp'] < cutoff else ArchivedMessage.DELETED
+            reasons[record['reason']] += 1
+            archived.append(record)
+
+        if archive:
+            self.write_member(archive, archived)
+        else:
+            ArchivedMessage.objects.bulk_create(
+                (ArchivedMessage(**record) for record in archived), ignore_conflicts=True,
+            )
+        # Message has no delete signals, so this is two plain DELETEs: the deleted_for_user links, then the rows
+        Message.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        return reasons
+
+    def write_member(self, archive, records):
+        """
+        Append records as one complete gzip member and fsync it.
+
+        Runs before the batch's DELETE commits, so a crash can at worst leave messages
+        both archived and still in the table, never gone from both. Readers of the
+        file see the members as one stream.
+        """
+        with gzip.GzipFile(fileobj=archive, mode='wb') as member:
+            for record in records:
+                line = json.dumps({**record, 'timestamp': record['timestamp'].isoformat()}, ensure_ascii=False)
+                member.write(f'{line}\n'.encode())
+        archive.flush()
+        os.fsync(archive.fileno())
+
+    def compact(self):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('VACUUM')
+                cursor.execute('ANALYZE')
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'VACUUM ANALYZE {Message._meta.db_table}')
+            else:
+                self.stderr.write(f'No compaction step for {connection.vendor}.')
+                return
+        self.stdout.write(f'Compacted the database in {time.perf_counter() - started:.2f}s.')
+
+    def database_size(self):
+        if connection.vendor != 'sqlite':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA page_count')
+            page_count = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return page_count * cursor.fetchone()[0]
@@ -0,0 +1,38 @@
+# connections/management/commands/assign_club.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from connections.aggregates import recompute_all
+from connections.models import ArchivedMessage, Club, Message, PilotEvent, PilotProfile, TableVersion
+
+
+class Command(BaseCommand):
+    help = (
+        'Move every profile, event, message and archived message that belongs to no club into the given club, '
+        'e.g. the members from before clubs existed. Pass --domain to create the club.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug')
+        parser.add_argument('--domain', help='Create the club with this domain if it does not exist')
+        parser.add_argument('--name', help='Name of a created club, defaults to the slug')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        club = Club.objects.filter(slug=options['slug']).first()
+        if club is None:
+            if not options['domain']:
+                raise CommandError(f"No club {options['slug']!r}, pass --domain to create it.")
+            club = Club.objects.create(slug=options['slug'], name=options['name'] or options['slug'], domain=options['domain'])
+
+        moved = {
+            model._meta.verbose_name_plural: model.all_objects.filter(club__isnull=True).update(club=club)
+            for model in (PilotProfile, PilotEvent, Message, ArchivedMessage)
+        }
+        # update() skips the signals that keep versions and aggregates current
+        TableVersion.bump('pilotprofile')
+        TableVersion.bump('pilotevent')
+        recompute_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {', '.join(f'{count} {name}' for name, count in moved.items())} into {club}."
+        ))
@@ -0,0 +1,46 @@
+# connections/management/commands/audit_imports.py
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from connections.startup import HEAVY_MODULES, STARTUP_IMPORTS, group_by_package, parse_importtime, run_python
+
+
+class Command(BaseCommand):
+    help = 'Profile what importing the project costs with python -X importtime, summarized per package'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', action='append', default=[], help='Also import this module, e.g. a management command')
+        parser.add_argument('--top', type=int, default=15, help='How many packages and modules to list')
+        parser.add_argument('--depth', type=int, default=1, help='Package name parts to group by, 2 splits django.db from django.contrib')
+        parser.add_argument('--budget-ms', type=float, help='Fail if the imports take longer than this in total')
+        parser.add_argument('--fail-on-heavy', action='store_true', help=f"Fail if any of {', '.join(HEAVY_MODULES)} is imported")
+
+    def handle(self, *args, **options):
+        code = STARTUP_IMPORTS + ''.join(f'import_module({module!r})\n' for module in options['module'])
+        try:
+            result = run_python(['-X', 'importtime'], code)
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f'Importing the project failed:\n{e.stderr[-2000:]}')
+
+        modules = parse_importtime(result.stderr)
+        total_ms = sum(self_us for _, self_us, _, _ in modules) / 1000
+        packages = group_by_package(modules, options['depth'])
+
+        self.stdout.write(f'{len(modules)} modules imported in {total_ms:.1f} ms\n')
+        self.stdout.write(f"{'package':<40} {'self ms':>9} {'share':>7} {'modules':>8}")
+        for name, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])[:options['top']]:
+            self.stdout.write(f'{name:<40} {self_us / 1000:>9.1f} {self_us / 1000 / max(total_ms, 1e-9):>7.1%} {count:>8}')
+
+        self.stdout.write(f"\n{'slowest modules':<50} {'self ms':>9} {'cumulative ms':>14}")
+        for name, self_us, cumulative_us, _ in sorted(modules, key=lambda module: -module[1])[:options['top']]:
+            self.stdout.write(f'{name:<50} {self_us / 1000:>9.1f} {cumulative_us / 1000:>14.1f}')
+
+        heavy = sorted({name.split('.')[0] for name, _, _, _ in modules} & set(HEAVY_MODULES))
+        if heavy:
+            message = f"Heavy modules imported at startup: {', '.join(heavy)}"
+            if options['fail_on_heavy']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        if options['budget_ms'] is not None and total_ms > options['budget_ms']:
+            raise CommandError(f"Imports took {total_ms:.1f} ms, over the {options['budget_ms']:.1f} ms budget")
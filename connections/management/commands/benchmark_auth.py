@@ -0,0 +1,78 @@
+# connections/management/commands/benchmark_auth.py
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from connections.loadtest import percentile
+
+USERNAME = 'benchmark_auth_user'
+PASSWORD = 'benchmark-auth-password'
+
+
+class Command(BaseCommand):
+    help = 'Measure login and authenticated page view throughput under each session profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50)
+        parser.add_argument('--views', type=int, default=200)
+        parser.add_argument('--page', default='home', help='URL name of the authenticated page to request')
+        parser.add_argument('--profiles', nargs='*', default=list(settings.SESSION_PROFILES), choices=list(settings.SESSION_PROFILES))
+
+    # The test client's host matches no club, browse the whole installation
+    @override_settings(TENANT_FALLBACK=True)
+    def handle(self, *args, **options):
+        if User.objects.filter(username=USERNAME).exists():
+            raise CommandError(f'A {USERNAME} user already exists, remove it before benchmarking.')
+
+        User.objects.create_user(username=USERNAME, password=PASSWORD)
+        self.stdout.write(f'Password hasher: {settings.PASSWORD_HASHERS[0].rsplit(".", 1)[-1]}')
+        self.stdout.write(
+            f"{'profile':<16} {'logins/s':>9} {'login p50 ms':>13} {'views/s':>9} {'view p50 ms':>12} "
+            f"{'queries/view':>13} {'session q/view':>15}"
+        )
+        try:
+            for profile in options['profiles']:
+                with override_settings(SESSION_ENGINE=settings.SESSION_PROFILES[profile]):
+                    self.stdout.write(self.run_profile(profile, options))
+        finally:
+            User.objects.filter(username=USERNAME).delete()
+
+    def run_profile(self, profile, options):
+        login_url = reverse('login')
+        page_url = reverse(options['page'])
+
+        client = Client()
+        login_times = []
+        for _ in range(options['logins']):
+            client.cookies.clear()
+            started = time.perf_counter()
+            response = client.post(login_url, {'username': USERNAME, 'password': PASSWORD})
+            login_times.append(time.perf_counter() - started)
+            if response.status_code != 302:
+                raise CommandError(f'Login failed under {profile} with status {response.status_code}')
+
+        # The first view after logging in may warm the cache, measure the steady state after it
+        client.get(page_url)
+        view_times = []
+        queries = session_queries = 0
+        for _ in range(options['views']):
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                client.get(page_url)
+                view_times.append(time.perf_counter() - started)
+            queries += len(captured.captured_queries)
+            session_queries += sum('django_session' in query['sql'] for query in captured.captured_queries)
+
+        views = max(options['views'], 1)
+        return (
+            f'{profile:<16} {len(login_times) / max(sum(login_times), 1e-9):>9.0f} {percentile(login_times, 50) * 1000:>13.1f} '
+            f'{views / max(sum(view_times), 1e-9):>9.0f} {percentile(view_times, 50) * 1000:>12.1f} '
+            f'{queries / views:>13.1f} {session_queries / views:>15.1f}'
+        )
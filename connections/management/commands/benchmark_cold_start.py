@@ -0,0 +1,52 @@
+# connections/management/commands/benchmark_cold_start.py
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from connections.loadtest import percentile
+from connections.startup import measure_cold_start
+
+PHASES = ('setup', 'urls', 'first_request', 'total', 'process')
+
+
+class Command(BaseCommand):
+    help = (
+        'Start fresh worker processes and time each phase until the first response: '
+        'Django setup, URLconf import, first request, and the whole process including the interpreter'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument('--path', default='/', help='Path of the first request')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+        parser.add_argument('--budget-ms', type=float, help='Fail if the median whole-process time is over this')
+
+    def handle(self, *args, **options):
+        runs = []
+        statuses = set()
+        for _ in range(max(options['runs'], 1)):
+            try:
+                measured = measure_cold_start(options['path'])
+            except subprocess.CalledProcessError as e:
+                raise CommandError(f'The worker failed to start:\n{e.stderr[-2000:]}')
+            runs.append(measured['phases'])
+            statuses.add(measured['status'])
+
+        summary = {
+            phase: {
+                'p50_ms': percentile([run[phase] for run in runs], 50) * 1000,
+                'p95_ms': percentile([run[phase] for run in runs], 95) * 1000,
+            }
+            for phase in PHASES
+        }
+        if options['json']:
+            self.stdout.write(json.dumps({'runs': len(runs), 'status': sorted(statuses), 'phases': summary}, indent=2))
+        else:
+            self.stdout.write(f"{len(runs)} cold starts, first response status {', '.join(sorted(statuses))}")
+            self.stdout.write(f"{'phase':<15} {'p50 ms':>9} {'p95 ms':>9}")
+            for phase, timings in summary.items():
+                self.stdout.write(f"{phase:<15} {timings['p50_ms']:>9.1f} {timings['p95_ms']:>9.1f}")
+
+        if options['budget_ms'] is not None and summary['process']['p50_ms'] > options['budget_ms']:
+            raise CommandError(f"Median cold start {summary['process']['p50_ms']:.1f} ms is over the {options['budget_ms']:.1f} ms budget")
@@ -0,0 +1,71 @@
+# connections/management/commands/benchmark_ical.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from connections.loadtest import percentile, timed
+from connections.models import PilotEvent, TableVersion
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what serving the event calendar feed costs as the number of subscribed clients grows. '
+        'Each round records an event change, then every client polls twice: once after the change, '
+        'then again with nothing new. Serving cost per poll should not depend on the client count.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', nargs='+', type=int, default=[1, 10, 100, 1000])
+        parser.add_argument('--feed', default='calendar_events', choices=['calendar_events', 'calendar_state_events', 'calendar_host_events'])
+        parser.add_argument('--value', default='', help='State or host username for the state and host feeds')
+
+    # The test client's host matches no club, browse the whole installation
+    @override_settings(TENANT_FALLBACK=True)
+    def handle(self, *args, **options):
+        url = reverse(options['feed'], kwargs={'value': options['value']} if options['value'] else {})
+        client = Client()
+        self.stdout.write(f"{url}: {PilotEvent.objects.count()} events")
+        self.stdout.write(
+            f"{'clients':>8} {'poll':<8} {'200s':>6} {'304s':>6} {'renders':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'queries/poll':>13} {'total ms':>9}"
+        )
+        etag = client.get(url)['ETag']
+        for clients in options['clients']:
+            # Stands in for an event being edited, so every client's ETag is now stale
+            TableVersion.bump('pilotevent')
+            etags = [etag] * clients
+            for poll in ('changed', 'idle'):
+                etags, row = self.poll(client, url, etags)
+                self.stdout.write(f'{clients:>8} {poll:<8} {row}')
+            etag = etags[0]
+
+    def poll(self, client, url, etags):
+        durations = []
+        queries = statuses_200 = statuses_304 = renders = 0
+        new_etags = []
+        started = time.perf_counter()
+        for etag in etags:
+            response, duration, count = timed(self.fetch, client, url, etag)
+            durations.append(duration)
+            queries += count
+            if response.status_code == 304:
+                statuses_304 += 1
+            else:
+                statuses_200 += 1
+                renders += response.streaming
+            new_etags.append(response['ETag'])
+        total = time.perf_counter() - started
+        polls = max(len(etags), 1)
+        return new_etags, (
+            f'{statuses_200:>6} {statuses_304:>6} {renders:>8} {percentile(durations, 50) * 1000:>8.2f} '
+            f'{percentile(durations, 95) * 1000:>8.2f} {queries / polls:>13.2f} {total * 1000:>9.0f}'
+        )
+
+    def fetch(self, client, url, etag):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        # A freshly rendered feed is streamed, read it all so its queries are counted
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
@@ -0,0 +1,97 @@
+# connections/management/commands/explain_views.py
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from connections.loadtest import UrlSampler
+
+# SQLite reports a full table scan as "SCAN <table>" with no index named after it
+FULL_SCAN = re.compile(r'^SCAN (?P<table>\w+)(?! USING)(?: AS \w+)?$')
+
+# Tables small enough that a scan is never a problem. "qualify" is the derived table Django
+# wraps around a query filtered on a window function, scanning it reads only the inner rows.
+ALLOWED_SCANS = {'django_migrations', 'django_content_type', 'connections_tableversion', 'qualify'}
+
+# Views that read a whole table on purpose, like the airport list, airport dropdowns
+# and the heatmap, which returns every row of the small aggregate tables
+INTENTIONAL_SCANS = {
+    'api_activity': {'connections_airportstats', 'connections_statestats'},
+    'airport_list': {'connections_airportdata'},
+    'update_pilot_profile': {'connections_airportdata'},
+    'create_pilot_event': {'connections_airportdata'},
+    'edit_pilot_event': {'connections_airportdata'},
+    'add_aircraft': {'connections_airportdata'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN QUERY PLAN on the queries behind every view and flag full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to browse as, defaults to a random pilot with a home airport')
+        parser.add_argument('--only', nargs='*', help='Only these URL names')
+        parser.add_argument('--allow', nargs='*', default=[], help='Extra tables a full scan is acceptable on')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if any full scan is found')
+
+    # The test client's host matches no club, browse the whole installation
+    @override_settings(TENANT_FALLBACK=True)
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('explain_views reads SQLite query plans, run it against the SQLite database.')
+        try:
+            sampler = UrlSampler(options['user'], seed=0)
+        except User.DoesNotExist as e:
+            raise CommandError(str(e) or f"No user named {options['user']}")
+        client = Client()
+        client.force_login(sampler.user)
+        allowed = ALLOWED_SCANS | set(options['allow'])
+
+        flagged = []
+        for name, samples in sampler.routes(options['only']):
+            if samples is None:
+                self.stderr.write(f'Skipping {name}: no sample arguments available')
+                continue
+            queries = self.capture(client, reverse(name, kwargs=samples[0]))
+            view_allowed = allowed | INTENTIONAL_SCANS.get(name, set())
+            scans = []
+            for sql, params in queries:
+                plan = self.explain(sql, params)
+                if options['verbose_plans']:
+                    self.stdout.write(f'{name}: {sql}\n    ' + '\n    '.join(plan))
+                for detail in plan:
+                    match = FULL_SCAN.match(detail)
+                    if match and match.group('table') not in view_allowed:
+                        scans.append((match.group('table'), sql))
+
+            if scans:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(f'{name}: {len(queries)} queries, {len(scans)} full scans'))
+                for table, sql in scans:
+                    self.stdout.write(f'    SCAN {table}: {sql[:200]}')
+            else:
+                self.stdout.write(f'{name}: {len(queries)} queries, indexed')
+
+        if flagged and options['fail_on_scan']:
+            raise CommandError(f"Full scans in: {', '.join(flagged)}")
+
+    def capture(self, client, path):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            client.get(path)
+        return queries
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
@@ -0,0 +1,48 @@
+# connections/management/commands/export_events.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from connections.bulkio import DEFAULT_CHUNK_SIZE, FORMATS, RecordWriter, Throughput, add_club_argument, club_by_slug, detect_format, open_stream
+from connections.models import PilotEvent
+
+FIELDS = {
+    'event_name': 'event_name',
+    'event_start_date': 'event_start_date',
+    'event_finish_date': 'event_finish_date',
+    'host_airport': 'host_airport__icao',
+    'second_airport': 'second_airport__icao',
+    'third_airport': 'third_airport__icao',
+    'host': 'host_name__username',
+    'event_description': 'event_description',
+}
+
+
+class Command(BaseCommand):
+    help = 'Export pilot events to an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        add_club_argument(parser)
+        parser.add_argument('--upcoming', action='store_true', help='Only export events that have not finished')
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        club = club_by_slug(options['club'])
+        throughput = Throughput()
+        events = PilotEvent.all_objects.filter(club=club).order_by('pk')
+        if options['upcoming']:
+            events = events.filter(event_finish_date__gte=timezone.localdate())
+        rows = events.values_list(*FIELDS.values()).iterator(chunk_size=options['chunk_size'])
+
+        with open_stream(options['path'], 'w') as stream:
+            writer = RecordWriter(stream, fmt, list(FIELDS))
+            for row in rows:
+                writer.write(dict(zip(FIELDS, row)))
+                throughput.add(1)
+
+        if options['path'] != '-':
+            self.stdout.write(self.style.SUCCESS(f'Exported {throughput}.'))
+        else:
+            self.stderr.write(f'Exported {throughput}.')
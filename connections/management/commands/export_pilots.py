@@ -0,0 +1,43 @@
+# connections/management/commands/export_pilots.py
+from django.core.management.base import BaseCommand
+
+from connections.bulkio import DEFAULT_CHUNK_SIZE, FORMATS, PROFILE_FLAGS, RecordWriter, Throughput, add_club_argument, club_by_slug, detect_format, open_stream
+from connections.models import PilotProfile
+
+FIELDS = {
+    'username': 'user__username',
+    'email': 'user__email',
+    'first_name': 'user__first_name',
+    'last_name': 'user__last_name',
+    'home_airport': 'home_airport__icao',
+    'flight_hours': 'flight_hours',
+    **{flag: flag for flag in PROFILE_FLAGS},
+    'comments': 'comments',
+}
+
+
+class Command(BaseCommand):
+    help = 'Export users and pilot profiles to an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        add_club_argument(parser)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        club = club_by_slug(options['club'])
+        throughput = Throughput()
+        rows = PilotProfile.all_objects.filter(club=club).order_by('pk').values_list(*FIELDS.values()).iterator(chunk_size=options['chunk_size'])
+
+        with open_stream(options['path'], 'w') as stream:
+            writer = RecordWriter(stream, fmt, list(FIELDS))
+            for row in rows:
+                writer.write(dict(zip(FIELDS, row)))
+                throughput.add(1)
+
+        if options['path'] != '-':
+            self.stdout.write(self.style.SUCCESS(f'Exported {throughput}.'))
+        else:
+            self.stderr.write(f'Exported {throughput}.')
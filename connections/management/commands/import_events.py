@@ -0,0 +1,106 @@
+# connections/management/commands/import_events.py
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from connections.aggregates import recompute_all
+from connections.bulkio import (
+    DEFAULT_CHUNK_SIZE, FORMATS, Throughput, add_club_argument, airport_map, chunked, club_by_slug, detect_format,
+    numbered_records, open_stream, parse_text,
+)
+
+AIRPORT_FIELDS = ('host_airport', 'second_airport', 'third_airport')
+from connections.models import PilotEvent, TableVersion
+
+
+class Command(BaseCommand):
+    help = 'Create pilot events from an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        add_club_argument(parser)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        club = club_by_slug(options['club'])
+        airports = airport_map()
+        throughput = Throughput()
+        skipped = rejected = unknown_airports = 0
+
+        with open_stream(options['path'], 'r') as stream:
+            for records in chunked(numbered_records(stream, fmt), options['chunk_size']):
+                created, chunk_skipped, chunk_rejected, chunk_unknown = self.import_chunk(records, airports, club)
+                throughput.add(created)
+                skipped += chunk_skipped
+                rejected += chunk_rejected
+                unknown_airports += chunk_unknown
+
+        if throughput.rows:
+            TableVersion.bump('pilotevent')
+            recompute_all()
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {throughput}.'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} rows with a host who is unknown or not a member of {club}.'))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected {rejected} events that finish before they start, see above.'))
+        if unknown_airports:
+            self.stdout.write(self.style.WARNING(f'{unknown_airports} airports were unknown and left empty, see above.'))
+
+    @transaction.atomic
+    def import_chunk(self, records, airports, club):
+        host_names = []
+        for line, record in records:
+            try:
+                host_names.append(parse_text(record.get('host')))
+            except ValueError:
+                raise CommandError(f"Line {line}: invalid host {record.get('host')!r}")
+        # Events are hosted by members of the club they belong to
+        hosts = dict(User.objects.filter(username__in=host_names, pilotprofile__club=club).values_list('username', 'id'))
+
+        events = []
+        skipped = rejected = unknown_airports = 0
+        for host_name, (line, record) in zip(host_names, records):
+            host_id = hosts.get(host_name)
+            if host_id is None:
+                skipped += 1
+                continue
+            name = record.get('event_name') or ''
+            try:
+                start_date = date.fromisoformat(record['event_start_date'])
+                finish_date = date.fromisoformat(record.get('event_finish_date') or record['event_start_date'])
+            except (KeyError, TypeError, ValueError) as e:
+                raise CommandError(f"Line {line}: invalid dates for event {name!r}: {e}")
+            # The event_finish_after_start constraint would fail the whole chunk
+            if finish_date < start_date:
+                self.stderr.write(f"Line {line}: event {name!r} finishes on {finish_date}, before it starts on {start_date}.")
+                rejected += 1
+                continue
+
+            airport_ids = {}
+            for field in AIRPORT_FIELDS:
+                try:
+                    icao = parse_text(record.get(field)).upper()
+                except ValueError:
+                    raise CommandError(f"Line {line}: invalid {field} for event {name!r}: {record.get(field)!r}")
+                airport_ids[f'{field}_id'] = airports.get(icao)
+                if icao and icao not in airports:
+                    self.stderr.write(f"Line {line}: unknown {field} {icao} for event {name!r}, imported without it.")
+                    unknown_airports += 1
+
+            events.append(PilotEvent(
+                club=club,
+                event_name=name,
+                event_start_date=start_date,
+                event_finish_date=finish_date,
+                host_name_id=host_id,
+                event_description=record.get('event_description') or '',
+                **airport_ids,
+            ))
+
+        PilotEvent.objects.bulk_create(events)
+        return len(events), skipped, rejected, unknown_airports
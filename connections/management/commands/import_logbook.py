@@ -0,0 +1,89 @@
+# connections/management/commands/import_logbook.py
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from connections import logbook
+from connections.bulkio import (
+    DEFAULT_CHUNK_SIZE, FORMATS, Throughput, airport_map, chunked, detect_format, open_stream, read_records,
+)
+from connections.models import Aircraft, LogbookEntry, TableVersion
+
+MAX_DURATION = Decimal('999.9')
+
+
+class Command(BaseCommand):
+    help = (
+        'Add logbook entries from an NDJSON or CSV file with the columns username, date, '
+        'aircraft_class, departure, arrival, duration, conditions and remarks. Flight time '
+        'rollups are updated chunk by chunk as the entries are written.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        airports = airport_map()
+        throughput = Throughput()
+        skipped = unknown_airports = 0
+
+        with open_stream(options['path'], 'r') as stream:
+            for records in chunked(read_records(stream, fmt), options['chunk_size']):
+                created, chunk_skipped, chunk_unknown = self.import_chunk(records, airports)
+                throughput.add(created)
+                skipped += chunk_skipped
+                unknown_airports += chunk_unknown
+
+        if throughput.rows:
+            TableVersion.bump('logbookentry')
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {throughput}.'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} rows with an unknown or missing username.'))
+        if unknown_airports:
+            self.stdout.write(self.style.WARNING(f'{unknown_airports} airports were unknown and left empty.'))
+
+    @transaction.atomic
+    def import_chunk(self, records, airports):
+        usernames = [(record.get('username') or '').strip() for record in records]
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+        entries = []
+        skipped = unknown_airports = 0
+        for username, record in zip(usernames, records):
+            if username not in user_ids:
+                skipped += 1
+                continue
+            entry = LogbookEntry(pilot_id=user_ids[username], remarks=record.get('remarks') or '')
+            try:
+                entry.date = date.fromisoformat((record.get('date') or '').strip())
+                entry.duration = Decimal(str(record.get('duration') or '').strip())
+                if not 0 < entry.duration <= MAX_DURATION:
+                    raise ValueError('duration out of range')
+            except (ValueError, InvalidOperation) as e:
+                raise CommandError(f"Invalid logbook entry for {username}: {e}")
+            entry.aircraft_class = (record.get('aircraft_class') or Aircraft.SINGLE_ENGINE).strip().lower()
+            if entry.aircraft_class not in logbook.CLASS_FIELDS:
+                raise CommandError(f"Invalid aircraft_class for {username}: {record.get('aircraft_class')!r}")
+            entry.conditions = (record.get('conditions') or LogbookEntry.VFR).strip().lower()
+            if entry.conditions not in logbook.CONDITIONS_FIELDS:
+                raise CommandError(f"Invalid conditions for {username}: {record.get('conditions')!r}")
+            for field in ('departure', 'arrival'):
+                icao = (record.get(field) or '').strip().upper()
+                setattr(entry, f'{field}_id', airports.get(icao))
+                if icao and icao not in airports:
+                    unknown_airports += 1
+            entries.append(entry)
+
+        if entries:
+            LogbookEntry.objects.bulk_create(entries)
+            # bulk_create skips the signals that keep the rollups current
+            logbook.add_entries(entries)
+
+        return len(entries), skipped, unknown_airports
@@ -0,0 +1,106 @@
+# connections/management/commands/import_pilots.py
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from connections.aggregates import recompute_all
+from connections.bulkio import (
+    DEFAULT_CHUNK_SIZE, FORMATS, PROFILE_FLAGS, Throughput, add_club_argument, airport_map, chunked,
+    club_by_slug, detect_format, numbered_records, open_stream, parse_bool, parse_int, parse_text,
+)
+from connections.models import PilotProfile, TableVersion
+
+
+class Command(BaseCommand):
+    help = 'Create users and pilot profiles from an NDJSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, ndjson otherwise')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        add_club_argument(parser)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        club = club_by_slug(options['club'])
+        airports = airport_map()
+        throughput = Throughput()
+        skipped = unknown_airports = 0
+
+        with open_stream(options['path'], 'r') as stream:
+            for records in chunked(numbered_records(stream, fmt), options['chunk_size']):
+                created, chunk_skipped, chunk_unknown = self.import_chunk(records, airports, club)
+                throughput.add(created)
+                skipped += chunk_skipped
+                unknown_airports += chunk_unknown
+
+        if throughput.rows:
+            TableVersion.bump('user')
+            TableVersion.bump('pilotprofile')
+            recompute_all()
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {throughput}.'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} rows with an existing or missing username.'))
+        if unknown_airports:
+            self.stdout.write(self.style.WARNING(f'{unknown_airports} rows had an unknown home airport and were imported without one.'))
+
+    @transaction.atomic
+    def import_chunk(self, records, airports, club):
+        usernames = []
+        for line, record in records:
+            try:
+                usernames.append(parse_text(record.get('username')))
+            except ValueError:
+                raise CommandError(f"Line {line}: invalid username {record.get('username')!r}")
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        users = []
+        profiles = {}
+        skipped = unknown_airports = 0
+        for username, (line, record) in zip(usernames, records):
+            if not username or username in existing or username in profiles:
+                skipped += 1
+                continue
+            password = record.get('password')
+            users.append(User(
+                username=username,
+                email=record.get('email') or '',
+                first_name=record.get('first_name') or '',
+                last_name=record.get('last_name') or '',
+                # Without a password the user has to reset it before logging in
+                password=make_password(password or None),
+            ))
+
+            try:
+                icao = parse_text(record.get('home_airport')).upper()
+            except ValueError:
+                raise CommandError(f"Line {line}: invalid home_airport for {username}: {record.get('home_airport')!r}")
+            home_airport_id = airports.get(icao)
+            if icao and home_airport_id is None:
+                unknown_airports += 1
+            try:
+                flight_hours = parse_int(record.get('flight_hours'))
+                # PilotProfile.flight_hours is a PositiveIntegerField, the constraint would fail the whole chunk
+                if flight_hours < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise CommandError(f"Line {line}: invalid flight_hours for {username}: {record.get('flight_hours')!r}")
+            profiles[username] = PilotProfile(
+                club=club,
+                home_airport_id=home_airport_id,
+                flight_hours=flight_hours,
+                comments=record.get('comments') or None,
+                **{flag: parse_bool(record.get(flag)) for flag in PROFILE_FLAGS},
+            )
+
+        if users:
+            User.objects.bulk_create(users)
+            # Not every backend returns primary keys from bulk_create, look them up once per chunk
+            user_ids = dict(User.objects.filter(username__in=profiles).values_list('username', 'id'))
+            for username, profile in profiles.items():
+                profile.user_id = user_ids[username]
+            PilotProfile.objects.bulk_create(profiles.values())
+
+        return len(users), skipped, unknown_airports
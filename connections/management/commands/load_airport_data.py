@@ -1,27 +1,71 @@
 # pilotconnect/connections/management/commands/load_airport_data.py
-import pandas as pd
-from django.core.management.base import BaseCommand
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
 from connections.models import AirportData
 
+DEFAULT_EXCEL_PATH = "C:\\Users\\b.conley\\PycharmProjects\\PilotConnect\\airport codes.xlsx"
+
+
+def skipped_rows(codes):
+    """Sheet line -> why it is skipped, for rows without an ICAO code or with one the sheet repeats."""
+    counts = Counter(codes)
+    reasons = {}
+    # Sheet line numbers, counting the header as line 1
+    for line, icao in enumerate(codes, 2):
+        if not icao:
+            reasons[line] = 'it has no ICAO code'
+        elif counts[icao] > 1:
+            reasons[line] = f'ICAO code {icao} appears {counts[icao]} times in the sheet'
+    return reasons
+
 class Command(BaseCommand):
     help = 'Load data from Excel file to AirportData model'
 
-    def handle(self, *args, **kwargs):
-        excel_path = "C:\\Users\\b.conley\\PycharmProjects\\PilotConnect\\airport codes.xlsx"
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_EXCEL_PATH, help='Excel sheet of airports')
 
+    def handle(self, *args, **options):
+        # pandas (with numpy and openpyxl behind it) is only needed here, import it
+        # on use so nothing else that loads the app pays for it
         try:
-            df = pd.read_excel(excel_path)
-            for _, row in df.iterrows():
-                AirportData.objects.create(
-                    country_code=row['country_code'],
-                    iata=row['iata'],
-                    icao=row['icao'],
-                    airport=row['airport'],
-                    latitude=row['latitude'],
-                    longitude=row['longitude'],
-                    city=row['city'],
-                    state=row['state']
+            import pandas as pd
+        except ImportError:
+            raise CommandError('load_airport_data needs pandas and openpyxl, pip install -r requirements.txt')
+
+        try:
+            df = pd.read_excel(options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read {options['path']}: {e}")
+
+        codes = ['' if pd.isna(icao) else str(icao).strip().upper() for icao in df['icao']]
+        problems = skipped_rows(codes)
+        loaded = 0
+        for line, icao, (_, row) in zip(range(2, len(codes) + 2), codes, df.iterrows()):
+            if line in problems:
+                self.stderr.write(f'Line {line}: skipped {row["airport"]}, {problems[line]}.')
+                continue
+            try:
+                # ICAO codes are unique, reloading the sheet updates airports in place
+                AirportData.objects.update_or_create(
+                    icao=icao,
+                    defaults=dict(
+                        country_code=row['country_code'],
+                        iata=row['iata'],
+                        airport=row['airport'],
+                        latitude=row['latitude'],
+                        longitude=row['longitude'],
+                        city=row['city'],
+                        state=row['state'],
+                    ),
                 )
-            self.stdout.write(self.style.SUCCESS('Data loaded successfully.'))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error loading data: {e}'))
+            except (DatabaseError, ValueError) as e:
+                self.stderr.write(f'Line {line}: skipped {icao}, {e}')
+                continue
+            loaded += 1
+
+        skipped = len(codes) - loaded
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} airports.'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} rows, see above.'))
@@ -0,0 +1,52 @@
+# connections/management/commands/load_test.py
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from connections.loadtest import Timings, UrlSampler, format_table, timed
+
+
+class Command(BaseCommand):
+    help = 'Request every named URL through the Django test client and report latency percentiles and queries per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per URL')
+        parser.add_argument('--user', help='Username to log in as, defaults to a random pilot with a home airport')
+        parser.add_argument('--only', nargs='*', help='Only these URL names')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--fail-on-error', action='store_true', help='Exit with an error if any view returns a 5xx')
+
+    # The test client's host matches no club, browse the whole installation
+    @override_settings(TENANT_FALLBACK=True)
+    def handle(self, *args, **options):
+        try:
+            sampler = UrlSampler(options['user'], options['seed'])
+        except User.DoesNotExist as e:
+            raise CommandError(str(e) or f"No user named {options['user']}")
+        client = Client()
+        client.force_login(sampler.user)
+
+        summaries = []
+        for name, samples in sampler.routes(options['only']):
+            if samples is None:
+                self.stderr.write(f'Skipping {name}: no sample arguments available')
+                continue
+
+            timings = Timings(name)
+            for i in range(options['iterations']):
+                response, duration, queries = timed(client.get, reverse(name, kwargs=samples[i % len(samples)]))
+                timings.record(duration, queries, response.status_code)
+            summaries.append(timings.summary())
+
+        self.stdout.write(format_table(summaries))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(summaries, f, indent=2)
+
+        failed = [row['name'] for row in summaries if any(s.startswith('5') for s in row['status'].split(','))]
+        if failed and options['fail_on_error']:
+            raise CommandError(f"Server errors from: {', '.join(failed)}")
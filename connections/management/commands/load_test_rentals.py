@@ -0,0 +1,101 @@
+# connections/management/commands/load_test_rentals.py
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from connections.models import Aircraft, PilotProfile, RentalSlot
+from connections.rentals import SlotUnavailable, book_slot
+
+PREFIX = 'loadtest_rental_'
+
+
+class Command(BaseCommand):
+    help = 'Book rental slots from many concurrent clients and check that no slot is booked twice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16, help='Number of concurrent booking clients')
+        parser.add_argument('--slots', type=int, default=200, help='Number of open slots to fight over')
+        parser.add_argument('--attempts', type=int, default=50, help='Booking attempts per client')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f'Leftover {PREFIX}* users found, remove them before running the load test.')
+
+        rng = random.Random(options['seed'])
+        renters, slot_ids = self.create_fixtures(options['clients'], options['slots'])
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(renters)) as pool:
+                results = list(pool.map(
+                    lambda renter: self.run_client(renter, slot_ids, options['attempts'], rng.random()),
+                    renters,
+                ))
+            elapsed = time.perf_counter() - started
+
+            wins = Counter()
+            conflicts = errors = 0
+            for client_wins, client_conflicts, client_errors in results:
+                wins.update(client_wins)
+                conflicts += client_conflicts
+                errors += client_errors
+
+            booked = dict(RentalSlot.objects.filter(pk__in=slot_ids, booked_by__isnull=False).values_list('pk', 'booked_by'))
+            double_booked = [slot_id for slot_id, count in wins.items() if count > 1]
+            mismatched = [slot_id for slot_id in wins if slot_id not in booked]
+            attempts = sum(wins.values()) + conflicts + errors
+
+            self.stdout.write(
+                f'{attempts} booking attempts from {len(renters)} clients in {elapsed:.2f}s '
+                f'({attempts / elapsed:.0f}/s): {sum(wins.values())} booked, {conflicts} conflicts, {errors} errors'
+            )
+            if double_booked or mismatched or len(booked) != sum(wins.values()):
+                raise CommandError(f'Double booking detected: {double_booked or mismatched}')
+            # A booked slot nobody won means a claim was lost or reported as failed
+            unclaimed = set(booked) - set(wins)
+            if unclaimed:
+                raise CommandError(f'{len(unclaimed)} slots are booked without a client winning them: {sorted(unclaimed)}')
+            if errors:
+                raise CommandError(f'{errors} booking attempts failed with database errors.')
+            self.stdout.write(self.style.SUCCESS('No slot was booked twice.'))
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def create_fixtures(self, clients, slots):
+        owner = User.objects.create_user(username=f'{PREFIX}owner')
+        profile = PilotProfile.objects.create(user=owner)
+        aircraft = Aircraft.objects.create(owner=profile, tail_number='N0LOAD', make_model='Load Test')
+        start = timezone.now()
+        RentalSlot.objects.bulk_create(
+            RentalSlot(aircraft=aircraft, start=start + timedelta(hours=2 * i), end=start + timedelta(hours=2 * i + 1))
+            for i in range(slots)
+        )
+        User.objects.bulk_create(User(username=f'{PREFIX}{i}') for i in range(clients))
+        renters = list(User.objects.filter(username__startswith=PREFIX).exclude(pk=owner.pk))
+        return renters, list(aircraft.rental_slots.values_list('pk', flat=True))
+
+    def run_client(self, renter, slot_ids, attempts, seed):
+        rng = random.Random(seed)
+        wins = Counter()
+        conflicts = errors = 0
+        try:
+            for _ in range(attempts):
+                slot_id = rng.choice(slot_ids)
+                try:
+                    book_slot(slot_id, renter)
+                except SlotUnavailable:
+                    conflicts += 1
+                except OperationalError:
+                    errors += 1
+                else:
+                    wins[slot_id] += 1
+        finally:
+            connection.close()
+        return wins, conflicts, errors
@@ -0,0 +1,37 @@
+# connections/management/commands/rebuild_feeds.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from connections.bulkio import Throughput, chunked
+from connections.feed import BUILD_BATCH, build_feeds
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild precomputed home feeds. Saves keep them current between runs; run this '
+        'periodically so events roll over and bulk imports, which skip signals, are picked up '
+        'before users land on a feed past FEED_MAX_AGE and wait for it to be rebuilt.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', type=int, metavar='ID', help='Only these users')
+        parser.add_argument('--stale', action='store_true', help='Only feeds never built or older than half of FEED_MAX_AGE')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+        if options['stale']:
+            cutoff = timezone.now() - timedelta(seconds=settings.FEED_MAX_AGE / 2)
+            users = users.filter(Q(home_feed__isnull=True) | Q(home_feed__built_at__isnull=True) | Q(home_feed__built_at__lt=cutoff))
+
+        throughput = Throughput()
+        for user_ids in chunked(users.values_list('pk', flat=True).iterator(), BUILD_BATCH):
+            build_feeds(user_ids)
+            throughput.add(len(user_ids))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt feeds: {throughput}.'))
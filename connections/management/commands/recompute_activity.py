@@ -0,0 +1,21 @@
+# connections/management/commands/recompute_activity.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from connections.aggregates import recompute_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the per-airport and per-state activity aggregates from scratch. '
+        'Signals keep them current between runs; run this nightly so upcoming event '
+        'counts roll over and any bulk changes that skipped signals are picked up.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        airports, states = recompute_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {airports} airports and {states} states in {time.perf_counter() - started:.2f}s.'
+        ))
@@ -0,0 +1,24 @@
+# connections/management/commands/recompute_flight_time.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from connections.logbook import recompute_pilots
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the per-pilot flight time rollups from the logbooks. Saves keep the totals '
+        'current between runs; run this nightly so the 30, 90 and 365 day windows roll '
+        'forward and last flight dates drop deleted entries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pilots', nargs='+', type=int, metavar='ID', help='Only these users')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        pilots = recompute_pilots(options['pilots'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed flight time for {pilots} pilots in {time.perf_counter() - started:.2f}s.'
+        ))
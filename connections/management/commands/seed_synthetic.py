@@ -0,0 +1,148 @@
+# connections/management/commands/seed_synthetic.py
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from connections.aggregates import recompute_all, refresh_suspended
+from connections.bulkio import PROFILE_FLAGS, Throughput, chunked
+from connections.models import AirportData, Message, PilotEvent, PilotProfile, TableVersion
+
+PREFIX = 'synthetic_'
+SYNTHETIC_PASSWORD = 'synthetic-pilot'
+
+EVENT_KINDS = ['Pancake Breakfast', 'Fly-in', 'Safety Seminar', 'Poker Run', 'IFR Proficiency Day', 'Formation Clinic']
+SUBJECTS = ['Safety pilot this weekend?', 'Instrument currency', 'Rental availability', 'Fly-in plans', 'CFI question']
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic pilots, events and messages spread over the existing AirportData rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pilots', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--hubs', type=int, default=25, help='Number of busy states pilots cluster around')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--clear', action='store_true', help=f'Delete existing {PREFIX}* users and their data first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        if options['clear']:
+            with refresh_suspended():
+                deleted, _ = User.objects.filter(username__startswith=PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} synthetic rows.')
+
+        airports_by_state = defaultdict(list)
+        for airport in AirportData.objects.only('id', 'state').iterator(chunk_size=5000):
+            airports_by_state[airport.state].append(airport.id)
+        if not airports_by_state:
+            raise CommandError('There are no airports to seed around, run load_airport_data first.')
+
+        # Pilots cluster in a few busy states with a long tail, like real traffic does
+        states = self.rng.sample(sorted(airports_by_state), min(options['hubs'], len(airports_by_state)))
+        weights = [1 / (rank + 1) for rank in range(len(states))]
+        self.pick_airport = lambda: self.rng.choice(airports_by_state[self.rng.choices(states, weights)[0]])
+
+        users = self.seed_pilots(options['pilots'])
+        if users:
+            self.seed_events(options['events'], users)
+            self.seed_messages(options['messages'], users)
+
+        for table in ('user', 'pilotprofile', 'pilotevent'):
+            TableVersion.bump(table)
+        # bulk_create skips the signals that keep the aggregates current
+        recompute_all()
+
+    def seed_pilots(self, count):
+        throughput = Throughput()
+        start = User.objects.filter(username__startswith=PREFIX).count()
+        # Hashing is the slow part of creating users, every synthetic pilot shares one hash
+        password = make_password(SYNTHETIC_PASSWORD)
+        now = timezone.now()
+
+        for numbers in chunked(range(start, start + count), self.batch_size):
+            with transaction.atomic():
+                usernames = [f'{PREFIX}{n:07d}' for n in numbers]
+                User.objects.bulk_create(
+                    User(username=username, password=password, email=f'{username}@example.com',
+                         date_joined=now - timedelta(days=self.rng.randint(0, 730)))
+                    for username in usernames
+                )
+                user_ids = User.objects.filter(username__in=usernames).values_list('id', flat=True)
+                PilotProfile.objects.bulk_create(self.make_profile(user_id) for user_id in user_ids)
+            throughput.add(len(numbers))
+
+        self.stdout.write(f'Pilots: {throughput}')
+        return list(PilotProfile.objects.filter(user__username__startswith=PREFIX).values_list('user_id', 'home_airport_id'))
+
+    def make_profile(self, user_id):
+        flags = {flag: self.rng.random() < 0.12 for flag in PROFILE_FLAGS}
+        flags['private_pilot'] = True
+        return PilotProfile(
+            user_id=user_id,
+            home_airport_id=self.pick_airport() if self.rng.random() < 0.95 else None,
+            flight_hours=int(self.rng.lognormvariate(5.5, 1.0)),
+            last_activity_date=timezone.now() - timedelta(days=self.rng.randint(0, 365)),
+            **flags,
+        )
+
+    def seed_events(self, count, users):
+        throughput = Throughput()
+        today = timezone.localdate()
+        hosts = [(user_id, airport_id) for user_id, airport_id in users if airport_id]
+        if not hosts:
+            return
+
+        # view_pilot_event looks events up by name, keep names unique across runs
+        offset = PilotEvent.objects.count()
+        for numbers in chunked(range(offset, offset + count), self.batch_size):
+            events = []
+            for n in numbers:
+                host_id, airport_id = self.rng.choice(hosts)
+                start = today + timedelta(days=self.rng.randint(-60, 180))
+                events.append(PilotEvent(
+                    event_name=f'{self.rng.choice(EVENT_KINDS)} #{n}',
+                    event_start_date=start,
+                    event_finish_date=start + timedelta(days=self.rng.choice([0, 0, 0, 1, 2])),
+                    host_airport_id=airport_id,
+                    host_name_id=host_id,
+                    event_description='Synthetic event generated for load testing.',
+                ))
+            PilotEvent.objects.bulk_create(events)
+            throughput.add(len(events))
+
+        self.stdout.write(f'Events: {throughput}')
+
+    def seed_messages(self, count, users):
+        throughput = Throughput()
+        now = timezone.now()
+        user_ids = [user_id for user_id, _ in users]
+
+        for numbers in chunked(range(count), self.batch_size):
+            with transaction.atomic():
+                messages = Message.objects.bulk_create(
+                    Message(
+                        sender_id=self.rng.choice(user_ids),
+                        recipient_id=self.rng.choice(user_ids),
+                        subject=self.rng.choice(SUBJECTS),
+                        content='Synthetic message generated for load testing.',
+                    )
+                    for _ in numbers
+                )
+                # timestamp is auto_now_add, spread the history out afterwards
+                if all(message.pk for message in messages):
+                    for message in messages:
+                        message.timestamp = now - timedelta(minutes=self.rng.randint(0, 60 * 24 * 365))
+                    Message.objects.bulk_update(messages, ['timestamp'], batch_size=500)
+            throughput.add(len(numbers))
+
+        self.stdout.write(f'Messages: {throughput}')
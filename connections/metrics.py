@@ -0,0 +1,274 @@
+# connections/metrics.py
+"""
+In-process request, database, template and cache metrics, served at /metrics in
+the Prometheus text format and written as one JSON log line per request.
+
+Every metric is guarded by its own lock, so recording is a dict update under a
+lock and safe from any thread. Counts are per process; scrape every worker.
+"""
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import empty
+
+request_logger = logging.getLogger('pilotconnect.requests')
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # labels -> [per-bucket counts with +Inf last (not cumulative), sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {labels: ([*counts], total) for labels, (counts, total) in self.values.items()}
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, [("le", _number(bound))])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+REQUESTS = Counter('pilotconnect_requests_total', 'Requests served', ['view', 'method', 'status'])
+REQUEST_DURATION = Histogram('pilotconnect_request_duration_seconds', 'Time to build a response', ['view'])
+DB_DURATION = Histogram('pilotconnect_db_duration_seconds', 'Time spent in database queries per request', ['view'])
+DB_QUERIES = Counter('pilotconnect_db_queries_total', 'Database queries run', ['view'])
+TEMPLATE_DURATION = Histogram('pilotconnect_template_render_seconds', 'Time to render a top-level template', ['template'])
+CACHE_LOOKUPS = Counter('pilotconnect_cache_lookups_total', 'Cache reads by outcome', ['cache', 'result'])
+
+REGISTRY = [REQUESTS, REQUEST_DURATION, DB_DURATION, DB_QUERIES, TEMPLATE_DURATION, CACHE_LOOKUPS]
+
+
+# Per-request tallies, only set while RequestMetricsMiddleware is handling a request on this thread
+_current = threading.local()
+
+
+def _tally(name, amount):
+    tallies = getattr(_current, 'tallies', None)
+    if tallies is not None:
+        tallies[name] += amount
+
+
+class InstrumentedCacheMixin:
+    """Counts hits and misses of every read, per cache alias and per request."""
+
+    _missing = object()
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        # Django doesn't tell a backend its alias, so CACHES entries name themselves
+        self.metrics_alias = params.get('METRICS_ALIAS', 'default')
+
+    def _record(self, hits, misses):
+        if hits:
+            CACHE_LOOKUPS.inc(self.metrics_alias, 'hit', amount=hits)
+            _tally('cache_hits', hits)
+        if misses:
+            CACHE_LOOKUPS.inc(self.metrics_alias, 'miss', amount=misses)
+            _tally('cache_misses', misses)
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version=version)
+        if value is self._missing:
+            self._record(0, 1)
+            return default
+        self._record(1, 0)
+        return value
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    # LocMemCache.get_many() calls get() per key, so it is already counted
+    pass
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version)
+        self._record(len(values), len(keys) - len(values))
+        return values
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            elapsed = time.perf_counter() - started
+            TEMPLATE_DURATION.observe(elapsed, self.template.origin.template_name or '<string>')
+            _tally('template_time', elapsed)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render. Includes count toward their parent."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestMetricsMiddleware:
+    """Times each request and its database work, then records metrics and logs one JSON line."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tallies = _current.tallies = {'db_time': 0.0, 'queries': 0, 'cache_hits': 0, 'cache_misses': 0, 'template_time': 0.0}
+
+        def time_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                tallies['db_time'] += time.perf_counter() - started
+                tallies['queries'] += 1
+
+        started = time.perf_counter()
+        try:
+            with connections['default'].execute_wrapper(time_query):
+                response = self.get_response(request)
+        finally:
+            _current.tallies = None
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.view_name if match else None) or '<unresolved>'
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        REQUEST_DURATION.observe(duration, view)
+        DB_DURATION.observe(tallies['db_time'], view)
+        DB_QUERIES.inc(view, amount=tallies['queries'])
+
+        request_logger.info('request', extra={
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user_id': self.user_id(request),
+            'duration_ms': round(duration * 1000, 2),
+            'db_ms': round(tallies['db_time'] * 1000, 2),
+            'queries': tallies['queries'],
+            'template_ms': round(tallies['template_time'] * 1000, 2),
+            'cache_hits': tallies['cache_hits'],
+            'cache_misses': tallies['cache_misses'],
+        })
+        return response
+
+    def user_id(self, request):
+        # Don't load the user just to log it; only report one the request already loaded
+        user = getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return None
+        return user.pk
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+
+    with CACHE_LOOKUPS.lock:
+        lookups = dict(CACHE_LOOKUPS.values)
+    caches = sorted({alias for alias, _ in lookups})
+    lines.append('# HELP pilotconnect_cache_hit_ratio Share of cache reads that were hits')
+    lines.append('# TYPE pilotconnect_cache_hit_ratio gauge')
+    for alias in caches:
+        hits, misses = lookups.get((alias, 'hit'), 0), lookups.get((alias, 'miss'), 0)
+        lines.append(f'pilotconnect_cache_hit_ratio{_labels(["cache"], [alias])} {_number(hits / max(hits + misses, 1))}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    # Scrapes need the token, without one configured there is no endpoint
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404('Metrics are not enabled')
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden('Forbidden', content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('connections', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Aircraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tail_number', models.CharField(max_length=10, unique=True)),
+                ('make_model', models.CharField(max_length=100)),
+                ('engine_class', models.CharField(choices=[('single', 'Single Engine'), ('multi', 'Multi Engine')], default='single', max_length=6)),
+                ('hourly_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ('home_airport', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='based_aircraft', to='connections.airportdata')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aircraft', to='connections.pilotprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RentalSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('booked_at', models.DateTimeField(blank=True, null=True)),
+                ('aircraft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rental_slots', to='connections.aircraft')),
+                ('booked_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rental_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('booked_by__isnull', True)), fields=['start', 'end'], name='rental_slot_open_idx'), models.Index(fields=['aircraft', 'start', 'end'], name='rental_slot_aircraft_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rentalslot',
+            constraint=models.CheckConstraint(check=models.Q(('end__gt', models.F('start'))), name='rental_slot_end_after_start'),
+        ),
+        migrations.AddIndex(
+            model_name='aircraft',
+            index=models.Index(fields=['engine_class', 'home_airport'], name='aircraft_class_airport_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:20
+
+import logging
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+# Everything pointing at an airport at this point in the schema
+REFERENCES = [
+    ('PilotProfile', 'home_airport'),
+    ('PilotEvent', 'host_airport'),
+    ('PilotEvent', 'second_airport'),
+    ('PilotEvent', 'third_airport'),
+    ('Aircraft', 'home_airport'),
+]
+
+
+def choose_keepers(groups, references):
+    """icao -> id keeping the code, from icao -> ids sharing it: the most referenced, then the oldest."""
+    return {icao: min(ids, key=lambda pk: (-references[pk], pk)) for icao, ids in groups.items()}
+
+
+def dedupe_airport_icao(apps, schema_editor):
+    """
+    Leave one airport per ICAO code before codes become unique.
+
+    The imported spreadsheet repeats some codes for different airports. The airport
+    profiles, events and aircraft use keeps the code and the others are blanked, which
+    the unique constraint allows, rather than guessing a code for them. They are
+    logged so the right codes can be filled in by hand.
+    """
+    AirportData = apps.get_model('connections', 'AirportData')
+    groups = defaultdict(list)
+    for pk, icao in AirportData.objects.exclude(icao='').order_by('id').values_list('id', 'icao'):
+        groups[icao].append(pk)
+    groups = {icao: ids for icao, ids in groups.items() if len(ids) > 1}
+    if not groups:
+        return
+
+    duplicates = [pk for ids in groups.values() for pk in ids]
+    references = Counter()
+    for model_name, field in REFERENCES:
+        model = apps.get_model('connections', model_name)
+        references.update(dict(
+            model.objects.filter(**{f'{field}__in': duplicates})
+            .order_by().values(field).annotate(uses=Count('pk')).values_list(field, 'uses')
+        ))
+
+    keepers = choose_keepers(groups, references)
+    blanked = [pk for icao, ids in groups.items() for pk in ids if pk != keepers[icao]]
+    names = dict(AirportData.objects.filter(pk__in=blanked).values_list('id', 'airport'))
+    AirportData.objects.filter(pk__in=blanked).update(icao='')
+    logger.warning(
+        'Blanked the ICAO code of %d duplicate airports, fix them by hand: %s', len(blanked),
+        ', '.join(f'{pk} ({icao} {names[pk]})' for icao, ids in groups.items() for pk in ids if pk != keepers[icao]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0003_tableversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_airport_icao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:08
+
+import logging
+
+from django.db import migrations, models
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def fix_event_dates(apps, schema_editor):
+    """Events finishing before they start would fail the new check, end them on their start date."""
+    PilotEvent = apps.get_model('connections', 'PilotEvent')
+    events = PilotEvent.objects.filter(event_finish_date__lt=F('event_start_date'))
+    fixed = [f'{pk} ({name})' for pk, name in events.values_list('pk', 'event_name')]
+    if fixed:
+        events.update(event_finish_date=F('event_start_date'))
+        logger.warning(
+            'Moved the finish date of %d events that finished before they started to their start date: %s',
+            len(fixed), ', '.join(fixed),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0004_dedupe_airport_icao'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='airportdata',
+            index=models.Index(fields=['state', 'icao'], name='airport_state_icao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='airportdata',
+            index=models.Index(fields=['latitude', 'longitude'], name='airport_lat_lon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['recipient', '-timestamp'], name='message_recipient_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', '-timestamp'], name='message_sender_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotevent',
+            index=models.Index(fields=['event_name'], name='event_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotevent',
+            index=models.Index(fields=['event_finish_date', 'event_start_date'], name='event_upcoming_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotevent',
+            index=models.Index(fields=['host_name', 'event_finish_date'], name='event_host_finish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('safety_pilot_need_vfr_single_engine', True), ('safety_pilot_need_ifr_single_engine', True), ('safety_pilot_need_ifr_multi_engine', True), _connector='OR'), fields=['home_airport'], name='profile_safety_need_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('safety_pilot_offer_vfr_single_engine', True), ('safety_pilot_offer_ifr_single_engine', True), ('safety_pilot_offer_ifr_multi_engine', True), _connector='OR'), fields=['home_airport'], name='profile_safety_offer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('instructor_need_cfi', True), ('instructor_need_instrument_cfii', True), ('instructor_need_commercial_single_engine', True), ('instructor_need_commercial_multi_engine_mei', True), _connector='OR'), fields=['home_airport'], name='profile_instructor_need_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('instructor_offer_cfi', True), ('instructor_offer_instrument_cfii', True), ('instructor_offer_commercial_single_engine', True), ('instructor_offer_commercial_multi_engine_mei', True), _connector='OR'), fields=['home_airport'], name='profile_instructor_offer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('rent_need_single_engine', True), ('rent_need_multi_engine', True), _connector='OR'), fields=['home_airport'], name='profile_rental_need_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('rent_offer_single_engine', True), ('rent_offer_multi_engine', True), _connector='OR'), fields=['home_airport'], name='profile_rental_offer_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='airportdata',
+            constraint=models.UniqueConstraint(condition=models.Q(('icao', ''), _negated=True), fields=('icao',), name='airport_icao_unique'),
+        ),
+        migrations.RunPython(fix_event_dates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pilotevent',
+            constraint=models.CheckConstraint(check=models.Q(('event_finish_date__gte', models.F('event_start_date'))), name='event_finish_after_start', violation_error_message='The event must finish on or after its start date.'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('connections', '0005_view_predicate_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pilotevent',
+            name='attendee_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='EventRSVP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rsvps', to='connections.pilotevent')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_rsvps', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'event'], name='event_rsvp_user_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='eventrsvp',
+            constraint=models.UniqueConstraint(fields=('event', 'user'), name='event_rsvp_unique'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0006_eventrsvp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StateStats',
+            fields=[
+                ('pilots', models.PositiveIntegerField(default=0)),
+                ('instrument_rated', models.PositiveIntegerField(default=0)),
+                ('instructors', models.PositiveIntegerField(default=0)),
+                ('safety_need', models.PositiveIntegerField(default=0)),
+                ('safety_offer', models.PositiveIntegerField(default=0)),
+                ('instructor_need', models.PositiveIntegerField(default=0)),
+                ('instructor_offer', models.PositiveIntegerField(default=0)),
+                ('rental_need', models.PositiveIntegerField(default=0)),
+                ('rental_offer', models.PositiveIntegerField(default=0)),
+                ('upcoming_events', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('state', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('airports', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AirportStats',
+            fields=[
+                ('pilots', models.PositiveIntegerField(default=0)),
+                ('instrument_rated', models.PositiveIntegerField(default=0)),
+                ('instructors', models.PositiveIntegerField(default=0)),
+                ('safety_need', models.PositiveIntegerField(default=0)),
+                ('safety_offer', models.PositiveIntegerField(default=0)),
+                ('instructor_need', models.PositiveIntegerField(default=0)),
+                ('instructor_offer', models.PositiveIntegerField(default=0)),
+                ('rental_need', models.PositiveIntegerField(default=0)),
+                ('rental_offer', models.PositiveIntegerField(default=0)),
+                ('upcoming_events', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('airport', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='connections.airportdata')),
+                ('state', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state'], name='airport_stats_state_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('connections', '0007_activity_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+                ('reason', models.CharField(choices=[('age', 'Older than the retention period'), ('deleted', 'Deleted by both participants')], max_length=7)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('recipient', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('connections', '0008_archivedmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomeFeed',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='home_feed', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sections', models.JSONField(default=dict)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('messages_seen_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('connections', '0010_message_time_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightTimeRollup',
+            fields=[
+                ('pilot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='flight_time', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('flights', models.PositiveIntegerField(default=0)),
+                ('total_hours', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('single_engine_hours', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('multi_engine_hours', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('vfr_hours', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('ifr_hours', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('hours_30', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('hours_90', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('hours_365', models.DecimalField(decimal_places=1, default=0, max_digits=8)),
+                ('last_flight_date', models.DateField(blank=True, null=True)),
+                ('windows_as_of', models.DateField()),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_flight_date'], name='flight_time_last_flight_idx'), models.Index(fields=['hours_90'], name='flight_time_hours_90_idx'), models.Index(fields=['multi_engine_hours'], name='flight_time_multi_idx'), models.Index(fields=['ifr_hours'], name='flight_time_ifr_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LogbookEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('aircraft_class', models.CharField(choices=[('single', 'Single Engine'), ('multi', 'Multi Engine')], default='single', max_length=6)),
+                ('duration', models.DecimalField(decimal_places=1, max_digits=4)),
+                ('conditions', models.CharField(choices=[('vfr', 'VFR'), ('ifr', 'IFR')], default='vfr', max_length=3)),
+                ('remarks', models.TextField(blank=True)),
+                ('arrival', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='connections.airportdata')),
+                ('departure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='connections.airportdata')),
+                ('pilot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='logbook_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pilot', '-date'], name='logbook_pilot_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='logbookentry',
+            constraint=models.CheckConstraint(check=models.Q(('duration__gt', 0)), name='logbook_duration_positive'),
+        ),
+    ]
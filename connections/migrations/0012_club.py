@@ -0,0 +1,99 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:45
+
+import connections.tenancy
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connections', '0011_logbook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Club',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('slug', models.SlugField(unique=True)),
+                ('domain', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='pilotprofile',
+            name='profile_safety_need_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pilotprofile',
+            name='profile_safety_offer_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pilotprofile',
+            name='profile_instructor_need_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pilotprofile',
+            name='profile_instructor_offer_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pilotprofile',
+            name='profile_rental_need_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pilotprofile',
+            name='profile_rental_offer_idx',
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='club',
+            field=models.ForeignKey(blank=True, db_index=False, default=connections.tenancy.current_club_id, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='connections.club'),
+        ),
+        migrations.AddField(
+            model_name='pilotevent',
+            name='club',
+            field=models.ForeignKey(blank=True, db_index=False, default=connections.tenancy.current_club_id, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='events', to='connections.club'),
+        ),
+        migrations.AddField(
+            model_name='pilotprofile',
+            name='club',
+            field=models.ForeignKey(blank=True, db_index=False, default=connections.tenancy.current_club_id, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='members', to='connections.club'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['club', '-timestamp'], name='message_club_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotevent',
+            index=models.Index(fields=['club', 'event_finish_date', 'event_start_date'], name='event_club_upcoming_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(fields=['club', 'home_airport'], name='profile_club_airport_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('safety_pilot_need_vfr_single_engine', True), ('safety_pilot_need_ifr_single_engine', True), ('safety_pilot_need_ifr_multi_engine', True), _connector='OR'), fields=['club', 'home_airport'], name='profile_safety_need_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('safety_pilot_offer_vfr_single_engine', True), ('safety_pilot_offer_ifr_single_engine', True), ('safety_pilot_offer_ifr_multi_engine', True), _connector='OR'), fields=['club', 'home_airport'], name='profile_safety_offer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('instructor_need_cfi', True), ('instructor_need_instrument_cfii', True), ('instructor_need_commercial_single_engine', True), ('instructor_need_commercial_multi_engine_mei', True), _connector='OR'), fields=['club', 'home_airport'], name='profile_instructor_need_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('instructor_offer_cfi', True), ('instructor_offer_instrument_cfii', True), ('instructor_offer_commercial_single_engine', True), ('instructor_offer_commercial_multi_engine_mei', True), _connector='OR'), fields=['club', 'home_airport'], name='profile_instructor_offer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('rent_need_single_engine', True), ('rent_need_multi_engine', True), _connector='OR'), fields=['club', 'home_airport'], name='profile_rental_need_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pilotprofile',
+            index=models.Index(condition=models.Q(('rent_offer_single_engine', True), ('rent_offer_multi_engine', True), _connector='OR'), fields=['club', 'home_airport'], name='profile_rental_offer_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('connections', '0012_club'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rentalslot',
+            name='rental_slot_open_idx',
+        ),
+        migrations.AlterField(
+            model_name='rentalslot',
+            name='booked_by',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rental_bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='rentalslot',
+            index=models.Index(condition=models.Q(('booked_by__isnull', True)), fields=['end', 'start'], name='rental_slot_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentalslot',
+            index=models.Index(condition=models.Q(('booked_by__isnull', False)), fields=['booked_by'], name='rental_slot_booked_by_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Count activity per club as well as installation-wide.
+
+    The aggregate tables only hold counts derived from profiles and events, so they are
+    recreated with their new keys rather than altered. Run recompute_activity afterwards.
+    """
+
+    dependencies = [
+        ('connections', '0013_rental_slot_open_end_idx'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(name='AirportStats'),
+        migrations.DeleteModel(name='StateStats'),
+        migrations.CreateModel(
+            name='StateStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.PositiveIntegerField(default=0)),
+                ('pilots', models.PositiveIntegerField(default=0)),
+                ('instrument_rated', models.PositiveIntegerField(default=0)),
+                ('instructors', models.PositiveIntegerField(default=0)),
+                ('safety_need', models.PositiveIntegerField(default=0)),
+                ('safety_offer', models.PositiveIntegerField(default=0)),
+                ('instructor_need', models.PositiveIntegerField(default=0)),
+                ('instructor_offer', models.PositiveIntegerField(default=0)),
+                ('rental_need', models.PositiveIntegerField(default=0)),
+                ('rental_offer', models.PositiveIntegerField(default=0)),
+                ('upcoming_events', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('state', models.CharField(max_length=255)),
+                ('airports', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'state'), name='state_stats_scope_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AirportStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.PositiveIntegerField(default=0)),
+                ('pilots', models.PositiveIntegerField(default=0)),
+                ('instrument_rated', models.PositiveIntegerField(default=0)),
+                ('instructors', models.PositiveIntegerField(default=0)),
+                ('safety_need', models.PositiveIntegerField(default=0)),
+                ('safety_offer', models.PositiveIntegerField(default=0)),
+                ('instructor_need', models.PositiveIntegerField(default=0)),
+                ('instructor_offer', models.PositiveIntegerField(default=0)),
+                ('rental_need', models.PositiveIntegerField(default=0)),
+                ('rental_offer', models.PositiveIntegerField(default=0)),
+                ('upcoming_events', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('airport', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='connections.airportdata')),
+                ('state', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'state'], name='airport_stats_state_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'airport'), name='airport_stats_scope_unique')],
+            },
+        ),
+    ]
@@ -3,7 +3,8 @@
 from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
-from django import forms
+
+from .tenancy import TenantManager, current_club_id
 
 
 class AirportData(models.Model):
@@ -16,6 +17,17 @@ class AirportData(models.Model):
     city = models.CharField(max_length=255)
     state = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            # State pages filter on state and list by ICAO
+            models.Index(fields=['state', 'icao'], name='airport_state_icao_idx'),
+            # Radius searches range scan a latitude/longitude bounding box
+            models.Index(fields=['latitude', 'longitude'], name='airport_lat_lon_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['icao'], condition=~models.Q(icao=''), name='airport_icao_unique'),
+        ]
+
     def __str__(self):
         return f"{self.icao} - {self.airport} - {self.state}"
 
@@ -24,8 +36,21 @@ class AirportData(models.Model):
         return cls.objects.order_by('icao')
 
 
+class Club(models.Model):
+    """A flying club the site is run for. Members, events and messages belong to one, airports are shared."""
+    name = models.CharField(max_length=255)
+    slug = models.SlugField(unique=True)
+    # Requests for this host are served as the club, see connections/tenancy.py
+    domain = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class PilotProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Like the club fields below, indexed by the composite indexes leading with it
+    club = models.ForeignKey(Club, on_delete=models.PROTECT, null=True, blank=True, default=current_club_id, db_index=False, related_name='members')
     home_airport = models.ForeignKey(AirportData, on_delete=models.SET_NULL, null=True, blank=True)
     flight_hours = models.PositiveIntegerField(default=0)
 
@@ -67,9 +92,45 @@ class PilotProfile(models.Model):
     # group as Comment
     comments = models.TextField(null=True, blank=True)
 
+    objects = TenantManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        # One partial index per directory. Each only holds the profiles that set one of
+        # the directory's flags, so the lists read a small index instead of every profile.
+        # The conditions must match the OR the directory queries build, flag for flag.
+        # Every index leads with the club, so a club's directory reads only its own members.
+        indexes = [
+            models.Index(fields=['club', 'home_airport'], name='profile_club_airport_idx'),
+            models.Index(
+                fields=['club', 'home_airport'], name='profile_safety_need_idx',
+                condition=models.Q(safety_pilot_need_vfr_single_engine=True) | models.Q(safety_pilot_need_ifr_single_engine=True) | models.Q(safety_pilot_need_ifr_multi_engine=True),
+            ),
+            models.Index(
+                fields=['club', 'home_airport'], name='profile_safety_offer_idx',
+                condition=models.Q(safety_pilot_offer_vfr_single_engine=True) | models.Q(safety_pilot_offer_ifr_single_engine=True) | models.Q(safety_pilot_offer_ifr_multi_engine=True),
+            ),
+            models.Index(
+                fields=['club', 'home_airport'], name='profile_instructor_need_idx',
+                condition=models.Q(instructor_need_cfi=True) | models.Q(instructor_need_instrument_cfii=True) | models.Q(instructor_need_commercial_single_engine=True) | models.Q(instructor_need_commercial_multi_engine_mei=True),
+            ),
+            models.Index(
+                fields=['club', 'home_airport'], name='profile_instructor_offer_idx',
+                condition=models.Q(instructor_offer_cfi=True) | models.Q(instructor_offer_instrument_cfii=True) | models.Q(instructor_offer_commercial_single_engine=True) | models.Q(instructor_offer_commercial_multi_engine_mei=True),
+            ),
+            models.Index(
+                fields=['club', 'home_airport'], name='profile_rental_need_idx',
+                condition=models.Q(rent_need_single_engine=True) | models.Q(rent_need_multi_engine=True),
+            ),
+            models.Index(
+                fields=['club', 'home_airport'], name='profile_rental_offer_idx',
+                condition=models.Q(rent_offer_single_engine=True) | models.Q(rent_offer_multi_engine=True),
+            ),
+        ]
+
     def update_last_activity(self):
         self.last_activity_date = timezone.now()
-        self.save()
+        self.save(update_fields=['last_activity_date'])
 
     def __str__(self):
         return f"{self.user.username}'s Pilot Profile"
@@ -82,11 +143,57 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     deleted_for_user = models.ManyToManyField(User, related_name='deleted_messages', blank=True)
+    club = models.ForeignKey(Club, on_delete=models.PROTECT, null=True, blank=True, default=current_club_id, db_index=False, related_name='+')
+
+    objects = TenantManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # A club's messages newest first, for its admin
+            models.Index(fields=['club', '-timestamp'], name='message_club_time_idx'),
+            # Inbox and outbox are read newest first per user
+            models.Index(fields=['recipient', '-timestamp'], name='message_recipient_time_idx'),
+            models.Index(fields=['sender', '-timestamp'], name='message_sender_time_idx'),
+            # The admin's date drill-down and archive_messages' age cutoff range scan on time alone
+            models.Index(fields=['timestamp'], name='message_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender} to {self.recipient} - {self.subject}"
 
 
+class ArchivedMessage(models.Model):
+    """
+    A message moved out of Message by the archive_messages command.
+
+    Keeps the original id and no indexes besides it, and the user and club references
+    carry no constraint so deleting either later never has to touch the archive.
+    """
+    AGE = 'age'
+    DELETED = 'deleted'
+    REASON_CHOICES = [
+        (AGE, 'Older than the retention period'),
+        (DELETED, 'Deleted by both participants'),
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    sender = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    recipient = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+')
+    subject = models.CharField(max_length=255)
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    reason = models.CharField(max_length=7, choices=REASON_CHOICES)
+    archived_at = models.DateTimeField(default=timezone.now)
+    club = models.ForeignKey(Club, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, db_index=False, related_name='+')
+
+    objects = TenantManager()
+    all_objects = models.Manager()
+
+    def __str__(self):
+        return f"{self.sender_id} to {self.recipient_id} - {self.subject}"
+
+
 class PilotEvent(models.Model):
     event_name = models.CharField(max_length=500)
     event_start_date = models.DateField()
@@ -95,13 +202,263 @@ class PilotEvent(models.Model):
     second_airport = models.ForeignKey(AirportData, on_delete=models.CASCADE, blank=True, null=True, related_name='second_airport_events')
     third_airport = models.ForeignKey(AirportData, on_delete=models.CASCADE, blank=True, null=True, related_name='third_airport_events')
     host_name = models.ForeignKey(User, on_delete=models.CASCADE)  # ForeignKey to User
+    club = models.ForeignKey(Club, on_delete=models.PROTECT, null=True, blank=True, default=current_club_id, db_index=False, related_name='events')
     event_description = models.TextField()
+    # Denormalized count of EventRSVP rows, kept in step by connections/signals.py
+    attendee_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TenantManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event_name'], name='event_name_idx'),
+            # Upcoming events are filtered on finish date and listed by start date
+            models.Index(fields=['event_finish_date', 'event_start_date'], name='event_upcoming_idx'),
+            models.Index(fields=['club', 'event_finish_date', 'event_start_date'], name='event_club_upcoming_idx'),
+            models.Index(fields=['host_name', 'event_finish_date'], name='event_host_finish_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(event_finish_date__gte=models.F('event_start_date')),
+                name='event_finish_after_start',
+                violation_error_message='The event must finish on or after its start date.',
+            ),
+        ]
 
     def __str__(self):
 
         return f"{self.event_name} - {self.event_start_date} - {self.host_name}"
 
-class PilotEventForm(forms.ModelForm):
+
+class EventRSVP(models.Model):
+    event = models.ForeignKey(PilotEvent, on_delete=models.CASCADE, related_name='rsvps')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='event_rsvps')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'user'], name='event_rsvp_unique'),
+        ]
+        indexes = [
+            # "Am I attending" lookups for a page of events start from the user
+            models.Index(fields=['user', 'event'], name='event_rsvp_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.event}"
+
+class Aircraft(models.Model):
+    SINGLE_ENGINE = 'single'
+    MULTI_ENGINE = 'multi'
+    ENGINE_CLASS_CHOICES = [
+        (SINGLE_ENGINE, 'Single Engine'),
+        (MULTI_ENGINE, 'Multi Engine'),
+    ]
+
+    owner = models.ForeignKey(PilotProfile, on_delete=models.CASCADE, related_name='aircraft')
+    home_airport = models.ForeignKey(AirportData, on_delete=models.SET_NULL, null=True, blank=True, related_name='based_aircraft')
+    tail_number = models.CharField(max_length=10, unique=True)
+    make_model = models.CharField(max_length=100)
+    engine_class = models.CharField(max_length=6, choices=ENGINE_CLASS_CHOICES, default=SINGLE_ENGINE)
+    hourly_rate = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['engine_class', 'home_airport'], name='aircraft_class_airport_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tail_number} - {self.make_model}"
+
+
+class RentalSlot(models.Model):
+    aircraft = models.ForeignKey(Aircraft, on_delete=models.CASCADE, related_name='rental_slots')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    # Indexed below for booked slots only, a full index on it is what the planner picks for open ones
+    booked_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='rental_bookings', db_index=False)
+    booked_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
-        model = PilotEvent
-        fields = ['event_name', 'event_start_date', 'host_airport', 'host_name', 'event_description']
\ No newline at end of file
+        indexes = [
+            # Availability is an interval. Searches range scan the open slots on end, which
+            # past slots fall out of, and filter on start; overlap checks use the aircraft index.
+            models.Index(fields=['end', 'start'], condition=models.Q(booked_by__isnull=True), name='rental_slot_open_idx'),
+            models.Index(fields=['aircraft', 'start', 'end'], name='rental_slot_aircraft_idx'),
+            models.Index(fields=['booked_by'], condition=models.Q(booked_by__isnull=False), name='rental_slot_booked_by_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(end__gt=models.F('start')), name='rental_slot_end_after_start'),
+        ]
+
+    @property
+    def is_booked(self):
+        return self.booked_by_id is not None
+
+    def __str__(self):
+        return f"{self.aircraft} - {self.start:%Y-%m-%d %H:%M} to {self.end:%Y-%m-%d %H:%M}"
+
+
+class LogbookEntry(models.Model):
+    VFR = 'vfr'
+    IFR = 'ifr'
+    CONDITIONS_CHOICES = [
+        (VFR, 'VFR'),
+        (IFR, 'IFR'),
+    ]
+
+    pilot = models.ForeignKey(User, on_delete=models.CASCADE, related_name='logbook_entries')
+    date = models.DateField()
+    aircraft_class = models.CharField(max_length=6, choices=Aircraft.ENGINE_CLASS_CHOICES, default=Aircraft.SINGLE_ENGINE)
+    departure = models.ForeignKey(AirportData, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    arrival = models.ForeignKey(AirportData, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Hours to the tenth, as logbooks record them
+    duration = models.DecimalField(max_digits=4, decimal_places=1)
+    conditions = models.CharField(max_length=3, choices=CONDITIONS_CHOICES, default=VFR)
+    remarks = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # A pilot's logbook is read newest first, and rollups recount one pilot at a time
+            models.Index(fields=['pilot', '-date'], name='logbook_pilot_date_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(duration__gt=0), name='logbook_duration_positive'),
+        ]
+
+    def __str__(self):
+        return f"{self.pilot_id} - {self.date} - {self.duration}h"
+
+
+class FlightTimeRollup(models.Model):
+    """
+    A pilot's logbook totals, kept current by connections/logbook.py as entries are added.
+
+    The hours_<days> windows count flights since that many days before windows_as_of and
+    are rolled forward by the recompute_flight_time command; directories filter on these
+    columns instead of summing logbooks.
+    """
+    pilot = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='flight_time')
+    flights = models.PositiveIntegerField(default=0)
+    total_hours = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    single_engine_hours = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    multi_engine_hours = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    vfr_hours = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    ifr_hours = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    hours_30 = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    hours_90 = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    hours_365 = models.DecimalField(max_digits=8, decimal_places=1, default=0)
+    last_flight_date = models.DateField(null=True, blank=True)
+    windows_as_of = models.DateField()
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # One per directory recency filter, see directory.RECENCY_FILTERS
+        indexes = [
+            models.Index(fields=['last_flight_date'], name='flight_time_last_flight_idx'),
+            models.Index(fields=['hours_90'], name='flight_time_hours_90_idx'),
+            models.Index(fields=['multi_engine_hours'], name='flight_time_multi_idx'),
+            models.Index(fields=['ifr_hours'], name='flight_time_ifr_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pilot_id} - {self.total_hours}h"
+
+
+class ActivityCounts(models.Model):
+    """Counters shared by the per-airport and per-state aggregate tables, see connections/aggregates.py."""
+    # The club counted, or 0 for every club together. An integer rather than a nullable
+    # foreign key, so the installation-wide rows have a key the upserts can conflict on.
+    scope = models.PositiveIntegerField(default=0)
+    pilots = models.PositiveIntegerField(default=0)
+    instrument_rated = models.PositiveIntegerField(default=0)
+    instructors = models.PositiveIntegerField(default=0)
+    safety_need = models.PositiveIntegerField(default=0)
+    safety_offer = models.PositiveIntegerField(default=0)
+    instructor_need = models.PositiveIntegerField(default=0)
+    instructor_offer = models.PositiveIntegerField(default=0)
+    rental_need = models.PositiveIntegerField(default=0)
+    rental_offer = models.PositiveIntegerField(default=0)
+    upcoming_events = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        abstract = True
+
+
+class AirportStats(ActivityCounts):
+    airport = models.ForeignKey(AirportData, on_delete=models.CASCADE, related_name='stats')
+    # Copied from the airport so state totals and state heatmaps never join AirportData
+    state = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['scope', 'state'], name='airport_stats_state_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'airport'], name='airport_stats_scope_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.airport_id} - {self.pilots} pilots"
+
+
+class StateStats(ActivityCounts):
+    state = models.CharField(max_length=255)
+    airports = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'state'], name='state_stats_scope_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.state} - {self.pilots} pilots"
+
+
+class HomeFeed(models.Model):
+    """
+    A user's precomputed home page, one row per user read by primary key.
+
+    connections/feed.py rebuilds it in the background whenever a nearby profile or
+    event, or the user's inbox, changes. sections holds what the page renders, see
+    feed.build_sections.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='home_feed')
+    sections = models.JSONField(default=dict)
+    # Null until the first build, e.g. when only messages_seen_at has been recorded
+    built_at = models.DateTimeField(null=True, blank=True)
+    # Messages received after this are unread; set whenever the user opens their inbox
+    messages_seen_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id} - built {self.built_at}"
+
+
+class TableVersion(models.Model):
+    """
+    A change counter per table, bumped by signals whenever a row is saved or deleted.
+
+    Reading a handful of these rows is far cheaper than inspecting the tables they
+    describe, which is what makes ETags and conditional GETs cheap to answer.
+    """
+    table = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump(cls, table):
+        now = timezone.now()
+        if not cls.objects.filter(table=table).update(version=models.F('version') + 1, updated_at=now):
+            version, created = cls.objects.get_or_create(table=table, defaults={'version': 1, 'updated_at': now})
+            if not created:
+                cls.objects.filter(table=table).update(version=models.F('version') + 1, updated_at=now)
+
+    @classmethod
+    def current(cls, tables):
+        return {row.table: row for row in cls.objects.filter(table__in=tables)}
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+
@@ -0,0 +1,119 @@
+# connections/ratelimit.py
+
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+
+OUTCOMES = ('allowed', 'rejected')
+
+# Serializes read-modify-write of buckets within this process. Across processes
+# sharing a cache two requests can race on one bucket and both pass, which only
+# lets a burst overshoot by a token or two.
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.RATE_LIMIT_CACHE]
+
+
+def _bucket_key(endpoint, scope, key):
+    return f'ratelimit:bucket:{endpoint}:{scope}:{key}'
+
+
+def _counter_key(endpoint, scope, outcome):
+    return f'ratelimit:count:{endpoint}:{scope}:{outcome}'
+
+
+def _count(cache, endpoint, scope, outcome):
+    key = _counter_key(endpoint, scope, outcome)
+    # add() is a no-op once the counter exists, incr() is atomic on every backend
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def consume(endpoint, keys):
+    """
+    Take one token from the bucket of each scope in keys ({scope: key}).
+
+    Either every bucket has a token and all are charged, or none is charged and the
+    seconds until the emptiest refills is returned. Returns 0 when allowed. Scopes
+    without a configured limit are always allowed.
+    """
+    limits = settings.RATE_LIMITS.get(endpoint, {})
+    keys = {scope: key for scope, key in keys.items() if scope in limits and key is not None}
+    if not keys:
+        return 0
+
+    cache = _cache()
+    now = time.time()
+    with _lock:
+        buckets = {}
+        stored = cache.get_many([_bucket_key(endpoint, scope, key) for scope, key in keys.items()])
+        for scope, key in keys.items():
+            burst, seconds = limits[scope]
+            rate = burst / seconds
+            tokens, updated = stored.get(_bucket_key(endpoint, scope, key), (burst, now))
+            buckets[scope] = (min(burst, tokens + (now - updated) * rate), rate, seconds)
+
+        empty = {scope: (1 - tokens) / rate for scope, (tokens, rate, _) in buckets.items() if tokens < 1}
+        if not empty:
+            for scope, (tokens, _, seconds) in buckets.items():
+                # A bucket left alone for `seconds` is full again, so it can simply expire
+                cache.set(_bucket_key(endpoint, scope, keys[scope]), (tokens - 1, now), timeout=math.ceil(seconds))
+
+    for scope in keys:
+        _count(cache, endpoint, scope, 'rejected' if scope in empty else 'allowed')
+    return max(empty.values(), default=0)
+
+
+def counters():
+    """[(endpoint, scope, allowed, rejected), ...] for every configured limit."""
+    cache = _cache()
+    names = [
+        (endpoint, scope)
+        for endpoint, scopes in sorted(settings.RATE_LIMITS.items())
+        for scope in sorted(scopes)
+    ]
+    values = cache.get_many([_counter_key(endpoint, scope, outcome) for endpoint, scope in names for outcome in OUTCOMES])
+    return [
+        (endpoint, scope, *(values.get(_counter_key(endpoint, scope, outcome), 0) for outcome in OUTCOMES))
+        for endpoint, scope in names
+    ]
+
+
+def too_many_requests(request, retry_after):
+    retry_after = math.ceil(retry_after)
+    response = render(request, 'connections/rate_limited.html', {'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(endpoint, recipient_kwarg=None):
+    """
+    Limit POSTs to a view per user, and per recipient when the URL names one.
+
+    The check runs before the view body, so a rejected burst never reaches the ORM.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method == 'POST':
+                keys = {'user': request.user.pk}
+                if recipient_kwarg:
+                    keys['recipient'] = kwargs.get(recipient_kwarg)
+                retry_after = consume(endpoint, keys)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+
+        return wrapped
+
+    return decorator
@@ -0,0 +1,66 @@
+# connections/rentals.py
+
+from django.db import transaction
+from django.utils import timezone
+
+from .directory import DEFAULT_RADIUS_NM, apply_scope
+from .models import Aircraft, RentalSlot
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def available_slots(start, end, engine_class=None, near=None, radius_nm=DEFAULT_RADIUS_NM):
+    """
+    Open slots whose availability covers the whole start..end window.
+
+    The window is an indexed range scan over open slots; when an airport is given
+    the aircraft's home airport is bounded the same way the directory radius is.
+    """
+    queryset = RentalSlot.objects.filter(
+        booked_by__isnull=True,
+        start__lte=start,
+        end__gte=end,
+    ).select_related('aircraft__home_airport', 'aircraft__owner__user').order_by('start')
+    if engine_class:
+        queryset = queryset.filter(aircraft__engine_class=engine_class)
+    if near is not None:
+        queryset = apply_scope(queryset, 'radius', 'aircraft__', near, radius_nm)
+    return queryset
+
+
+def overlapping_slots(aircraft, start, end):
+    return RentalSlot.objects.filter(aircraft=aircraft, start__lt=end, end__gt=start)
+
+
+def add_slot(slot):
+    """
+    Save a new slot unless its aircraft already has one overlapping it.
+
+    The aircraft row is locked for the check and the insert, so of two requests
+    adding overlapping slots the second waits and then sees the first's slot.
+    """
+    with transaction.atomic():
+        list(Aircraft.objects.select_for_update().filter(pk=slot.aircraft_id).values_list('pk', flat=True))
+        if overlapping_slots(slot.aircraft_id, slot.start, slot.end).exclude(pk=slot.pk).exists():
+            raise SlotUnavailable('This aircraft already has a slot during that time.')
+        slot.save()
+    return slot
+
+
+def book_slot(slot_id, user):
+    """
+    Claim an open slot for user.
+
+    The claim is a single conditional UPDATE, so of any number of concurrent
+    requests for the same slot exactly one matches the still-open row and wins;
+    the others see zero updated rows and get SlotUnavailable. No table lock is taken.
+    """
+    with transaction.atomic():
+        claimed = RentalSlot.objects.filter(pk=slot_id, booked_by__isnull=True).update(
+            booked_by=user,
+            booked_at=timezone.now(),
+        )
+    if not claimed:
+        raise SlotUnavailable(f"Rental slot {slot_id} is no longer available")
@@ -0,0 +1,141 @@
+# connections/signals.py
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import feed, logbook, tenancy
+from .aggregates import COUNTED_FIELDS, EVENT_AIRPORTS, refresh_airports
+from .models import AirportData, Club, EventRSVP, LogbookEntry, Message, PilotEvent, PilotProfile, TableVersion
+
+
+VERSIONED_MODELS = (AirportData, PilotProfile, PilotEvent, User)
+
+
+def bump_table_version(sender, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which nothing versioned exposes
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    TableVersion.bump(sender._meta.model_name)
+
+
+# Connected per model rather than to every sender: a model with delete listeners
+# can't be fast-deleted, so a catch-all receiver would make every bulk delete load
+# and signal each row, messages included.
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_table_version, sender=model)
+    post_delete.connect(bump_table_version, sender=model)
+
+
+@receiver(post_save, sender=EventRSVP)
+def count_rsvp(sender, instance, created, **kwargs):
+    if created:
+        _adjust_attendee_count(instance.event_id, 1)
+
+
+@receiver(post_delete, sender=EventRSVP)
+def uncount_rsvp(sender, instance, **kwargs):
+    _adjust_attendee_count(instance.event_id, -1)
+
+
+def _adjust_attendee_count(event_id, delta):
+    # A single UPDATE with F() so concurrent RSVPs never overwrite each other's counts.
+    # update() skips signals, so bump the event version by hand for the API ETags and
+    # fan the new count out to the feeds listing the event near its host airport.
+    event = PilotEvent.all_objects.filter(pk=event_id)
+    if event.update(attendee_count=F('attendee_count') + delta):
+        TableVersion.bump(PilotEvent._meta.model_name)
+        feed.schedule(airport_ids=event.values_list('host_airport_id', flat=True))
+
+
+# Aggregates: recount the airports a profile or event was at before and after the change
+
+def _airport_ids(sender, instance):
+    if sender is PilotProfile:
+        return {instance.home_airport_id}
+    return {getattr(instance, f'{field}_id') for field in EVENT_AIRPORTS}
+
+
+def _saved_fields(sender, update_fields):
+    """Names of the fields a save writes, or None when it writes them all."""
+    return None if update_fields is None else {sender._meta.get_field(name).name for name in update_fields}
+
+
+@receiver(pre_save, sender=PilotProfile)
+@receiver(pre_save, sender=PilotEvent)
+def remember_airports(sender, instance, update_fields=None, **kwargs):
+    # Saves like update_last_activity() change nothing counted or shown in feeds, so skip the SELECT
+    fields = _saved_fields(sender, update_fields)
+    if fields is not None and not fields & (COUNTED_FIELDS[sender] | (feed.PROFILE_FIELDS if sender is PilotProfile else set())):
+        instance._previous_airport_ids = set()
+        return
+    previous = sender.all_objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._previous_airport_ids = _airport_ids(sender, previous) if previous else set()
+    if sender is PilotProfile and previous:
+        instance._previous_feed_values = feed.profile_values(previous)
+
+
+@receiver(post_save, sender=PilotProfile)
+@receiver(post_save, sender=PilotEvent)
+@receiver(post_delete, sender=PilotProfile)
+@receiver(post_delete, sender=PilotEvent)
+def refresh_airport_stats(sender, instance, update_fields=None, **kwargs):
+    fields = _saved_fields(sender, update_fields)
+    if fields is not None and not fields & COUNTED_FIELDS[sender]:
+        return
+    refresh_airports(_airport_ids(sender, instance) | getattr(instance, '_previous_airport_ids', set()))
+
+
+# Home feeds: fan each change out to the feeds it shows up in, after the commit and off the request
+
+@receiver(post_save, sender=PilotProfile)
+@receiver(post_save, sender=PilotEvent)
+@receiver(post_delete, sender=PilotProfile)
+@receiver(post_delete, sender=PilotEvent)
+def fan_out_to_feeds(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    if sender is PilotProfile and signal is post_save and not created and not _feed_visible_change(instance, update_fields):
+        return
+    own = [instance.user_id] if sender is PilotProfile else []
+    feed.schedule(own, _airport_ids(sender, instance) | getattr(instance, '_previous_airport_ids', set()))
+
+
+def _feed_visible_change(profile, update_fields):
+    if update_fields is not None and not {PilotProfile._meta.get_field(name).name for name in update_fields} & feed.PROFILE_FIELDS:
+        return False
+    previous = getattr(profile, '_previous_feed_values', None)
+    return previous is None or previous != feed.profile_values(profile)
+
+
+@receiver(post_save, sender=Message)
+def fan_out_message(sender, instance, created, **kwargs):
+    if created:
+        feed.schedule([instance.recipient_id])
+
+
+# Flight time rollups: count each logbook change in as it is saved
+
+@receiver(pre_save, sender=LogbookEntry)
+def remember_entry(sender, instance, **kwargs):
+    instance._previous_entry = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=LogbookEntry)
+def count_entry(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_entry', None)
+    if previous is not None:
+        logbook.remove_entries([previous])
+    logbook.add_entries([instance])
+
+
+@receiver(post_delete, sender=LogbookEntry)
+def uncount_entry(sender, instance, **kwargs):
+    logbook.remove_entries([instance])
+
+
+# Clubs: the middleware's host lookup is cached
+
+@receiver(post_save, sender=Club)
+@receiver(post_delete, sender=Club)
+def forget_club_domains(sender, **kwargs):
+    tenancy.forget_domains()
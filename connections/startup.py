@@ -0,0 +1,94 @@
+# connections/startup.py
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+# Only the commands that need these import them; importing the app must never pull them in
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+# What a worker does before it can answer: set Django up, import the URLconf (and with
+# it every view) and serve one request. Each phase prints its duration on one JSON line.
+COLD_START_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+phases = {}
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+phases['setup'] = time.perf_counter() - started
+
+mark = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+phases['urls'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+environ = {'PATH_INFO': sys.argv[1], 'HTTP_HOST': 'localhost'}
+setup_testing_defaults(environ)
+status = []
+b''.join(application(environ, lambda code, headers, exc_info=None: status.append(code)))
+phases['first_request'] = time.perf_counter() - mark
+phases['total'] = time.perf_counter() - started
+print(json.dumps({'phases': phases, 'status': status[0].split()[0]}))
+'''
+
+STARTUP_IMPORTS = '''
+import django
+django.setup()
+from django.conf import settings
+from importlib import import_module
+import_module(settings.ROOT_URLCONF)
+'''
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<name>.+)$')
+
+
+def run_python(args, code, *script_args):
+    """Run code in a fresh interpreter from the project directory, as a worker would start."""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'pilotconnect.settings')}
+    # localhost matches no club, serve it the whole installation
+    env['PILOTCONNECT_TENANT_FALLBACK'] = '1'
+    return subprocess.run(
+        [sys.executable, *args, '-c', code, *script_args],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth), ...] from python -X importtime output."""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        name = match.group('name')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(match.group('self')), int(match.group('cumulative')), depth))
+    return modules
+
+
+def group_by_package(modules, depth=1):
+    """package -> (self_us, module count), where package is the first `depth` parts of the name."""
+    groups = defaultdict(lambda: [0, 0])
+    for name, self_us, _, _ in modules:
+        group = groups['.'.join(name.split('.')[:depth])]
+        group[0] += self_us
+        group[1] += 1
+    return {name: tuple(totals) for name, totals in groups.items()}
+
+
+def measure_cold_start(path='/'):
+    """One fresh worker's phase timings, plus 'process' for the whole run including interpreter startup."""
+    started = time.perf_counter()
+    result = run_python([], COLD_START_SCRIPT, path)
+    elapsed = time.perf_counter() - started
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    measured['phases']['process'] = elapsed
+    return measured
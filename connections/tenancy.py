@@ -0,0 +1,124 @@
+# connections/tenancy.py
+"""
+Flying clubs as tenants.
+
+TenantMiddleware activates the club of the request's host for the rest of the
+request, looking it up the first time something asks for it. While a club is
+active, the default managers of PilotProfile, PilotEvent and Message only return
+that club's rows, and new rows are created in it. Airports, aircraft and users stay
+shared; queries starting from User go through scope(). With no club active, as in
+commands and the feed worker, everything is installation-wide, as it is for hosts
+matching no club unless TENANT_FALLBACK is turned off.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import models
+from django.http import Http404
+from django.http.request import split_domain_port
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+_club_id = ContextVar('club_id', default=None)
+
+DOMAINS_KEY = 'tenancy:domains'
+DOMAINS_TTL = 300
+
+
+class _HostClub:
+    """The club of a request's host, looked up the first time a query needs it."""
+
+    def __init__(self, host):
+        self.host = host
+
+    @cached_property
+    def id(self):
+        return club_domains().get(self.host)
+
+
+def current_club_id():
+    """The active club's id, or None when nothing is scoped. Also the default club of new rows."""
+    club = _club_id.get()
+    return club.id if isinstance(club, _HostClub) else club
+
+
+@contextmanager
+def using(club_id):
+    """Run the block as club_id, or installation-wide for None."""
+    token = _club_id.set(club_id)
+    try:
+        yield
+    finally:
+        _club_id.reset(token)
+
+
+def scope(queryset, prefix):
+    """Limit a queryset of a shared model to the active club through the club field at prefix."""
+    club_id = current_club_id()
+    return queryset if club_id is None else queryset.filter(**{f'{prefix}club_id': club_id})
+
+
+def cache_key(key):
+    """key in the active club's cache namespace, for anything cached from club data."""
+    club_id = current_club_id()
+    return key if club_id is None else f'club:{club_id}:{key}'
+
+
+class TenantManager(models.Manager):
+    """Only the active club's rows. Models keep an unscoped all_objects for installation-wide work."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        club_id = current_club_id()
+        return queryset if club_id is None else queryset.filter(club_id=club_id)
+
+
+def club_domains():
+    """host -> club id, cached since most requests need it. Club saves clear it."""
+    domains = cache.get(DOMAINS_KEY)
+    if domains is None:
+        from .models import Club
+        domains = dict(Club.objects.values_list('domain', 'pk'))
+        cache.set(DOMAINS_KEY, domains, timeout=DOMAINS_TTL)
+    return domains
+
+
+def forget_domains():
+    cache.delete(DOMAINS_KEY)
+
+
+class TenantMiddleware:
+    """Runs the request as the club of its host. Pages that read no club data never look it up."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        club = _HostClub(split_domain_port(request.get_host())[0])
+        if not settings.TENANT_FALLBACK and club.id is None:
+            # Operators set up clubs in the admin and scrape metrics from hosts of their own
+            if not request.path.startswith((reverse('admin:index'), reverse('metrics'))):
+                raise Http404('Unknown club')
+        with using(club):
+            return self.get_response(request)
+
+
+class ClubMemberBackend(ModelBackend):
+    """
+    Only lets users log in on their own club's site, which needs a profile in that club.
+    Superusers see every club's data, so they only log in on installation-wide hosts.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        club_id = current_club_id()
+        if user is None or club_id is None:
+            return user
+        if user.is_superuser:
+            return None
+        from .models import PilotProfile
+        return user if PilotProfile.all_objects.filter(user=user, club_id=club_id).exists() else None
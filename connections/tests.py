@@ -1,3 +1,1432 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import os
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import EstimatedCountPaginator, estimated_rows
+from .directory import directory_queryset
+from .feed import build_feeds, feed_for
+from .ical import fold
+from .logbook import recompute_pilots
+from .logs import JsonFormatter
+from .management.commands.load_airport_data import skipped_rows
+from .forms import RentalSlotForm
+from .aggregates import recompute_all
+from .attendance import attend, attending_event_ids, unattend
+from . import metrics, ratelimit, tenancy
+from .models import AirportData, AirportStats, ArchivedMessage, Club, FlightTimeRollup, HomeFeed, LogbookEntry, StateStats, PilotProfile, Aircraft, RentalSlot, PilotEvent, EventRSVP, Message
+from .rentals import SlotUnavailable, add_slot, available_slots, book_slot
+from .startup import group_by_package, parse_importtime
+from .weather import Conditions, StubWeatherProvider, WeatherProvider, conditions_for, refresher
+
+
+def make_airport(icao, state, latitude=0.0, longitude=0.0):
+    return AirportData.objects.create(
+        iata=icao[1:], icao=icao, airport=f'{icao} Airport', city='City', state=state,
+        latitude=latitude, longitude=longitude,
+    )
+
+
+def make_pilot(username, home_airport=None, **flags):
+    user = User.objects.create_user(username=username, password='pass12345')
+    PilotProfile.objects.create(user=user, home_airport=home_airport, **flags)
+    return user
+
+
+class DirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.kdef = make_airport('KDEF', 'OH', 40.5, -83.0)
+        cls.kxyz = make_airport('KXYZ', 'TX', 30.0, -97.0)
+        cls.me = make_pilot('me', cls.kabc)
+        cls.near = make_pilot('near', cls.kabc, safety_pilot_need_vfr_single_engine=True)
+        cls.state = make_pilot('state', cls.kdef, safety_pilot_offer_ifr_multi_engine=True, instructor_offer_cfi=True)
+        cls.far = make_pilot('far', cls.kxyz, safety_pilot_need_ifr_single_engine=True, rent_offer_multi_engine=True)
+
+    def usernames(self, queryset):
+        return [getattr(obj, 'username', None) or obj.user.username for obj in queryset]
+
+    def test_role_and_direction_select_flags(self):
+        self.assertEqual(self.usernames(directory_queryset('safety', 'need', 'all')), ['far', 'near'])
+        self.assertEqual(self.usernames(directory_queryset('safety', 'offer', 'all')), ['state'])
+        self.assertEqual(self.usernames(directory_queryset('rental', 'offer', 'all')), ['far'])
+
+    def test_scopes(self):
+        self.assertEqual(self.usernames(directory_queryset('safety', 'need', 'state', home_airport=self.kabc)), ['near'])
+        self.assertEqual(self.usernames(directory_queryset('instructor', 'offer', 'airport', home_airport=self.kabc)), [])
+        self.assertEqual(
+            self.usernames(directory_queryset('pilot', 'any', 'radius', home_airport=self.kabc, radius_nm=50)),
+            ['me', 'near', 'state'],
+        )
+        self.assertEqual(
+            self.usernames(directory_queryset('pilot', 'any', 'radius', home_airport=self.kabc, radius_nm=20)),
+            ['me', 'near'],
+        )
+
+    def test_unknown_directory(self):
+        with self.assertRaises(ValueError):
+            directory_queryset('safety', 'any', 'all')
+        with self.assertRaises(ValueError):
+            directory_queryset('safety', 'need', 'galaxy')
+
+    def test_legacy_urls_render_in_constant_queries(self):
+        self.client.force_login(self.me)
+        for name in ('safety_pilot_list', 'safety_pilot_list_by_state', 'instructor_list_offering_by_home_airport',
+                     'user_list', 'user_list_by_state', 'users_same_airport'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200, name)
+
+        for i in range(10):
+            make_pilot(f'extra{i}', self.kdef, safety_pilot_need_vfr_single_engine=True)
+        url = reverse('directory', args=['safety', 'need', 'state'])
+        # session, user, own profile, count, page
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, 'extra9')
+
+    def test_scope_without_home_airport_redirects(self):
+        user = make_pilot('nohome')
+        self.client.force_login(user)
+        response = self.client.get(reverse('directory', args=['safety', 'need', 'airport']))
+        self.assertRedirects(response, reverse('update_pilot_profile'))
+        response = self.client.get(reverse('directory', args=['safety', 'sideways', 'all']))
+        self.assertEqual(response.status_code, 404)
+
+
+class RentalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.kxyz = make_airport('KXYZ', 'TX', 30.0, -97.0)
+        cls.owner = make_pilot('owner', cls.kabc)
+        cls.renter = make_pilot('renter', cls.kabc)
+        cls.other = make_pilot('other', cls.kabc)
+        cls.twin = Aircraft.objects.create(
+            owner=cls.owner.pilotprofile, home_airport=cls.kabc, tail_number='N2TWN',
+            make_model='Baron', engine_class=Aircraft.MULTI_ENGINE,
+        )
+        cls.single = Aircraft.objects.create(
+            owner=cls.owner.pilotprofile, home_airport=cls.kxyz, tail_number='N1SGL', make_model='Skyhawk',
+        )
+        cls.now = timezone.now()
+        cls.twin_slot = RentalSlot.objects.create(aircraft=cls.twin, start=cls.now, end=cls.now + timedelta(hours=8))
+        cls.single_slot = RentalSlot.objects.create(aircraft=cls.single, start=cls.now, end=cls.now + timedelta(hours=8))
+
+    def test_available_slots_cover_window_near_airport(self):
+        start, end = self.now + timedelta(hours=1), self.now + timedelta(hours=3)
+        self.assertEqual(list(available_slots(start, end)), [self.twin_slot, self.single_slot])
+        self.assertEqual(list(available_slots(start, end, engine_class=Aircraft.MULTI_ENGINE, near=self.kabc)), [self.twin_slot])
+        self.assertEqual(list(available_slots(start, end, near=self.kxyz)), [self.single_slot])
+        self.assertEqual(list(available_slots(start, self.now + timedelta(hours=9))), [])
+
+    def test_slot_is_booked_once(self):
+        book_slot(self.twin_slot.pk, self.renter)
+        with self.assertRaises(SlotUnavailable):
+            book_slot(self.twin_slot.pk, self.other)
+        self.twin_slot.refresh_from_db()
+        self.assertEqual(self.twin_slot.booked_by, self.renter)
+        self.assertNotIn(self.twin_slot, available_slots(self.now, self.now + timedelta(hours=1)))
+
+    def test_overlapping_slot_rejected(self):
+        form = RentalSlotForm(data={
+            'aircraft': self.twin.pk,
+            'start': self.now + timedelta(hours=7),
+            'end': self.now + timedelta(hours=10),
+        }, owner=self.owner.pilotprofile)
+        self.assertFalse(form.is_valid())
+
+    def test_add_slot_rechecks_overlap(self):
+        # As if another request added the slot after this one's form was validated
+        slot = RentalSlot(aircraft=self.twin, start=self.now + timedelta(hours=7), end=self.now + timedelta(hours=10))
+        with self.assertRaises(SlotUnavailable):
+            add_slot(slot)
+        self.assertIsNone(slot.pk)
+        add_slot(RentalSlot(aircraft=self.twin, start=self.now + timedelta(hours=8), end=self.now + timedelta(hours=10)))
+        self.assertEqual(self.twin.rental_slots.count(), 2)
+
+    def test_search_and_book_views(self):
+        self.client.force_login(self.renter)
+        response = self.client.get(reverse('rental_search'), {
+            'airport': 'kabc',
+            'start': (self.now + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+            'end': (self.now + timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M'),
+        })
+        self.assertContains(response, 'N2TWN')
+        self.assertNotContains(response, 'N1SGL')
+
+        response = self.client.post(reverse('book_rental_slot', args=[self.twin_slot.pk]))
+        self.assertRedirects(response, reverse('rental_search'))
+        self.assertTrue(RentalSlot.objects.get(pk=self.twin_slot.pk).is_booked)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.kdef = make_airport('KDEF', 'OH', 40.5, -83.0)
+        cls.kxyz = make_airport('KXYZ', 'TX', 30.0, -97.0)
+        cls.host = make_pilot('host', cls.kabc, instructor_offer_cfi=True)
+        cls.event = PilotEvent.objects.create(
+            event_name='Fly-in', event_start_date=timezone.localdate(), event_finish_date=timezone.localdate(),
+            host_airport=cls.kdef, host_name=cls.host, event_description='Pancakes',
+        )
+
+    def test_field_selection_and_keyset_pagination(self):
+        url = reverse('api_airports')
+        response = self.client.get(url, {'fields': 'icao,state', 'limit': 2})
+        data = response.json()
+        self.assertEqual(data['results'], [{'icao': 'KABC', 'state': 'OH'}, {'icao': 'KDEF', 'state': 'OH'}])
+        data = self.client.get(data['next']).json()
+        self.assertEqual(data, {'results': [{'icao': 'KXYZ', 'state': 'TX'}], 'next': None})
+
+        response = self.client.get(url, {'fields': 'icao,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_events_by_state(self):
+        data = self.client.get(reverse('api_events'), {'state': 'OH', 'fields': 'name,host_airport,host'}).json()
+        self.assertEqual(data['results'], [{'name': 'Fly-in', 'host_airport': 'KDEF', 'host': 'host'}])
+        data = self.client.get(reverse('api_events'), {'state': 'TX'}).json()
+        self.assertEqual(data['results'], [])
+
+    def test_conditional_get_skips_main_tables(self):
+        url = reverse('api_events')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        # Only the version counters are read to answer a matching If-None-Match
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.event.event_name = 'Fly-in breakfast'
+        self.event.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_the_date(self):
+        url = reverse('api_events')
+        etag = self.client.get(url)['ETag']
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('connections.api.timezone.localdate', return_value=tomorrow):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            # Nothing but the ETag decides, the tables haven't changed since yesterday
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+            self.assertEqual(response.status_code, 200)
+
+    def test_directory_requires_login(self):
+        url = reverse('api_directory', args=['instructor', 'offer', 'state'])
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.host)
+        data = self.client.get(url, {'fields': 'username,home_airport,instructor_offer_cfi'}).json()
+        self.assertEqual(data['results'], [{'username': 'host', 'home_airport': 'KABC', 'instructor_offer_cfi': True}])
+
+
+class BulkImportExportTests(TestCase):
+    def setUp(self):
+        self.kabc = make_airport('KABC', 'OH')
+        self.club = Club.objects.create(name='Alpha Flyers', slug='alpha', domain='alpha.example.com')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def path(self, name, content=None):
+        path = os.path.join(self.tmpdir.name, name)
+        if content is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        return path
+
+    def test_import_pilots_and_events(self):
+        pilots = self.path('pilots.csv', (
+            'username,email,home_airport,flight_hours,instrument_rating,safety_pilot_offer_ifr_single_engine\n'
+            'alice,alice@example.com,kabc,120,true,yes\n'
+            'bob,,KZZZ,,false,\n'
+            'alice,,,,,\n'
+        ))
+        call_command('import_pilots', pilots, '--chunk-size', '2', '--club', 'alpha', stdout=StringIO())
+        alice = PilotProfile.objects.select_related('user').get(user__username='alice')
+        self.assertEqual((alice.home_airport, alice.flight_hours), (self.kabc, 120))
+        self.assertTrue(alice.instrument_rating and alice.safety_pilot_offer_ifr_single_engine)
+        self.assertFalse(alice.user.has_usable_password())
+        self.assertIsNone(PilotProfile.objects.get(user__username='bob').home_airport)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(set(PilotProfile.all_objects.values_list('club', flat=True)), {self.club.pk})
+        with self.assertRaises(CommandError):
+            call_command('import_pilots', pilots, '--club', 'nowhere', stdout=StringIO())
+
+        with tenancy.using(None):
+            make_pilot('outsider')
+        events = self.path('events.ndjson', (
+            '{"event_name": "Fly-in", "event_start_date": "2030-05-01", "host_airport": "KABC", "host": "alice"}\n'
+            '{"event_name": "Orphan", "event_start_date": "2030-05-01", "host": "nobody"}\n'
+            '{"event_name": "Elsewhere", "event_start_date": "2030-05-01", "host": "outsider"}\n'
+            '{"event_name": "Backwards", "event_start_date": "2030-05-02", "event_finish_date": "2030-05-01", "host": "alice"}\n'
+        ))
+        err = StringIO()
+        call_command('import_events', events, '--club', 'alpha', stdout=StringIO(), stderr=err)
+        event = PilotEvent.objects.get()
+        self.assertEqual((event.event_name, event.host_airport, event.host_name.username, event.club), ('Fly-in', self.kabc, 'alice', self.club))
+        self.assertIn("Line 4: event 'Backwards'", err.getvalue())
+
+    def test_bad_rows_are_reported_by_line(self):
+        with tenancy.using(self.club.pk):
+            make_pilot('alice')
+        for command, content, error in [
+            ('import_pilots', '{"username": 42}\n', 'Line 1: invalid username 42'),
+            ('import_pilots', '{"username": "ok"}\n{"username": "neg", "flight_hours": -5}\n', 'Line 2: invalid flight_hours for neg: -5'),
+            ('import_events', '{"event_name": "Undated", "event_start_date": null, "host": "alice"}\n', "Line 1: invalid dates for event 'Undated'"),
+            ('import_events', '{"event_name": "Undated", "host": "alice"}\n', "Line 1: invalid dates for event 'Undated'"),
+            ('import_events', '{"event_name": "Fly-in", "event_start_date": "2030-05-01", "host": ["alice"]}\n', "Line 1: invalid host ['alice']"),
+        ]:
+            with self.subTest(content=content):
+                with self.assertRaisesMessage(CommandError, error):
+                    call_command(command, self.path('rows.ndjson', content), '--club', 'alpha', stdout=StringIO())
+        # Nothing from a chunk with a bad row is written
+        self.assertFalse(User.objects.filter(username='ok').exists())
+
+        err, out = StringIO(), StringIO()
+        events = self.path('events.ndjson', (
+            '{"event_name": "Fly-in", "event_start_date": "2030-05-01", "host_airport": "KABC", "second_airport": "kzzz", "host": "alice"}\n'
+        ))
+        call_command('import_events', events, '--club', 'alpha', stdout=out, stderr=err)
+        self.assertIn("Line 1: unknown second_airport KZZZ for event 'Fly-in'", err.getvalue())
+        self.assertIn('1 airports were unknown', out.getvalue())
+        self.assertEqual(PilotEvent.all_objects.get().host_airport, self.kabc)
+
+    def test_export_round_trip(self):
+        with tenancy.using(self.club.pk):
+            make_pilot('carol', self.kabc, flight_hours=42, instructor_offer_cfi=True)
+        make_pilot('dave', self.kabc)
+        for fmt in ('csv', 'ndjson'):
+            exported = self.path(f'pilots.{fmt}')
+            call_command('export_pilots', exported, '--club', 'alpha', stdout=StringIO())
+            with open(exported, encoding='utf-8') as f:
+                self.assertNotIn('dave', f.read())
+            User.objects.filter(username='carol').delete()
+            call_command('import_pilots', exported, '--club', 'alpha', stdout=StringIO())
+            carol = PilotProfile.objects.get(user__username='carol')
+            self.assertEqual((carol.home_airport, carol.flight_hours, carol.instructor_offer_cfi, carol.club), (self.kabc, 42, True, self.club))
+            self.assertEqual(User.objects.count(), 2)
+
+
+class AirportDataTests(TestCase):
+    def test_sheet_rows_without_a_unique_code_are_skipped(self):
+        self.assertEqual(skipped_rows(['KABC', '', 'KDEF', 'KABC']), {
+            2: 'ICAO code KABC appears 2 times in the sheet',
+            3: 'it has no ICAO code',
+            5: 'ICAO code KABC appears 2 times in the sheet',
+        })
+
+    def test_the_most_used_duplicate_keeps_its_code(self):
+        choose_keepers = importlib.import_module('connections.migrations.0004_dedupe_airport_icao').choose_keepers
+        self.assertEqual(
+            choose_keepers({'KABC': [3, 5, 9], 'KDEF': [4, 7], 'KXYZ': [2, 8]}, Counter({5: 2, 9: 2, 7: 1})),
+            {'KABC': 5, 'KDEF': 7, 'KXYZ': 2},
+        )
+
+    def test_event_dates_are_checked_by_the_database(self):
+        host = make_pilot('host')
+        today = timezone.localdate()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PilotEvent.objects.create(
+                event_name='Backwards', event_start_date=today, event_finish_date=today - timedelta(days=1),
+                host_name=host, event_description='',
+            )
+        PilotEvent.objects.create(event_name='Day trip', event_start_date=today, event_finish_date=today, host_name=host, event_description='')
+
+
+class DedupeAirportMigrationTests(TransactionTestCase):
+    before = [('connections', '0003_tableversion')]
+    after = [('connections', '0004_dedupe_airport_icao')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_the_referenced_airport_keeps_the_code(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        AirportData = apps.get_model('connections', 'AirportData')
+        first, used, other = [
+            AirportData.objects.create(icao='KGCD', airport=name, iata='', city='', state='OR', latitude=0, longitude=0)
+            for name in ('Grant County', 'Grant County Regional', 'Grant Co.')
+        ]
+        user = apps.get_model('auth', 'User').objects.create(username='pilot')
+        apps.get_model('connections', 'PilotProfile').objects.create(user=user, home_airport=used)
+
+        executor = MigrationExecutor(connection)
+        with self.assertLogs('connections.migrations.0004_dedupe_airport_icao', 'WARNING') as logs:
+            executor.migrate(self.after)
+        self.assertEqual(dict(AirportData.objects.values_list('pk', 'icao')), {first.pk: '', used.pk: 'KGCD', other.pk: ''})
+        self.assertIn(f'{first.pk} (KGCD Grant County)', logs.output[0])
+
+
+# The welcome page links static files, which the manifest storage can't resolve before collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SyntheticLoadTests(TestCase):
+    def test_seed_and_drive_every_url(self):
+        for i, state in enumerate(['OH', 'TX', 'CA']):
+            make_airport(f'K{state}A', state, 30.0 + i, -90.0)
+            make_airport(f'K{state}B', state, 30.2 + i, -90.1)
+
+        call_command('seed_synthetic', pilots=40, events=10, messages=100, seed=3, stdout=StringIO())
+        self.assertEqual(PilotProfile.objects.count(), 40)
+        self.assertEqual(PilotEvent.objects.count(), 10)
+        self.assertEqual(Message.objects.count(), 100)
+
+        out = StringIO()
+        call_command('load_test', iterations=2, seed=3, fail_on_error=True, stdout=out, stderr=StringIO())
+        self.assertIn('safety_pilot_list', out.getvalue())
+        self.assertNotIn('delete_pilot_event', out.getvalue())
+
+        # Every view's queries are served from indexes
+        call_command('explain_views', fail_on_scan=True, stdout=StringIO(), stderr=StringIO())
+
+
+class AuthHotPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_pilot('pilot')
+
+    def test_login_authenticates_once(self):
+        with mock.patch.object(ModelBackend, 'authenticate', autospec=True, side_effect=ModelBackend.authenticate) as authenticate:
+            response = self.client.post(reverse('login'), {'username': 'pilot', 'password': 'pass12345'})
+        self.assertRedirects(response, reverse('home'))
+        self.assertEqual(authenticate.call_count, 1)
+
+    def test_login_required_redirects_to_login(self):
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('home')}")
+
+    def test_cached_sessions_skip_session_table(self):
+        for engine in ('django.contrib.sessions.backends.cached_db', 'django.contrib.sessions.backends.signed_cookies'):
+            with self.subTest(engine=engine), override_settings(SESSION_ENGINE=engine):
+                client = self.client_class()
+                client.post(reverse('login'), {'username': 'pilot', 'password': 'pass12345'})
+                client.get(reverse('home'))
+                with CaptureQueriesContext(connection) as captured:
+                    client.get(reverse('home'))
+                self.assertFalse([q for q in captured.captured_queries if 'django_session' in q['sql']])
+
+
+class AttendanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.host = make_pilot('host', cls.kabc)
+        cls.guest = make_pilot('guest', cls.kabc)
+
+    def make_events(self, count):
+        today = timezone.localdate()
+        return [
+            PilotEvent.objects.create(
+                event_name=f'Fly-in {PilotEvent.objects.count()}', event_start_date=today, event_finish_date=today,
+                host_airport=self.kabc, host_name=self.host, event_description='Pancakes',
+            )
+            for _ in range(count)
+        ]
+
+    def test_counts_follow_rsvps(self):
+        event, other = self.make_events(2)
+        self.assertTrue(attend(event, self.guest))
+        self.assertFalse(attend(event, self.guest))
+        attend(event, self.host)
+        attend(other, self.guest)
+        event.refresh_from_db()
+        self.assertEqual(event.attendee_count, 2)
+        self.assertEqual(attending_event_ids(self.guest, [event, other]), {event.pk, other.pk})
+
+        self.assertTrue(unattend(event, self.guest))
+        self.assertFalse(unattend(event, self.guest))
+        event.refresh_from_db()
+        self.assertEqual(event.attendee_count, 1)
+        self.assertEqual(EventRSVP.objects.filter(user=self.guest).count(), 1)
+
+    def test_event_list_queries_do_not_grow_with_events(self):
+        self.client.force_login(self.guest)
+        for event in self.make_events(3):
+            attend(event, self.guest)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('event_list'))
+
+        for event in self.make_events(30):
+            attend(event, self.host)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('event_list'))
+        self.assertEqual(len(many.captured_queries), len(few.captured_queries))
+        self.assertContains(response, 'Attending', count=3)
+
+    def test_rsvp_view(self):
+        event, = self.make_events(1)
+        url = reverse('rsvp_pilot_event', args=[event.pk])
+        self.client.force_login(self.guest)
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('view_pilot_event', args=[event.event_name]))
+        self.assertContains(self.client.get(response.url), "Who's Coming (1)")
+
+        self.client.post(url, {'attending': 'no', 'next': 'https://example.com/'})
+        event.refresh_from_db()
+        self.assertEqual(event.attendee_count, 0)
+
+
+class ActivityAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.kdef = make_airport('KDEF', 'OH', 40.5, -83.0)
+        cls.kxyz = make_airport('KXYZ', 'TX', 30.0, -97.0)
+
+    def snapshot(self):
+        return (
+            sorted(AirportStats.objects.filter(scope=0).values_list('airport_id', 'pilots', 'safety_need', 'instructors', 'upcoming_events')),
+            sorted(StateStats.objects.filter(scope=0).values_list('state', 'airports', 'pilots', 'safety_need', 'upcoming_events')),
+        )
+
+    def test_signals_keep_aggregates_current(self):
+        host = make_pilot('host', self.kabc, safety_pilot_need_ifr_single_engine=True, flight_instructor_cfi=True)
+        mover = make_pilot('mover', self.kabc)
+        today = timezone.localdate()
+        PilotEvent.objects.create(
+            event_name='Fly-in', event_start_date=today, event_finish_date=today,
+            host_airport=self.kabc, second_airport=self.kdef, third_airport=self.kdef,
+            host_name=host, event_description='Pancakes',
+        )
+        PilotEvent.objects.create(
+            event_name='Last year', event_start_date=today - timedelta(days=365), event_finish_date=today - timedelta(days=365),
+            host_airport=self.kxyz, host_name=host, event_description='Over',
+        )
+        self.assertEqual(AirportStats.objects.get(scope=0, airport=self.kabc).pilots, 2)
+
+        profile = mover.pilotprofile
+        profile.home_airport = self.kxyz
+        profile.save()
+        self.assertEqual(self.snapshot(), (
+            [(self.kabc.pk, 1, 1, 1, 1), (self.kdef.pk, 0, 0, 0, 1), (self.kxyz.pk, 1, 0, 0, 0)],
+            [('OH', 2, 1, 1, 2), ('TX', 1, 1, 0, 0)],
+        ))
+
+        incremental = self.snapshot()
+        recompute_all()
+        self.assertEqual(self.snapshot(), incremental)
+
+        mover.delete()
+        self.assertFalse(AirportStats.objects.filter(airport=self.kxyz).exists())
+        self.assertFalse(StateStats.objects.filter(state='TX').exists())
+
+    def test_saves_of_uncounted_fields_skip_the_refresh(self):
+        profile = make_pilot('me', self.kabc).pilotprofile
+        with CaptureQueriesContext(connection) as queries:
+            profile.update_last_activity()
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('SELECT "connections_pilotprofile"', sql)
+        self.assertNotIn('connections_airportstats', sql)
+
+        profile.instrument_rating = True
+        profile.save(update_fields=['instrument_rating'])
+        self.assertEqual(AirportStats.objects.get(scope=0, airport=self.kabc).instrument_rated, 1)
+
+    def test_detail_and_heatmap_read_aggregates(self):
+        self.client.force_login(make_pilot('me', self.kabc, safety_pilot_need_vfr_single_engine=True))
+        for i in range(5):
+            make_pilot(f'near{i}', self.kdef, safety_pilot_need_vfr_single_engine=True)
+
+        # session, user, airport, airport stats, state stats; the club domains are cached
+        tenancy.club_domains()
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('airport_detail', args=[self.kdef.pk]))
+        self.assertIn(('Need a safety pilot', 5, 6), response.context['rows'])
+
+        data = self.client.get(reverse('api_activity'), {'metric': 'safety_need'}).json()
+        self.assertEqual(data['max'], 5)
+        self.assertEqual([(point['icao'], point['value']) for point in data['points']], [('KABC', 1), ('KDEF', 5)])
+        data = self.client.get(reverse('api_activity'), {'metric': 'pilots', 'level': 'state'}).json()
+        self.assertEqual(data['points'], [{'state': 'OH', 'value': 6}])
+        self.assertEqual(self.client.get(reverse('api_activity'), {'metric': 'comments'}).status_code, 400)
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    RATE_LIMITS={
+        'send_message': {'user': (3, 60), 'recipient': (5, 60)},
+        'send_reply': {'user': (3, 60), 'recipient': (5, 60)},
+    },
+)
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sender = make_pilot('sender')
+        cls.recipient = make_pilot('recipient')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.sender)
+
+    def send(self):
+        url = reverse('send_message', args=[self.recipient.pk])
+        return self.client.post(url, {'subject': 'Hi', 'content': 'Safety pilot?', 'recipient': self.recipient.pk})
+
+    def test_burst_rejected_before_any_insert(self):
+        for _ in range(3):
+            self.assertEqual(self.send().status_code, 302)
+
+        # session and user only, the view body never runs
+        with self.assertNumQueries(2):
+            response = self.send()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Message.objects.count(), 3)
+
+        # The form itself is not limited
+        self.assertEqual(self.client.get(reverse('send_message', args=[self.recipient.pk])).status_code, 200)
+
+    def test_buckets_refill_and_limit_per_recipient(self):
+        with mock.patch('connections.ratelimit.time.time', return_value=1000.0):
+            for _ in range(3):
+                self.send()
+            self.assertEqual(self.send().status_code, 429)
+        # 3 tokens a minute, one is back after 20 seconds
+        with mock.patch('connections.ratelimit.time.time', return_value=1020.5):
+            self.assertEqual(self.send().status_code, 302)
+            self.assertEqual(self.send().status_code, 429)
+
+        # Many senders writing to one recipient hit the recipient bucket
+        cache.clear()
+        statuses = []
+        for i in range(6):
+            self.client.force_login(make_pilot(f'fan{i}'))
+            statuses.append(self.send().status_code)
+        self.assertEqual(statuses, [302] * 5 + [429])
+        self.assertIn(('send_message', 'recipient', 5, 1), ratelimit.counters())
+
+    def test_reply_limited_per_recipient(self):
+        original = Message.objects.create(sender=self.recipient, recipient=self.sender, subject='Hi', content='Hello')
+        url = reverse('send_reply', args=[original.pk])
+        statuses = [self.client.post(url, {'subject': 'Re: Hi', 'content': 'Sure', 'recipient': self.recipient.pk}).status_code for _ in range(4)]
+        self.assertEqual(statuses, [302, 302, 302, 429])
+
+    def test_rejected_reply_charges_neither_bucket(self):
+        original = Message.objects.create(sender=self.recipient, recipient=self.sender, subject='Hi', content='Hello')
+        for _ in range(5):
+            ratelimit.consume('send_reply', {'recipient': self.recipient.pk})
+        response = self.client.post(reverse('send_reply', args=[original.pk]), {'subject': 'Re: Hi', 'content': 'Sure', 'recipient': self.recipient.pk})
+        self.assertEqual(response.status_code, 429)
+        # The sender's own bucket is still full
+        self.assertEqual([ratelimit.consume('send_reply', {'user': self.sender.pk}) for _ in range(3)], [0, 0, 0])
+
+    def test_counters_in_admin(self):
+        self.send()
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:connections_message_changelist'))
+        self.assertContains(response, 'Rate limits')
+        self.assertIn(('send_message', 'user', 1, 0), response.context['rate_limit_counters'])
+
+
+class ArchiveMessagesTests(TestCase):
+    def setUp(self):
+        self.alice = make_pilot('alice')
+        self.bob = make_pilot('bob')
+        self.recent = self.message('recent', days_ago=1)
+        self.old = self.message('old', days_ago=400)
+        self.half_deleted = self.message('half deleted', days_ago=1, deleted_by=[self.alice])
+        self.both_deleted = self.message('both deleted', days_ago=1, deleted_by=[self.alice, self.bob])
+
+    def message(self, subject, days_ago, deleted_by=()):
+        message = Message.objects.create(sender=self.alice, recipient=self.bob, subject=subject, content='Hello')
+        Message.objects.filter(pk=message.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        message.deleted_for_user.add(*deleted_by)
+        return message
+
+    def test_archive_to_table_in_batches(self):
+        out = StringIO()
+        call_command('archive_messages', '--dry-run', stdout=out)
+        self.assertIn('2 messages would be archived', out.getvalue())
+
+        out = StringIO()
+        call_command('archive_messages', '--batch-size', '1', stdout=out, stderr=StringIO())
+        self.assertIn('Archived 2 rows', out.getvalue())
+        self.assertEqual(set(Message.objects.values_list('subject', flat=True)), {'recent', 'half deleted'})
+        self.assertEqual(
+            dict(ArchivedMessage.objects.values_list('id', 'reason')),
+            {self.old.pk: ArchivedMessage.AGE, self.both_deleted.pk: ArchivedMessage.DELETED},
+        )
+        self.assertEqual(Message.deleted_for_user.through.objects.count(), 1)
+
+    def test_archive_to_file(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'archive.ndjson.gz')
+        call_command('archive_messages', '--days', '0', '--to-file', path, '--no-compact', stdout=StringIO())
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[0]['subject'], 'recent')
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(ArchivedMessage.objects.exists())
+
+    def test_archive_file_is_durable_after_each_batch(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'archive.ndjson.gz')
+        existing = set(Message.objects.values_list('pk', flat=True))
+
+        def crash(seconds):
+            # Read what is on disk mid-run, as after a kill, then stop the run
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                archived = {json.loads(line)['id'] for line in f}
+            deleted = existing - set(Message.objects.values_list('pk', flat=True))
+            self.assertTrue(deleted)
+            self.assertLessEqual(deleted, archived)
+            raise KeyboardInterrupt
+
+        with mock.patch('connections.management.commands.archive_messages.time.sleep', side_effect=crash):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('archive_messages', '--days', '0', '--to-file', path, '--batch-size', '2', '--pause', '1', stdout=StringIO())
+
+
+class StartupTests(TestCase):
+    def test_parse_importtime(self):
+        modules = parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     django.utils.text\n'
+            'import time:       300 |        420 |   django.utils\n'
+            'import time:        80 |         80 | connections\n'
+        )
+        self.assertEqual(modules[0], ('django.utils.text', 120, 120, 2))
+        self.assertEqual(group_by_package(modules), {'django': (420, 2), 'connections': (80, 1)})
+
+    def test_app_imports_no_heavy_dependencies(self):
+        out = StringIO()
+        call_command('audit_imports', '--fail-on-heavy', '--module', 'connections.management.commands.load_airport_data', stdout=out)
+        self.assertIn('connections', out.getvalue())
+
+        out = StringIO()
+        call_command('benchmark_cold_start', '--runs', '1', '--json', stdout=out)
+        result = json.loads(out.getvalue())
+        self.assertEqual(result['status'], ['200'])
+        self.assertGreater(result['phases']['process']['p50_ms'], result['phases']['setup']['p50_ms'])
+
+
+class CountingWeatherProvider(WeatherProvider):
+    calls = []
+    down = False
+
+    def fetch(self, icaos):
+        self.calls.append(sorted(icaos))
+        if self.down:
+            raise OSError('Provider unavailable')
+        return {icao: Conditions(icao=icao, flight_category='IFR' if icao == 'KIFR' else 'VFR') for icao in icaos if icao != 'KNONE'}
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+    WEATHER_PROVIDER='connections.tests.CountingWeatherProvider',
+)
+class WeatherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        CountingWeatherProvider.calls = []
+        CountingWeatherProvider.down = False
+
+    def test_batched_and_cached(self):
+        conditions = conditions_for(['kabc', 'KIFR', 'KNONE', 'KABC', ''])
+        self.assertEqual(CountingWeatherProvider.calls, [['KABC', 'KIFR', 'KNONE']])
+        self.assertEqual({icao: c.flight_category for icao, c in conditions.items()}, {'KABC': 'VFR', 'KIFR': 'IFR'})
+
+        # Reports and misses are both cached, only the new airport is fetched
+        conditions_for(['KABC', 'KIFR', 'KNONE', 'KNEW'])
+        self.assertEqual(CountingWeatherProvider.calls[1:], [['KNEW']])
+
+    def test_stale_served_while_refreshing(self):
+        with mock.patch('connections.weather.time.time', return_value=1000.0):
+            conditions_for(['KABC'])
+        with mock.patch('connections.weather.time.time', return_value=1000.0 + 700):
+            self.assertIn('KABC', conditions_for(['KABC']))
+            refresher.join(5)
+        self.assertEqual(CountingWeatherProvider.calls, [['KABC'], ['KABC']])
+
+    def test_failed_fetch_keeps_stale_reports_and_backs_off(self):
+        with mock.patch('connections.weather.time.time', return_value=1000.0):
+            conditions_for(['KABC'])
+        CountingWeatherProvider.down = True
+        with mock.patch('connections.weather.time.time', return_value=1000.0 + 700), self.assertLogs('connections.weather', 'WARNING'):
+            conditions_for(['KABC'])
+            refresher.join(5)
+            # Still shown, and not asked for again until the back-off passes
+            self.assertIn('KABC', conditions_for(['KABC']))
+            self.assertEqual(conditions_for(['KNEW']), {})
+            self.assertEqual(conditions_for(['KNEW']), {})
+        self.assertEqual(CountingWeatherProvider.calls, [['KABC'], ['KABC'], ['KNEW']])
+
+    def test_event_list_fetches_once_per_page(self):
+        host = make_pilot('host')
+        today = timezone.localdate()
+        for i, icao in enumerate(['KABC', 'KIFR', 'KDEF']):
+            PilotEvent.objects.create(
+                event_name=f'Fly-in {i}', event_start_date=today, event_finish_date=today,
+                host_airport=make_airport(icao, 'OH'), host_name=host, event_description='Pancakes',
+            )
+        response = self.client.get(reverse('event_list'))
+        self.assertEqual(CountingWeatherProvider.calls, [['KABC', 'KDEF', 'KIFR']])
+        self.assertContains(response, '>IFR</span>')
+        self.client.get(reverse('event_list'))
+        self.assertEqual(len(CountingWeatherProvider.calls), 1)
+
+        # Without a provider no conditions are shown
+        cache.clear()
+        with self.settings(WEATHER_PROVIDER=''):
+            self.assertNotContains(self.client.get(reverse('event_list')), '>IFR</span>')
+        self.assertEqual(len(CountingWeatherProvider.calls), 1)
+
+    def test_fresh_pages_make_one_cache_read(self):
+        conditions_for(['KABC', 'KIFR'])
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            conditions_for(['KABC', 'KIFR'])
+        get_many.assert_called_once_with(['weather:KABC', 'weather:KIFR'])
+
+    def test_only_the_directory_template_fetches_conditions(self):
+        me = make_pilot('me', make_airport('KABC', 'OH'), safety_pilot_need_vfr_single_engine=True)
+        self.client.force_login(me)
+        self.client.get(reverse('safety_pilot_list'))
+        self.assertEqual(CountingWeatherProvider.calls, [])
+        self.client.get(reverse('directory', args=['safety', 'need', 'all']))
+        self.assertEqual(CountingWeatherProvider.calls, [['KABC']])
+
+    def test_stub_reads_reports_from_file(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'metars.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'kabc': {'ceiling_ft': 700, 'visibility_sm': 5.0, 'raw': 'KABC 121853Z OVC007'},
+                'kxyz': {'icao': 'kxyz', 'flight_category': 'VFR'},
+            }, f)
+        fetched = StubWeatherProvider(path).fetch(['KABC', 'KDEF', 'KXYZ'])
+        self.assertEqual(list(fetched), ['KABC', 'KXYZ'])
+        self.assertEqual(fetched['KABC'].flight_category, 'IFR')
+        self.assertEqual(fetched['KXYZ'].icao, 'KXYZ')
+        self.assertEqual(StubWeatherProvider().fetch(['KDEF'])['KDEF'].icao, 'KDEF')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', ['view'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, 'home')
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{view="home",le="0.1"} 1',
+            'test_seconds_bucket{view="home",le="1.0"} 3',
+            'test_seconds_bucket{view="home",le="+Inf"} 4',
+            'test_seconds_sum{view="home"} 6.05',
+            'test_seconds_count{view="home"} 4',
+        ])
+
+    def test_request_is_logged_and_counted(self):
+        make_pilot('pilot')
+        self.client.login(username='pilot', password='pass12345')
+        before = metrics.REQUESTS.value('event_list', 'GET', '200')
+        with self.assertLogs('pilotconnect.requests', 'INFO') as logs:
+            self.client.get(reverse('event_list'))
+        self.assertEqual(metrics.REQUESTS.value('event_list', 'GET', '200'), before + 1)
+
+        record = logs.records[-1]
+        self.assertEqual((record.view, record.status, record.method), ('event_list', 200, 'GET'))
+        self.assertEqual(record.user_id, User.objects.get(username='pilot').pk)
+        self.assertGreater(record.queries, 0)
+        self.assertGreater(record.template_ms, 0)
+
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual((line['message'], line['view'], line['status']), ('request', 'event_list', 200))
+        self.assertIn('db_ms', line)
+
+    def test_cache_hits_and_misses(self):
+        key = 'metrics-test'
+        misses = metrics.CACHE_LOOKUPS.value('default', 'miss')
+        hits = metrics.CACHE_LOOKUPS.value('default', 'hit')
+        self.assertIsNone(cache.get(key))
+        cache.set(key, None)
+        self.assertIsNone(cache.get(key, 'fallback'))
+        self.assertEqual(cache.get_many([key, 'metrics-other']), {key: None})
+        self.assertEqual(metrics.CACHE_LOOKUPS.value('default', 'miss'), misses + 2)
+        self.assertEqual(metrics.CACHE_LOOKUPS.value('default', 'hit'), hits + 2)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('event_list'))
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE pilotconnect_request_duration_seconds histogram', body)
+        self.assertIn('pilotconnect_request_duration_seconds_count{view="event_list"}', body)
+        self.assertIn('pilotconnect_template_render_seconds_count{template="connections/event_list.html"}', body)
+        self.assertIn('pilotconnect_cache_hit_ratio{cache="default"}', body)
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 404)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', FEED_ASYNC=False)
+class HomeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.knear = make_airport('KNEA', 'OH', 40.2, -83.0)
+        cls.kfar = make_airport('KFAR', 'TX', 30.0, -97.0)
+        cls.me = make_pilot('me', cls.kabc, safety_pilot_need_ifr_single_engine=True)
+
+    def feed(self, user=None):
+        return HomeFeed.objects.get(user=user or self.me).sections
+
+    def test_home_is_one_read_once_built(self):
+        self.client.login(username='me', password='pass12345')
+        self.client.get(reverse('home'))
+        self.assertIsNotNone(HomeFeed.objects.get(user=self.me).built_at)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        feed_queries = [q['sql'] for q in queries.captured_queries if 'connections_homefeed' in q['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertFalse(any('connections_pilotprofile' in q['sql'] or 'connections_message' in q['sql'] for q in queries.captured_queries))
+
+    def test_fan_out_on_write(self):
+        build_feeds([self.me.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            near = make_pilot('near', self.knear, safety_pilot_offer_ifr_single_engine=True)
+            make_pilot('far', self.kfar, safety_pilot_offer_ifr_single_engine=True)
+        self.assertEqual([entry['title'] for entry in self.feed()['safety']], ['near'])
+
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            PilotEvent.objects.create(
+                event_name='Fly-in', event_start_date=today, event_finish_date=today,
+                host_airport=self.knear, host_name=near, event_description='Pancakes',
+            )
+        self.assertEqual([entry['title'] for entry in self.feed()['events']], ['Fly-in'])
+        # The nearby pilot no longer offers, so it drops out of the feed
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = near.pilotprofile
+            profile.safety_pilot_offer_ifr_single_engine = False
+            profile.save()
+        self.assertEqual(self.feed()['safety'], [])
+
+    def test_rsvps_reach_the_feeds(self):
+        today = timezone.localdate()
+        event = PilotEvent.objects.create(
+            event_name='Fly-in', event_start_date=today, event_finish_date=today,
+            host_airport=self.knear, host_name=make_pilot('host'), event_description='Pancakes',
+        )
+        build_feeds([self.me.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            attend(event, self.me)
+        self.assertEqual(self.feed()['events'][0]['detail'], '1 going')
+        with self.captureOnCommitCallbacks(execute=True):
+            unattend(event, self.me)
+        self.assertEqual(self.feed()['events'][0]['detail'], '0 going')
+
+    def test_saves_feeds_dont_show_are_not_fanned_out(self):
+        profile = self.me.pilotprofile
+        with mock.patch('connections.signals.feed.schedule') as schedule:
+            profile.update_last_activity()
+            profile.flight_hours = 250
+            profile.save()
+            schedule.assert_not_called()
+            profile.home_airport = self.knear
+            profile.save(update_fields=['home_airport'])
+            schedule.assert_called_once()
+
+        sender = make_pilot('sender')
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=sender, recipient=self.me, subject='Fly Saturday?', content='IFR practice')
+        self.assertEqual(self.feed()['messages']['unread'], 1)
+        self.assertEqual(self.feed()['messages']['latest'][0]['title'], 'Fly Saturday?')
+
+        self.client.login(username='me', password='pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('view_messages'))
+        # Only posting back marks them read
+        self.assertEqual(self.feed()['messages']['unread'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('view_messages'))
+        self.assertEqual(self.feed()['messages'], {'unread': 0, 'latest': []})
+
+    def test_stale_feed_is_rebuilt_on_demand(self):
+        build_feeds([self.me.pk])
+        make_pilot('near', self.knear, safety_pilot_offer_vfr_single_engine=True)
+        # Nothing was committed, so the stored feed hasn't heard of the new pilot
+        self.assertEqual(feed_for(self.me)['safety'], [])
+        HomeFeed.objects.filter(user=self.me).update(built_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual([entry['title'] for entry in feed_for(self.me)['safety']], ['near'])
+
+    def test_rebuild_feeds_command(self):
+        make_pilot('other')
+        out = StringIO()
+        call_command('rebuild_feeds', '--stale', stdout=out)
+        self.assertIn('2 rows', out.getvalue())
+        self.assertEqual(HomeFeed.objects.count(), 2)
+        call_command('rebuild_feeds', '--stale', stdout=StringIO())
+        self.assertEqual(HomeFeed.objects.count(), 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        cls.alice = make_pilot('alice', make_airport('KABC', 'OH'))
+        cls.bob = make_pilot('bob')
+        for subject in ('Hello', 'Fly Saturday?'):
+            Message.objects.create(sender=cls.alice, recipient=cls.bob, subject=subject, content='...')
+        Message.objects.create(sender=cls.bob, recipient=cls.admin, subject='Unrelated', content='...')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_skip_distinct_date_scans(self):
+        for name in ('message', 'pilotprofile', 'pilotevent', 'eventrsvp', 'rentalslot', 'aircraft', 'archivedmessage',
+                     'logbookentry', 'flighttimerollup'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:connections_{name}_changelist'))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertFalse([q['sql'] for q in queries.captured_queries if 'DISTINCT' in q['sql']], name)
+
+    def test_large_changelists_skip_the_full_count(self):
+        for name in ('message', 'archivedmessage', 'pilotevent', 'logbookentry'):
+            response = self.client.get(reverse(f'admin:connections_{name}_changelist'), {'q': 'x'})
+            self.assertIsNone(response.context['cl'].full_result_count, name)
+
+    def test_calendar_date_hierarchy(self):
+        year = timezone.localdate().year
+        response = self.client.get(reverse('admin:connections_message_changelist'))
+        # Everything is from this month, so the drill-down starts at its days
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertContains(response, f'timestamp__year={year}')
+        response = self.client.get(reverse('admin:connections_message_changelist'), {'timestamp__year': year - 1})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_message_search_by_username(self):
+        response = self.client.get(reverse('admin:connections_message_changelist'), {'q': 'alice'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get(reverse('admin:connections_message_changelist'), {'q': 'Saturday'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        # A username still matches subjects too
+        Message.objects.create(sender=self.admin, recipient=self.admin, subject='Ask alice about the Skyhawk', content='...')
+        response = self.client.get(reverse('admin:connections_message_changelist'), {'q': 'alice'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_estimated_count_only_when_unfiltered(self):
+        queryset = Message.objects.order_by('pk')
+        with mock.patch('connections.admin.estimated_rows', return_value=2_000_000):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 2_000_000)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(sender=self.alice), 100).count, 2)
+        with mock.patch('connections.admin.estimated_rows', return_value=50):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_rows(Message), 3)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class LogbookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.today = timezone.localdate()
+        cls.recent = make_pilot('recent', cls.kabc, safety_pilot_offer_ifr_multi_engine=True)
+        cls.rusty = make_pilot('rusty', cls.kabc, safety_pilot_offer_ifr_multi_engine=True)
+        cls.fresh = make_pilot('fresh', cls.kabc, safety_pilot_offer_ifr_multi_engine=True)
+
+    def log(self, pilot, days_ago, duration, aircraft_class=Aircraft.SINGLE_ENGINE, conditions=LogbookEntry.VFR):
+        return LogbookEntry.objects.create(
+            pilot=pilot, date=self.today - timedelta(days=days_ago), aircraft_class=aircraft_class,
+            duration=Decimal(duration), conditions=conditions,
+        )
+
+    def rollup(self, pilot):
+        return FlightTimeRollup.objects.get(pilot=pilot)
+
+    def snapshot(self):
+        return {
+            row['pilot']: row
+            for row in FlightTimeRollup.objects.values(
+                'pilot', 'flights', 'total_hours', 'single_engine_hours', 'multi_engine_hours',
+                'vfr_hours', 'ifr_hours', 'hours_30', 'hours_90', 'hours_365',
+            )
+        }
+
+    def test_rollups_follow_saves_and_deletes(self):
+        self.log(self.recent, 2, '1.5')
+        entry = self.log(self.recent, 40, '2.0', Aircraft.MULTI_ENGINE, LogbookEntry.IFR)
+        self.log(self.recent, 400, '3.0')
+        rollup = self.rollup(self.recent)
+        self.assertEqual(rollup.flights, 3)
+        self.assertEqual((rollup.total_hours, rollup.multi_engine_hours, rollup.ifr_hours), (Decimal('6.5'), Decimal('2.0'), Decimal('2.0')))
+        self.assertEqual((rollup.hours_30, rollup.hours_90, rollup.hours_365), (Decimal('1.5'), Decimal('3.5'), Decimal('3.5')))
+        self.assertEqual(rollup.last_flight_date, self.today - timedelta(days=2))
+
+        entry.aircraft_class = Aircraft.SINGLE_ENGINE
+        entry.duration = Decimal('1.0')
+        entry.save()
+        rollup = self.rollup(self.recent)
+        self.assertEqual((rollup.total_hours, rollup.multi_engine_hours, rollup.single_engine_hours), (Decimal('5.5'), 0, Decimal('5.5')))
+
+        entry.delete()
+        rollup = self.rollup(self.recent)
+        self.assertEqual((rollup.flights, rollup.total_hours, rollup.ifr_hours), (2, Decimal('4.5'), 0))
+
+    def test_changes_count_into_the_windows_as_of_the_rollup(self):
+        # The row was last recomputed ten days ago, a flight 35 days back is still in its 30-day window
+        as_of = self.today - timedelta(days=10)
+        with mock.patch('connections.logbook.timezone.localdate', return_value=as_of):
+            self.log(self.recent, 20, '1.0')
+        entry = self.log(self.recent, 35, '2.0')
+        rollup = self.rollup(self.recent)
+        self.assertEqual((rollup.windows_as_of, rollup.hours_30, rollup.hours_90), (as_of, Decimal('3.0'), Decimal('3.0')))
+
+        incremental = self.snapshot()
+        with mock.patch('connections.logbook.timezone.localdate', return_value=as_of):
+            recompute_pilots([self.recent.pk])
+        self.assertEqual(self.snapshot(), incremental)
+
+        entry.delete()
+        rollup = self.rollup(self.recent)
+        self.assertEqual((rollup.flights, rollup.hours_30, rollup.hours_90), (1, Decimal('1.0'), Decimal('1.0')))
+
+    def test_recompute_matches_incremental_rollups(self):
+        self.log(self.recent, 0, '1.2', conditions=LogbookEntry.IFR)
+        self.log(self.recent, 89, '0.8', Aircraft.MULTI_ENGINE)
+        self.log(self.rusty, 200, '2.5')
+        self.log(self.rusty, 364, '1.1', Aircraft.MULTI_ENGINE, LogbookEntry.IFR)
+        incremental = self.snapshot()
+
+        out = StringIO()
+        call_command('recompute_flight_time', stdout=out)
+        self.assertIn('2 pilots', out.getvalue())
+        self.assertEqual(self.snapshot(), incremental)
+
+        # A pilot whose logbook is emptied loses their row
+        LogbookEntry.objects.filter(pilot=self.rusty).delete()
+        self.assertEqual(recompute_pilots([self.rusty.pk]), 0)
+        self.assertFalse(FlightTimeRollup.objects.filter(pilot=self.rusty).exists())
+
+    def test_import_logbook(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'logbook.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(
+                    'username,date,aircraft_class,departure,arrival,duration,conditions,remarks\n'
+                    f'recent,{self.today},multi,kabc,KZZZ,1.5,ifr,Approaches\n'
+                    f'recent,{self.today - timedelta(days=100)},,KABC,KABC,2.0,,\n'
+                    f'nobody,{self.today},,,,1.0,,\n'
+                )
+            out = StringIO()
+            call_command('import_logbook', path, '--chunk-size', '1', stdout=out)
+            self.assertIn('Skipped 1 rows', out.getvalue())
+            self.assertIn('1 airports were unknown', out.getvalue())
+
+            entry = LogbookEntry.objects.get(conditions=LogbookEntry.IFR)
+            self.assertEqual((entry.departure, entry.arrival, entry.remarks), (self.kabc, None, 'Approaches'))
+            rollup = self.rollup(self.recent)
+            self.assertEqual((rollup.flights, rollup.total_hours, rollup.hours_90, rollup.multi_engine_hours), (2, Decimal('3.5'), Decimal('1.5'), Decimal('1.5')))
+
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f'username,date,duration\nrecent,{self.today},-1\n')
+            with self.assertRaises(CommandError):
+                call_command('import_logbook', path, stdout=StringIO())
+            self.assertEqual(LogbookEntry.objects.count(), 2)
+
+    def test_directory_recency_filters(self):
+        self.log(self.recent, 3, '2.0', Aircraft.MULTI_ENGINE, LogbookEntry.IFR)
+        self.log(self.rusty, 120, '30.0', Aircraft.MULTI_ENGINE, LogbookEntry.IFR)
+        self.log(self.fresh, 1, '0.5')
+
+        def usernames(**recency):
+            return [profile.user.username for profile in directory_queryset('safety', 'offer', 'all', recency=recency)]
+
+        self.assertEqual(usernames(), ['fresh', 'recent', 'rusty'])
+        self.assertEqual(usernames(flown_within=30), ['fresh', 'recent'])
+        self.assertEqual(usernames(flown_within=30, min_multi=Decimal(1)), ['recent'])
+        self.assertEqual(usernames(min_ifr=Decimal(10)), ['rusty'])
+        self.assertEqual(
+            [user.username for user in directory_queryset('pilot', 'any', 'all', recency={'min_hours_90': Decimal('0.5')})],
+            ['fresh', 'recent'],
+        )
+
+        self.client.force_login(self.fresh)
+        url = reverse('directory', args=['safety', 'offer', 'all'])
+        response = self.client.get(url, {'flown_within': 30, 'min_multi': 1})
+        self.assertContains(response, 'recent')
+        self.assertNotContains(response, 'rusty')
+        # Bad values are reported and ignored
+        response = self.client.get(url, {'min_ifr': 'lots'})
+        self.assertContains(response, 'rusty')
+        self.assertContains(response, 'must be a number')
+
+        api = reverse('api_directory', args=['safety', 'offer', 'all'])
+        data = self.client.get(api, {'fields': 'username', 'min_hours_90': 1}).json()
+        self.assertEqual(data['results'], [{'username': 'recent'}])
+        self.assertEqual(self.client.get(api, {'flown_within': -1}).status_code, 400)
+        self.assertEqual(self.client.get(api, {'min_ifr': 'NaN'}).status_code, 400)
+
+
+class CalendarFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH')
+        cls.kxyz = make_airport('KXYZ', 'TX')
+        cls.host = make_pilot('host', cls.kabc)
+        cls.other = make_pilot('other', cls.kxyz)
+        today = timezone.localdate()
+        cls.event = PilotEvent.objects.create(
+            event_name='Fly-in', event_start_date=today, event_finish_date=today + timedelta(days=1),
+            host_airport=cls.kabc, host_name=cls.host, event_description='Pancakes, coffee; bring a chair',
+        )
+        PilotEvent.objects.create(
+            event_name='Texas tour', event_start_date=today, event_finish_date=today,
+            host_airport=cls.kxyz, second_airport=cls.kabc, host_name=cls.other, event_description='',
+        )
+        PilotEvent.objects.create(
+            event_name='Last year', event_start_date=today - timedelta(days=400), event_finish_date=today - timedelta(days=399),
+            host_airport=cls.kabc, host_name=cls.host, event_description='',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url, **headers):
+        response = self.client.get(url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body.decode()
+
+    def test_feeds(self):
+        response, body = self.fetch(reverse('calendar_events'))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn(f'UID:pilotevent-{self.event.pk}@pilotconnect', body)
+        # All-day events end the day after they finish
+        self.assertIn(f"DTEND;VALUE=DATE:{(self.event.event_finish_date + timedelta(days=1)):%Y%m%d}", body)
+        self.assertIn('DESCRIPTION:Pancakes\\, coffee\\; bring a chair\\n\\nHosted by host', body)
+        self.assertIn('URL:http://testserver/view-pilot-event/Fly-in/', body)
+
+        _, body = self.fetch(reverse('calendar_state_events', args=['OH']))
+        self.assertIn('SUMMARY:Fly-in', body)
+        self.assertIn('SUMMARY:Texas tour', body)
+        _, body = self.fetch(reverse('calendar_host_events', args=['host']))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertEqual(self.client.get(reverse('calendar_host_events', args=['nobody'])).status_code, 404)
+
+    def test_polls_are_cached_and_conditional(self):
+        url = reverse('calendar_events')
+        response, body = self.fetch(url)
+        self.assertTrue(response.streaming)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # Other clients get the cached body after reading the version counters
+        with self.assertNumQueries(1):
+            response, cached = self.fetch(url)
+        self.assertEqual((response.status_code, cached), (200, body))
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.event.event_name = 'Fly-in breakfast'
+        self.event.save()
+        response, body = self.fetch(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('SUMMARY:Fly-in breakfast', body)
+
+    def test_long_lines_are_folded(self):
+        line = 'DESCRIPTION:' + 'é' * 100
+        folded = fold(line)
+        lines = folded.split(b'\r\n')
+        self.assertTrue(all(len(part) <= 75 for part in lines))
+        self.assertEqual(b''.join(part[1:] if i else part for i, part in enumerate(lines)).decode(), line)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', FEED_ASYNC=False)
+class TenancyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kabc = make_airport('KABC', 'OH', 40.0, -83.0)
+        cls.alpha = Club.objects.create(name='Alpha Flyers', slug='alpha', domain='alpha.example.com')
+        cls.bravo = Club.objects.create(name='Bravo Aero', slug='bravo', domain='bravo.example.com')
+        today = timezone.localdate()
+        # Rows created while a club is active belong to it
+        with tenancy.using(cls.alpha.pk):
+            cls.amy = make_pilot('amy', cls.kabc, safety_pilot_offer_vfr_single_engine=True)
+            cls.andy = make_pilot('andy', cls.kabc, safety_pilot_need_vfr_single_engine=True)
+            PilotEvent.objects.create(event_name='Alpha fly-in', event_start_date=today, event_finish_date=today, host_airport=cls.kabc, host_name=cls.amy, event_description='')
+            Message.objects.create(sender=cls.andy, recipient=cls.amy, subject='Alpha hello', content='...')
+        with tenancy.using(cls.bravo.pk):
+            cls.bob = make_pilot('bob', cls.kabc, safety_pilot_offer_vfr_single_engine=True)
+            PilotEvent.objects.create(event_name='Bravo fly-in', event_start_date=today, event_finish_date=today, host_airport=cls.kabc, host_name=cls.bob, event_description='')
+            Message.objects.create(sender=cls.bob, recipient=cls.amy, subject='Bravo hello', content='...')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client(HTTP_HOST='alpha.example.com')
+        self.client.force_login(self.amy)
+
+    def test_managers_are_scoped_to_the_active_club(self):
+        self.assertEqual(PilotProfile.objects.count(), 3)
+        with tenancy.using(self.alpha.pk):
+            self.assertEqual(sorted(PilotProfile.objects.values_list('user__username', flat=True)), ['amy', 'andy'])
+            self.assertEqual(list(PilotEvent.objects.values_list('event_name', flat=True)), ['Alpha fly-in'])
+            self.assertEqual(list(self.amy.received_messages.values_list('subject', flat=True)), ['Alpha hello'])
+            self.assertEqual(PilotEvent.all_objects.count(), 2)
+            self.assertEqual(tenancy.cache_key('ical:x'), f'club:{self.alpha.pk}:ical:x')
+        self.assertEqual(tenancy.cache_key('ical:x'), 'ical:x')
+
+    def test_pages_only_show_the_hosts_club(self):
+        response = self.client.get(reverse('safety_pilot_list_offering'))
+        self.assertEqual([profile.user.username for profile in response.context['object_list']], ['amy'])
+        response = self.client.get(reverse('user_list'))
+        self.assertEqual([user.username for user in response.context['users']], ['amy', 'andy'])
+        response = self.client.get(reverse('event_list'))
+        self.assertEqual([event.event_name for event in response.context['events']], ['Alpha fly-in'])
+        response = self.client.get(reverse('view_messages'))
+        self.assertEqual([message.subject for message in response.context['received_messages']], ['Alpha hello'])
+
+        # Other clubs' members can't be looked up or written to
+        self.assertEqual(self.client.get(reverse('view_pilot_profile', args=[self.bob.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('send_message', args=[self.bob.pk])).status_code, 404)
+
+        data = self.client.get(reverse('api_directory', args=['safety', 'offer', 'all']), {'fields': 'username'}).json()
+        self.assertEqual(data['results'], [{'username': 'amy'}])
+        response = self.client.get(reverse('calendar_events'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('Alpha fly-in', body)
+        self.assertNotIn('Bravo fly-in', body)
+        self.assertEqual(self.client.get(reverse('calendar_host_events', args=['bob'])).status_code, 404)
+
+        # A host without a club sees the whole installation, unless the fallback is turned off
+        with self.settings(TENANT_FALLBACK=False):
+            self.assertEqual(self.client.get(reverse('event_list'), HTTP_HOST='testserver').status_code, 404)
+            self.assertEqual(self.client.get(reverse('event_list')).status_code, 200)
+            self.assertEqual(Client().get(reverse('admin:login')).status_code, 200)
+        with self.settings(TENANT_FALLBACK=True):
+            response = self.client.get(reverse('event_list'), HTTP_HOST='testserver')
+        self.assertEqual(len(response.context['events']), 2)
+
+    def test_new_rows_join_the_hosts_club(self):
+        self.client.post(reverse('send_message', args=[self.andy.pk]), {'recipient': self.andy.pk, 'subject': 'Hi', 'content': '...'})
+        self.assertEqual(Message.objects.get(subject='Hi').club, self.alpha)
+
+        newcomer = User.objects.create_user(username='newcomer', password='pass12345')
+        client = Client(HTTP_HOST='bravo.example.com')
+        client.force_login(newcomer)
+        client.get(reverse('update_pilot_profile'))
+        self.assertEqual(PilotProfile.objects.get(user=newcomer).club, self.bravo)
+
+    def test_assign_club_moves_members_from_before_clubs(self):
+        with tenancy.using(None):
+            veteran = make_pilot('veteran', self.kabc)
+        call_command('assign_club', 'charlie', '--domain', 'charlie.example.com', stdout=StringIO())
+        charlie = Club.objects.get(slug='charlie')
+        self.assertEqual(PilotProfile.all_objects.get(user=veteran).club, charlie)
+        response = Client(HTTP_HOST='charlie.example.com').post(reverse('login'), {'username': 'veteran', 'password': 'pass12345'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        with self.assertRaises(CommandError):
+            call_command('assign_club', 'delta', stdout=StringIO())
+
+    def test_members_cant_move_themselves_to_another_club(self):
+        self.client.post(reverse('update_pilot_profile'), {'club': self.bravo.pk, 'flight_hours': 100})
+        profile = PilotProfile.all_objects.get(user=self.amy)
+        self.assertEqual((profile.club, profile.flight_hours), (self.alpha, 100))
+
+    def test_members_only_log_in_to_their_own_club(self):
+        client = Client(HTTP_HOST='bravo.example.com')
+        response = client.post(reverse('login'), {'username': 'amy', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 200)
+        response = client.post(reverse('login'), {'username': 'bob', 'password': 'pass12345'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_users_outside_the_club_cant_log_in(self):
+        User.objects.create_user(username='drifter', password='pass12345')
+        User.objects.create_superuser(username='root', password='pass12345')
+        client = Client(HTTP_HOST='bravo.example.com')
+        for username in ('drifter', 'root'):
+            response = client.post(reverse('login'), {'username': username, 'password': 'pass12345'})
+            self.assertEqual(response.status_code, 200)
+        # Superusers log in on installation-wide hosts
+        response = Client().post(reverse('login'), {'username': 'root', 'password': 'pass12345'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_signing_up_on_a_club_site_joins_the_club(self):
+        client = Client(HTTP_HOST='bravo.example.com')
+        client.post(reverse('register'), {'username': 'rookie', 'password1': 'Cessna-172-sp', 'password2': 'Cessna-172-sp'})
+        self.assertEqual(PilotProfile.all_objects.get(user__username='rookie').club, self.bravo)
+        response = client.post(reverse('login'), {'username': 'rookie', 'password': 'Cessna-172-sp'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_feeds_are_built_within_each_users_club(self):
+        # Built outside any request, as the background worker does
+        feeds = build_feeds([self.andy.pk, self.bob.pk])
+        andy, bob = feeds[self.andy.pk].sections, feeds[self.bob.pk].sections
+        self.assertEqual([entry['title'] for entry in andy['safety']], ['amy'])
+        self.assertEqual([entry['title'] for entry in andy['events']], ['Alpha fly-in'])
+        self.assertEqual([entry['title'] for entry in bob['events']], ['Bravo fly-in'])
+
+    def test_activity_is_counted_per_club(self):
+        response = self.client.get(reverse('airport_detail', args=[self.kabc.pk]))
+        self.assertIn(('Offer to safety pilot', 1, 1), response.context['rows'])
+        data = self.client.get(reverse('api_activity'), {'metric': 'upcoming_events'}).json()
+        self.assertEqual([(point['icao'], point['value']) for point in data['points']], [('KABC', 1)])
+
+        # Moves within one club leave the other's counts alone
+        with tenancy.using(self.bravo.pk):
+            make_pilot('bella', self.kabc, safety_pilot_offer_vfr_single_engine=True)
+        self.assertEqual(AirportStats.objects.get(scope=self.alpha.pk, airport=self.kabc).safety_offer, 1)
+        self.assertEqual(AirportStats.objects.get(scope=self.bravo.pk, airport=self.kabc).safety_offer, 2)
+        self.assertEqual(AirportStats.objects.get(scope=0, airport=self.kabc).safety_offer, 3)
+        snapshot = sorted(AirportStats.objects.values_list('scope', 'airport_id', 'pilots', 'safety_offer', 'upcoming_events'))
+        recompute_all()
+        self.assertEqual(sorted(AirportStats.objects.values_list('scope', 'airport_id', 'pilots', 'safety_offer', 'upcoming_events')), snapshot)
+
+    def test_archived_messages_keep_their_club(self):
+        call_command('archive_messages', '--days', '0', '--no-compact', stdout=StringIO())
+        self.assertEqual(
+            dict(ArchivedMessage.all_objects.values_list('subject', 'club')),
+            {'Alpha hello': self.alpha.pk, 'Bravo hello': self.bravo.pk},
+        )
+        # The admin lists them through the scoped manager, as it does messages
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_superuser(username='root', password='pass12345')
+        with tenancy.using(self.alpha.pk):
+            queryset = admin.site._registry[ArchivedMessage].get_queryset(request)
+            self.assertEqual(list(queryset.values_list('subject', flat=True)), ['Alpha hello'])
+
+    def test_club_queries_lead_with_the_club_index(self):
+        with tenancy.using(self.alpha.pk):
+            queryset = PilotEvent.objects.filter(event_finish_date__gte=timezone.localdate()).order_by('event_start_date')
+            self.assertIn('event_club_upcoming_idx', queryset.explain())
+            queryset = directory_queryset('safety', 'offer', 'all')
+            self.assertIn('profile_safety_offer_idx', queryset.explain())
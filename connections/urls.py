@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, ical, views
 from .views import (
     welcome,
     register,
@@ -9,9 +9,7 @@ from .views import (
     update_pilot_profile,
     airport_list,
     airport_list_by_state,
-    user_list,
-    user_list_by_state,
-    users_same_airport,
+    airport_detail,
     view_pilot_profile,
     send_message,
     view_messages,
@@ -19,22 +17,16 @@ from .views import (
     create_pilot_event,
     event_list,
     view_pilot_event,
+    rsvp_pilot_event,
     user_hosted_events,
     edit_pilot_event,
     delete_pilot_event,
     EventListByStateView,
-    SafetyPilotListView,
-    SafetyPilotListViewByState,
-    SafetyPilotListByHomeAirportView,
-    SafetyPilotListOfferingView,
-    SafetyPilotListOfferingByStateView,
-    SafetyPilotListOfferingByAirportView,
-    InstructorListView,
-    InstructorListViewByState,
-    InstructorListByHomeAirportView,
-    InstructorListOfferingView,
-    InstructorListOfferingByStateView,
-    InstructorListOfferingByHomeAirportView,
+    DirectoryView,
+    add_aircraft,
+    add_rental_slot,
+    rental_search,
+    book_rental_slot,
 
 )
 
@@ -49,9 +41,10 @@ urlpatterns = [
     path('update-profile/', views.update_pilot_profile, name='update_pilot_profile'),
     path('airport-list/', views.airport_list, name='airport_list'),
     path('airport-list-by-state/', views.airport_list_by_state, name='airport_list_by_state'),
-    path('user-list/', views.user_list, name='user_list'),
-    path('user-list-by-state/', views.user_list_by_state, name='user_list_by_state'),
-    path('users-same-airport/', views.users_same_airport, name='users_same_airport'),
+    path('airport/<int:airport_id>/', views.airport_detail, name='airport_detail'),
+    path('user-list/', DirectoryView.as_view(role='pilot', direction='any', scope='all', template_name='connections/user_list.html', context_object_name='users'), name='user_list'),
+    path('user-list-by-state/', DirectoryView.as_view(role='pilot', direction='any', scope='state', template_name='connections/user_list_by_state.html', context_object_name='users'), name='user_list_by_state'),
+    path('users-same-airport/', DirectoryView.as_view(role='pilot', direction='any', scope='airport', exclude_self=True, template_name='connections/users_same_airport.html', context_object_name='users'), name='users_same_airport'),
     path('view-profile/<int:user_id>/', views.view_pilot_profile, name='view_pilot_profile'),
     path('send-message/<int:recipient_id>/', views.send_message, name='send_message'),
     path('view-messages/', views.view_messages, name='view_messages'),
@@ -59,22 +52,37 @@ urlpatterns = [
     path('create-pilot-event/', views.create_pilot_event, name='create_pilot_event'),
     path('event-list/', views.event_list, name='event_list'),
     path('view-pilot-event/<str:event_name>/', views.view_pilot_event, name='view_pilot_event'),
+    path('rsvp-pilot-event/<int:event_id>/', views.rsvp_pilot_event, name='rsvp_pilot_event'),
     path('user-hosted-events/', views.user_hosted_events, name='user_hosted_events'),
     path('edit-pilot-event/<int:event_id>/', views.edit_pilot_event, name='edit_pilot_event'),
     path('delete_pilot_event/<int:event_id>/', views.delete_pilot_event, name='delete_pilot_event'),
     path('event_list_by_state/', EventListByStateView.as_view(), name='event_list_by_state'),
-    path('safety-pilot-list/', SafetyPilotListView.as_view(), name='safety_pilot_list'),
-    path('safety_pilot_list_by_state/', SafetyPilotListViewByState.as_view(), name='safety_pilot_list_by_state'),
-    path('safety_pilot_list_by_home_airport/', SafetyPilotListByHomeAirportView.as_view(), name='safety_pilot_list_by_home_airport'),
-    path('safety-pilot_list_offering/', SafetyPilotListOfferingView.as_view(), name='safety_pilot_list_offering'),
-    path('safety_pilot_list_offering_by_state/', SafetyPilotListOfferingByStateView.as_view(), name='safety_pilot_list_offering_by_state'),
-    path('safety_pilot_list_offering_by_airport/', SafetyPilotListOfferingByAirportView.as_view(), name='safety_pilot_list_offering_by_airport'),
-    path('instructor-list/', views.InstructorListView.as_view(), name='instructor_list'),
-    path('instructor_list_by_state/', views.InstructorListViewByState.as_view(), name='instructor_list_by_state'),
-    path('instructor_list_by_home_airport/', views.InstructorListByHomeAirportView.as_view(), name='instructor_list_by_home_airport'),
-    path('instructor_list_offering/', views.InstructorListOfferingView.as_view(), name='instructor_list_offering'),
-    path('instructor_list_offering_by_state/', views.InstructorListOfferingByStateView.as_view(), name='instructor_list_offering_by_state'),
-    path('instructor_list_offering_by_home_airport/', views.InstructorListOfferingByHomeAirportView.as_view(), name='instructor_list_offering_by_home_airport'),
+    path('calendar/events.ics', ical.event_calendar, name='calendar_events'),
+    path('calendar/state/<str:value>.ics', ical.event_calendar, {'kind': 'state'}, name='calendar_state_events'),
+    path('calendar/host/<str:value>.ics', ical.event_calendar, {'kind': 'host'}, name='calendar_host_events'),
+    path('add-aircraft/', views.add_aircraft, name='add_aircraft'),
+    path('add-rental-slot/', views.add_rental_slot, name='add_rental_slot'),
+    path('rental-search/', views.rental_search, name='rental_search'),
+    path('book-rental-slot/<int:slot_id>/', views.book_rental_slot, name='book_rental_slot'),
+    path('api/v1/airports/', api.airports, name='api_airports'),
+    path('api/v1/events/', api.events, name='api_events'),
+    path('api/v1/activity/', api.activity, name='api_activity'),
+    path('api/v1/directory/<str:role>/<str:direction>/<str:scope>/', api.directory, name='api_directory'),
+    path('directory/<str:role>/<str:direction>/<str:scope>/', DirectoryView.as_view(), name='directory'),
+
+    # Legacy directory URLs, kept as aliases of the directory view
+    path('safety-pilot-list/', DirectoryView.as_view(role='safety', direction='need', scope='all', template_name='connections/safety_pilot_list.html'), name='safety_pilot_list'),
+    path('safety_pilot_list_by_state/', DirectoryView.as_view(role='safety', direction='need', scope='state', template_name='connections/safety_pilot_list_by_state.html'), name='safety_pilot_list_by_state'),
+    path('safety_pilot_list_by_home_airport/', DirectoryView.as_view(role='safety', direction='need', scope='airport', template_name='connections/safety_pilot_list_by_home_airport.html'), name='safety_pilot_list_by_home_airport'),
+    path('safety-pilot_list_offering/', DirectoryView.as_view(role='safety', direction='offer', scope='all', template_name='connections/safety_pilot_list_offering.html'), name='safety_pilot_list_offering'),
+    path('safety_pilot_list_offering_by_state/', DirectoryView.as_view(role='safety', direction='offer', scope='state', template_name='connections/safety_pilot_list_offering_by_state.html'), name='safety_pilot_list_offering_by_state'),
+    path('safety_pilot_list_offering_by_airport/', DirectoryView.as_view(role='safety', direction='offer', scope='airport', template_name='connections/safety_pilot_list_offering_by_airport.html'), name='safety_pilot_list_offering_by_airport'),
+    path('instructor-list/', DirectoryView.as_view(role='instructor', direction='need', scope='all', template_name='connections/instructor_list.html', context_object_name='instructors'), name='instructor_list'),
+    path('instructor_list_by_state/', DirectoryView.as_view(role='instructor', direction='need', scope='state', template_name='connections/instructor_list_by_state.html'), name='instructor_list_by_state'),
+    path('instructor_list_by_home_airport/', DirectoryView.as_view(role='instructor', direction='need', scope='airport', template_name='connections/instructor_list_by_home_airport.html'), name='instructor_list_by_home_airport'),
+    path('instructor_list_offering/', DirectoryView.as_view(role='instructor', direction='offer', scope='all', template_name='connections/instructor_list_offering.html', context_object_name='instructors'), name='instructor_list_offering'),
+    path('instructor_list_offering_by_state/', DirectoryView.as_view(role='instructor', direction='offer', scope='state', template_name='connections/instructor_list_offering_by_state.html', context_object_name='instructors'), name='instructor_list_offering_by_state'),
+    path('instructor_list_offering_by_home_airport/', DirectoryView.as_view(role='instructor', direction='offer', scope='airport', template_name='connections/instructor_list_offering_by_home_airport.html', context_object_name='instructors'), name='instructor_list_offering_by_home_airport'),
 
 ]
 
@@ -3,21 +3,30 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.utils.decorators import method_decorator
-from django.http import HttpResponseForbidden
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
+from django.http import Http404, HttpResponseForbidden
 from django.db.models import Q
 from django.db import models
 from django.views.generic.base import View  # Corrected import statement
 from django.views.generic.edit import CreateView
 from django.views.generic.list import ListView
 from django.urls import reverse_lazy
-from .forms import PilotProfileForm, MessageForm, MessageReplyForm, PilotEventForm
-from .models import PilotProfile, AirportData, Message, PilotEvent
+from .forms import PilotProfileForm, MessageForm, MessageReplyForm, PilotEventForm, AircraftForm, RentalSlotForm, RentalSearchForm
+from .models import PilotProfile, AirportData, AirportStats, StateStats, Message, PilotEvent
+from . import tenancy
+from .aggregates import COUNTER_LABELS, current_scope
+from .attendance import attend, attendees, attending_event_ids, unattend
+from .directory import DEFAULT_RADIUS_NM, MAX_RADIUS_NM, RECENCY_FILTERS, directory_queryset, get_columns, parse_recency
+from .feed import feed_for, mark_messages_read
+from .ratelimit import consume, rate_limit, too_many_requests
+from .rentals import SlotUnavailable, available_slots, book_slot
+from .weather import conditions_for
 
 def welcome(request):
     return render(request, 'connections/welcome.html')
@@ -26,7 +35,10 @@ def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            form.save()
+            user = form.save()
+            # Signing up on a club's site joins it, only members can log in there
+            if tenancy.current_club_id() is not None:
+                PilotProfile.objects.create(user=user)
             username = form.cleaned_data.get('username')
             messages.success(request, f'Account created for {username}!')
             return redirect('login')
@@ -38,12 +50,9 @@ def user_login(request):
     if request.method == 'POST':
         form = AuthenticationForm(request, request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user:
-                login(request, user)
-                return redirect('home')
+            # The form has already authenticated the user, don't hash the password a second time
+            login(request, form.get_user())
+            return redirect('home')
     else:
         form = AuthenticationForm()
     return render(request, 'connections/registration/login.html', {'form': form})
@@ -55,12 +64,12 @@ def user_logout(request):
 
 @login_required
 def home(request):
-    return render(request, 'connections/home.html', {'user': request.user})
+    return render(request, 'connections/home.html', {'user': request.user, 'feed': feed_for(request.user)})
 
 @login_required
 def update_pilot_profile(request):
-    # Get the current user's pilot profile or create one if it doesn't exist
-    pilot_profile, created = PilotProfile.objects.get_or_create(user=request.user)
+    # Get the current user's pilot profile or create one if it doesn't exist, in this club if it's new
+    pilot_profile, created = PilotProfile.all_objects.get_or_create(user=request.user, defaults={'club_id': tenancy.current_club_id()})
 
     if request.method == 'POST':
         form = PilotProfileForm(request.POST, instance=pilot_profile)
@@ -98,42 +107,36 @@ def airport_list_by_state(request):
         return redirect('update_pilot_profile')
 
 @login_required
-def user_list(request):
-    users = User.objects.all().order_by('username')  # Order users alphabetically by username
-    return render(
-        request,
-        'connections/user_list.html',
-        {'users': users}
-    )
-
-@login_required
-def user_list_by_state(request):
-    # Get the current user's home airport state
-    user_state = request.user.pilotprofile.home_airport.state
-
-    # Filter users based on the home airport state
-    users = User.objects.filter(pilotprofile__home_airport__state=user_state)
-
-    return render(request, 'connections/user_list_by_state.html', {'users': users})
-
-@login_required
-def users_same_airport(request):
-    current_user = request.user
-    users_same_airport = User.objects.filter(
-        pilotprofile__home_airport=current_user.pilotprofile.home_airport
-    ).exclude(id=current_user.id).order_by('username')
-
-    return render(request, 'connections/users_same_airport.html', {'users': users_same_airport})
+def airport_detail(request, airport_id):
+    airport = get_object_or_404(AirportData, id=airport_id)
+    # Counts come from the aggregate tables, never from counting profiles or events here
+    scope = current_scope()
+    stats = AirportStats.objects.filter(scope=scope, airport_id=airport_id).first()
+    state_stats = StateStats.objects.filter(scope=scope, state=airport.state).first()
+    rows = [
+        (label, getattr(stats, name, 0), getattr(state_stats, name, 0))
+        for name, label in COUNTER_LABELS.items()
+    ]
+    return render(request, 'connections/airport_detail.html', {
+        'airport': airport,
+        'rows': rows,
+        'updated_at': stats.updated_at if stats else None,
+    })
 
 @login_required
 def view_pilot_profile(request, user_id):
-    user = get_object_or_404(User, id=user_id)
+    user = get_object_or_404(tenancy.scope(User.objects.select_related('pilotprofile__home_airport'), 'pilotprofile__'), id=user_id)
     # You can customize this function to retrieve additional information about the user if needed
-    return render(request, 'connections/view_pilot_profile.html', {'user': user})
+    pilot_profile = getattr(user, 'pilotprofile', None)
+    home_airport = pilot_profile.home_airport if pilot_profile else None
+    conditions = conditions_for([home_airport.icao]).get(home_airport.icao.upper()) if home_airport else None
+    return render(request, 'connections/view_pilot_profile.html', {'user': user, 'conditions': conditions})
 
 @login_required
+@rate_limit('send_message', recipient_kwarg='recipient_id')
 def send_message(request, recipient_id):
-    recipient = get_object_or_404(User, id=recipient_id)
+    # Only members of this club can be written to
+    recipient = get_object_or_404(tenancy.scope(User.objects, 'pilotprofile__'), id=recipient_id)
 
     if request.method == 'POST':
         form = MessageForm(request.POST)
@@ -158,6 +161,11 @@ def send_message(request, recipient_id):
 
 @login_required
 def view_messages(request):
+    # Reading the inbox is a GET and changes nothing, the page posts back to mark it read
+    if request.method == 'POST':
+        mark_messages_read(request.user)
+        return redirect('view_messages')
+
     received_messages = Message.objects.filter(recipient=request.user).order_by('-timestamp')
     sent_messages = Message.objects.filter(sender=request.user).order_by('-timestamp')
 
@@ -170,6 +178,11 @@ def send_reply(request, message_id):
     original_message = get_object_or_404(Message, id=message_id)
 
     if request.method == 'POST':
+        # Limited here rather than by rate_limit, the recipient is only known once the
+        # original message is loaded. One call, so a rejection charges neither bucket.
+        retry_after = consume('send_reply', {'user': request.user.pk, 'recipient': original_message.sender_id})
+        if retry_after:
+            return too_many_requests(request, retry_after)
         form = MessageForm(request.POST)
         if form.is_valid():
             subject = form.cleaned_data['subject']
@@ -210,15 +223,54 @@ def create_pilot_event(request):
 def event_list(request):
     # Retrieve the list of events from the database
     current_time = timezone.now()
-    events = PilotEvent.objects.filter(event_finish_date__gte=current_time).order_by('event_start_date')
+    events = list(
+        PilotEvent.objects.filter(event_finish_date__gte=current_time)
+        .select_related('host_airport', 'host_name')
+        .order_by('event_start_date')
+    )
+    # One batched lookup for every host airport on the page
+    weather = conditions_for(event.host_airport.icao for event in events if event.host_airport)
+    for event in events:
+        event.conditions = weather.get(event.host_airport.icao.upper()) if event.host_airport else None
 
     # Render the event list template with the events
-    return render(request, 'connections/event_list.html', {'events': events})
+    return render(request, 'connections/event_list.html', {
+        'events': events,
+        'attending_ids': attending_event_ids(request.user, events),
+    })
 
 
 def view_pilot_event(request, event_name):
-    pilot_event = get_object_or_404(PilotEvent, event_name=event_name)
-    return render(request, 'connections/view_pilot_event.html', {'pilot_event': pilot_event})
+    pilot_event = get_object_or_404(
+        PilotEvent.objects.select_related('host_airport', 'second_airport', 'third_airport', 'host_name'),
+        event_name=event_name,
+    )
+    host_airport = pilot_event.host_airport
+    return render(request, 'connections/view_pilot_event.html', {
+        'pilot_event': pilot_event,
+        'conditions': conditions_for([host_airport.icao]).get(host_airport.icao.upper()) if host_airport else None,
+        'attendees': attendees(pilot_event),
+        'attending': pilot_event.pk in attending_event_ids(request.user, [pilot_event]),
+    })
+
+
+@login_required
+def rsvp_pilot_event(request, event_id):
+    if request.method != 'POST':
+        return redirect('event_list')
+
+    pilot_event = get_object_or_404(PilotEvent, id=event_id)
+    if request.POST.get('attending') == 'no':
+        unattend(pilot_event, request.user)
+        messages.info(request, f'You are no longer attending {pilot_event.event_name}.')
+    else:
+        attend(pilot_event, request.user)
+        messages.success(request, f'You are attending {pilot_event.event_name}.')
+
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('view_pilot_event', event_name=pilot_event.event_name)
 
 
 @login_required
@@ -269,201 +321,186 @@ def delete_pilot_event(request, event_id):
     return redirect('user_hosted_events')
 
 
-class EventListByStateView(ListView):
-    model = PilotEvent
-    template_name = 'connections/event_list_by_state.html'
-    context_object_name = 'events'
-    ordering = ['event_start_date']
-
-    def get_queryset(self):
-        user_state = self.request.user.pilotprofile.home_airport.state
-        return PilotEvent.objects.filter(
-            models.Q(host_airport__state=user_state) |
-            models.Q(second_airport__state=user_state) |
-            models.Q(third_airport__state=user_state)
-        ).order_by('event_start_date')
-
-
-
-class SafetyPilotListView(ListView):
-    model = PilotProfile
-    template_name = 'connections/safety_pilot_list.html'
-
-    def get_queryset(self):
-        # Corrected field name for safety_pilot_need_vfr_multi_engine
-        return PilotProfile.objects.filter(
-            Q(safety_pilot_need_vfr_single_engine=True) |
-            Q(safety_pilot_need_ifr_single_engine=True) |
-            Q(safety_pilot_need_ifr_multi_engine=True)
-        )
-
-
-
-class SafetyPilotListViewByState(ListView):
-    model = PilotProfile
-    template_name = 'connections/safety_pilot_list_by_state.html'  # Create this template
-
-    def get_queryset(self):
-        user_state = self.request.user.pilotprofile.home_airport.state  # Assuming the state is stored in the 'state' field
-
-        # Filter profiles based on the user's state
-        return PilotProfile.objects.filter(
-            Q(safety_pilot_need_vfr_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(safety_pilot_need_ifr_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(safety_pilot_need_ifr_multi_engine=True, user__pilotprofile__home_airport__state=user_state)
-        )
-
-
-class SafetyPilotListByHomeAirportView(ListView):
-    model = PilotProfile
-    template_name = 'connections/safety_pilot_list_by_home_airport.html'
-
-    def get_queryset(self):
-        user_home_airport = self.request.user.pilotprofile.home_airport
-        return PilotProfile.objects.filter(
-            Q(safety_pilot_need_vfr_single_engine=True, home_airport=user_home_airport) |
-            Q(safety_pilot_need_ifr_single_engine=True, home_airport=user_home_airport) |
-            Q(safety_pilot_need_ifr_multi_engine=True, home_airport=user_home_airport)
-        )
-
-
-class SafetyPilotListOfferingView(ListView):
-    model = PilotProfile
-    template_name = 'connections/safety_pilot_list_offering.html'
-
-    def get_queryset(self):
-        return PilotProfile.objects.filter(
-            Q(safety_pilot_offer_vfr_single_engine=True) |
-            Q(safety_pilot_offer_ifr_single_engine=True) |
-            Q(safety_pilot_offer_ifr_multi_engine=True)
-        )
-
-
-class SafetyPilotListOfferingByStateView(ListView):
-    model = PilotProfile
-    template_name = 'connections/safety_pilot_list_offering_by_state.html'  # You can create a new template if needed
+@login_required
+def add_aircraft(request):
+    pilot_profile, created = PilotProfile.all_objects.get_or_create(user=request.user)
 
-    def get_queryset(self):
-        # Filter Safety Pilots offering by the user's home state
-        user_state = self.request.user.pilotprofile.home_airport.state
-        return PilotProfile.objects.filter(
-            Q(safety_pilot_offer_vfr_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(safety_pilot_offer_ifr_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(safety_pilot_offer_ifr_multi_engine=True, user__pilotprofile__home_airport__state=user_state)
-        )
+    if request.method == 'POST':
+        form = AircraftForm(request.POST)
+        if form.is_valid():
+            aircraft = form.save(commit=False)
+            aircraft.owner = pilot_profile
+            aircraft.save()
+            messages.success(request, f'{aircraft.tail_number} added.')
+            return redirect('add_rental_slot')
+    else:
+        form = AircraftForm(initial={'home_airport': pilot_profile.home_airport})
 
+    return render(request, 'connections/add_aircraft.html', {'form': form})
 
-class SafetyPilotListOfferingByAirportView(ListView):
-    model = PilotProfile
-    template_name = 'connections/safety_pilot_list_offering_by_airport.html'  # Adjust this to your template path
 
+@login_required
+def add_rental_slot(request):
+    pilot_profile, created = PilotProfile.all_objects.get_or_create(user=request.user)
 
-    def get_queryset(self):
-        # Retrieve safety pilots offering by airport (customize this based on your model and logic)
-        user_home_airport = self.request.user.pilotprofile.home_airport
-        return PilotProfile.objects.filter(
-            Q(safety_pilot_offer_vfr_single_engine=True, home_airport=user_home_airport) |
-            Q(safety_pilot_offer_ifr_single_engine=True, home_airport=user_home_airport) |
-            Q(safety_pilot_offer_ifr_multi_engine=True, home_airport=user_home_airport)
-        )
+    if request.method == 'POST':
+        form = RentalSlotForm(request.POST, owner=pilot_profile)
+        if form.is_valid():
+            try:
+                form.save()
+            except SlotUnavailable as e:
+                form.add_error(None, str(e))
+            else:
+                messages.success(request, 'Rental slot added.')
+                return redirect('add_rental_slot')
+    else:
+        form = RentalSlotForm(owner=pilot_profile)
 
+    return render(request, 'connections/add_rental_slot.html', {'form': form})
 
-class InstructorListView(ListView):
-    model = PilotProfile
-    template_name = 'connections/instructor_list.html'
-    context_object_name = 'instructors'
 
-    def get_queryset(self):
-        return PilotProfile.objects.filter(
-            Q(instructor_need_cfi=True) |
-            Q(instructor_need_instrument_cfii=True) |
-            Q(instructor_need_commercial_single_engine=True) |
-            Q(instructor_need_commercial_multi_engine_mei=True) |
-            Q(instructor_offer_cfi=True) |
-            Q(instructor_offer_instrument_cfii=True) |
-            Q(instructor_offer_commercial_single_engine=True) |
-            Q(instructor_offer_commercial_multi_engine_mei=True)
-        )
+@login_required
+def rental_search(request):
+    slots = None
+    form = RentalSearchForm(request.GET or None)
+    if form.is_valid():
+        slots = available_slots(
+            form.cleaned_data['start'],
+            form.cleaned_data['end'],
+            engine_class=form.cleaned_data['engine_class'],
+            near=form.cleaned_data['airport'],
+            radius_nm=form.cleaned_data['radius'] or DEFAULT_RADIUS_NM,
+        )[:100]
 
+    return render(request, 'connections/rental_search.html', {'form': form, 'slots': slots})
 
 
+@login_required
+def book_rental_slot(request, slot_id):
+    if request.method != 'POST':
+        return redirect('rental_search')
+
+    try:
+        book_slot(slot_id, request.user)
+    except SlotUnavailable:
+        messages.warning(request, 'Sorry, that slot has already been booked.')
+    else:
+        messages.success(request, 'Rental slot booked.')
+    return redirect('rental_search')
 
-class InstructorListViewByState(ListView):
-    model = PilotProfile
-    template_name = 'connections/instructor_list_by_state.html'
 
+class EventListByStateView(ListView):
+    model = PilotEvent
+    template_name = 'connections/event_list_by_state.html'
+    context_object_name = 'events'
+    ordering = ['event_start_date']
 
     def get_queryset(self):
         user_state = self.request.user.pilotprofile.home_airport.state
-        return PilotProfile.objects.filter(
-            Q(instructor_need_cfi=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_need_instrument_cfii=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_need_commercial_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_need_commercial_multi_engine_mei=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_cfi=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_instrument_cfii=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_commercial_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_commercial_multi_engine_mei=True, user__pilotprofile__home_airport__state=user_state)
-        )
-
-class InstructorListByHomeAirportView(ListView):
-    model = PilotProfile
-    template_name = 'connections/instructor_list_by_home_airport.html'
-
-    def get_queryset(self):
-        user_home_airport = self.request.user.pilotprofile.home_airport
-        return PilotProfile.objects.filter(
-
-            Q(instructor_need_cfi=True, home_airport=user_home_airport) |
-            Q(instructor_need_instrument_cfii=True, home_airport=user_home_airport) |
-            Q(instructor_need_commercial_single_engine=True, home_airport=user_home_airport) |
-            Q(instructor_need_commercial_multi_engine_mei=True, home_airport=user_home_airport) |
-            Q(instructor_offer_cfi=True, home_airport=user_home_airport) |
-            Q(instructor_offer_instrument_cfii=True, home_airport=user_home_airport) |
-            Q(instructor_offer_commercial_single_engine=True, home_airport=user_home_airport) |
-            Q(instructor_offer_commercial_multi_engine_mei=True, home_airport=user_home_airport)
-
-        )
-
-
-class InstructorListOfferingView(ListView):
-    model = PilotProfile
-    template_name = 'connections/instructor_list_offering.html'
-    context_object_name = 'instructors'
-
-    def get_queryset(self):
-        return PilotProfile.objects.filter(
-            Q(instructor_offer_cfi=True) |
-            Q(instructor_offer_instrument_cfii=True) |
-            Q(instructor_offer_commercial_single_engine=True) |
-            Q(instructor_offer_commercial_multi_engine_mei=True)
-        )
-
-
-class InstructorListOfferingByStateView(ListView):
-    model = PilotProfile
-    template_name = 'connections/instructor_list_offering_by_state.html'
-    context_object_name = 'instructors'
+        # Matching airport ids rather than joining airports lets each OR branch use its foreign key index
+        state_airports = AirportData.objects.filter(state=user_state).values('pk')
+        return PilotEvent.objects.filter(
+            models.Q(host_airport__in=state_airports) |
+            models.Q(second_airport__in=state_airports) |
+            models.Q(third_airport__in=state_airports)
+        ).order_by('event_start_date')
 
-    def get_queryset(self):
-        user_state = self.request.user.pilotprofile.home_airport.state
-        return PilotProfile.objects.filter(
-            Q(instructor_offer_cfi=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_instrument_cfii=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_commercial_single_engine=True, user__pilotprofile__home_airport__state=user_state) |
-            Q(instructor_offer_commercial_multi_engine_mei=True, user__pilotprofile__home_airport__state=user_state)
-        )
 
-class InstructorListOfferingByHomeAirportView(ListView):
-    model = PilotProfile
-    template_name = 'connections/instructor_list_offering_by_home_airport.html'
-    context_object_name = 'instructors'
+class DirectoryView(LoginRequiredMixin, ListView):
+    """
+    One list view for every pilot directory.
+
+    The role, direction and scope come from the URL or from as_view() for the
+    legacy list URLs, and are compiled into a single paginated query by
+    connections.directory.
+    """
+    role = None
+    direction = None
+    scope = 'all'
+    exclude_self = False
+    template_name = 'connections/directory.html'
+    paginate_by = 50
+
+    def get(self, request, *args, **kwargs):
+        self.role = kwargs.get('role', self.role)
+        self.direction = kwargs.get('direction', self.direction)
+        self.scope = kwargs.get('scope', self.scope)
+        try:
+            self.columns = get_columns(self.role, self.direction)
+        except ValueError:
+            raise Http404('Unknown directory')
+
+        try:
+            self.radius = min(max(int(request.GET.get('radius', DEFAULT_RADIUS_NM)), 1), MAX_RADIUS_NM)
+        except ValueError:
+            self.radius = DEFAULT_RADIUS_NM
+
+        try:
+            self.recency = parse_recency(request.GET)
+        except ValueError as e:
+            messages.warning(request, f'Ignoring the flight time filters: {e}')
+            self.recency = {}
+
+        self.home_airport = None
+        if self.scope != 'all':
+            pilot_profile = PilotProfile.all_objects.select_related('home_airport').filter(user=request.user).first()
+            if pilot_profile is None or pilot_profile.home_airport is None:
+                messages.warning(request, 'Please set your home airport and try again.')
+                return redirect('update_pilot_profile')
+            # Cache the profile on the user so templates don't query it again
+            request.user.pilotprofile = pilot_profile
+            self.home_airport = pilot_profile.home_airport
+
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        user_home_airport = self.request.user.pilotprofile.home_airport
-        return PilotProfile.objects.filter(
-            Q(instructor_offer_cfi=True, home_airport=user_home_airport) |
-            Q(instructor_offer_instrument_cfii=True, home_airport=user_home_airport) |
-            Q(instructor_offer_commercial_single_engine=True, home_airport=user_home_airport) |
-            Q(instructor_offer_commercial_multi_engine_mei=True, home_airport=user_home_airport)
-        )
\ No newline at end of file
+        try:
+            return directory_queryset(
+                self.role,
+                self.direction,
+                self.scope,
+                home_airport=self.home_airport,
+                radius_nm=self.radius,
+                exclude_user=self.request.user if self.exclude_self else None,
+                recency=self.recency,
+            )
+        except ValueError:
+            raise Http404('Unknown directory')
+
+    def shows_conditions(self):
+        return self.template_name == DirectoryView.template_name
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        rows = []
+        airports = []
+        for obj in context['object_list']:
+            if self.role == 'pilot':
+                pilot_profile = getattr(obj, 'pilotprofile', None)
+                user, home_airport = obj, pilot_profile.home_airport if pilot_profile else None
+            else:
+                user, home_airport = obj.user, obj.home_airport
+            rows.append({
+                'user': user,
+                'home_airport': home_airport,
+                'flags': [getattr(obj, flag) for _, flag in self.columns],
+            })
+            airports.append(home_airport)
+        # Conditions at every home airport on the page in one batched lookup, for the
+        # directory template; the legacy list templates don't show them
+        weather = conditions_for(airport.icao for airport in airports if airport) if self.shows_conditions() else {}
+        for row, airport in zip(rows, airports):
+            row['conditions'] = weather.get(airport.icao.upper()) if airport else None
+        context['directory'] = {
+            'role': self.role,
+            'direction': self.direction,
+            'scope': self.scope,
+            'radius': self.radius,
+            'home_airport': self.home_airport,
+            'columns': [label for label, _ in self.columns],
+            'rows': rows,
+            'recency': [(name, label, self.recency.get(name, '')) for name, (label, _) in RECENCY_FILTERS.items()],
+            # Everything but the page number, for the pagination links
+            'query': urlencode({**({'radius': self.radius} if self.scope == 'radius' else {}), **self.recency}),
+        }
+        return context
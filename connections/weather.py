@@ -0,0 +1,259 @@
+# connections/weather.py
+
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_BADGES = {
+    'VFR': 'bg-success',
+    'MVFR': 'bg-primary',
+    'IFR': 'bg-danger',
+    'LIFR': 'bg-dark',
+}
+
+
+def flight_category(ceiling_ft, visibility_sm):
+    """FAA flight category from the lowest broken/overcast layer and the visibility."""
+    ceiling = ceiling_ft if ceiling_ft is not None else float('inf')
+    visibility = visibility_sm if visibility_sm is not None else float('inf')
+    if ceiling < 500 or visibility < 1:
+        return 'LIFR'
+    if ceiling < 1000 or visibility < 3:
+        return 'IFR'
+    if ceiling <= 3000 or visibility <= 5:
+        return 'MVFR'
+    return 'VFR'
+
+
+@dataclass(frozen=True)
+class Conditions:
+    icao: str
+    flight_category: str
+    raw: str = ''
+    wind_direction: Optional[int] = None
+    wind_speed_kt: Optional[int] = None
+    visibility_sm: Optional[float] = None
+    ceiling_ft: Optional[int] = None
+    observed_at: str = ''
+
+    @property
+    def badge_class(self):
+        return CATEGORY_BADGES.get(self.flight_category, 'bg-secondary')
+
+
+class WeatherProvider:
+    """Fetches current conditions for many airports at once. Subclasses implement fetch()."""
+
+    def fetch(self, icaos):
+        """Return {icao: Conditions} for the airports that have a report, in as few calls as possible."""
+        raise NotImplementedError
+
+
+class StubWeatherProvider(WeatherProvider):
+    """
+    Offline provider for development and tests.
+
+    Reads reports from the JSON file in settings.WEATHER_STUB_PATH, keyed by ICAO
+    with Conditions fields as values. Without a file every airport gets stable
+    made-up conditions derived from its code.
+    """
+
+    def __init__(self, path=None):
+        self.reports = {}
+        path = path or settings.WEATHER_STUB_PATH
+        if path:
+            with open(path, encoding='utf-8') as f:
+                self.reports = {icao.upper(): report for icao, report in json.load(f).items()}
+
+    def fetch(self, icaos):
+        if self.reports:
+            return {
+                icao: self.build(icao, self.reports[icao])
+                for icao in icaos if icao in self.reports
+            }
+        return {icao: self.synthesize(icao) for icao in icaos}
+
+    def build(self, icao, report):
+        # The file's key wins over any icao in the report
+        report = {**report, 'icao': icao}
+        report.setdefault('flight_category', flight_category(report.get('ceiling_ft'), report.get('visibility_sm')))
+        return Conditions(**report)
+
+    def synthesize(self, icao):
+        seed = zlib.crc32(icao.encode())
+        ceiling = [None, 5000, 2500, 800, 300][seed % 5]
+        visibility = [10.0, 10.0, 4.0, 2.0, 0.5][(seed >> 3) % 5]
+        return Conditions(
+            icao=icao,
+            flight_category=flight_category(ceiling, visibility),
+            raw=f'{icao} stub observation',
+            wind_direction=(seed >> 6) % 36 * 10,
+            wind_speed_kt=(seed >> 12) % 20,
+            visibility_sm=visibility,
+            ceiling_ft=ceiling,
+        )
+
+
+class AviationWeatherProvider(WeatherProvider):
+    """METARs from the aviationweather.gov data API, one request per batch of stations."""
+
+    url = 'https://aviationweather.gov/api/data/metar'
+    batch_size = 100
+
+    def fetch(self, icaos):
+        icaos = list(icaos)
+        conditions = {}
+        for start in range(0, len(icaos), self.batch_size):
+            query = urllib.parse.urlencode({'ids': ','.join(icaos[start:start + self.batch_size]), 'format': 'json'})
+            with urllib.request.urlopen(f'{self.url}?{query}', timeout=settings.WEATHER_TIMEOUT) as response:
+                reports = json.load(response) if response.status == 200 else []
+            for report in reports:
+                parsed = self.parse(report)
+                conditions[parsed.icao] = parsed
+        return conditions
+
+    def parse(self, report):
+        ceilings = [layer.get('base') for layer in report.get('clouds') or [] if layer.get('cover') in ('BKN', 'OVC', 'OVX')]
+        ceiling = min((base for base in ceilings if base is not None), default=None)
+        visibility = report.get('visib')
+        if isinstance(visibility, str):
+            # "10+" means better than ten miles
+            visibility = float(visibility.rstrip('+')) if visibility.rstrip('+').replace('.', '', 1).isdigit() else None
+        wind_direction = report.get('wdir')
+        return Conditions(
+            icao=report['icaoId'],
+            flight_category=report.get('fltCat') or flight_category(ceiling, visibility),
+            raw=report.get('rawOb', ''),
+            wind_direction=wind_direction if isinstance(wind_direction, int) else None,
+            wind_speed_kt=report.get('wspd'),
+            visibility_sm=visibility,
+            ceiling_ft=ceiling,
+            observed_at=str(report.get('reportTime') or ''),
+        )
+
+
+@lru_cache(maxsize=None)
+def _provider(path):
+    return import_string(path)()
+
+
+def get_provider():
+    """The configured provider, or None when conditions aren't shown."""
+    return _provider(settings.WEATHER_PROVIDER) if settings.WEATHER_PROVIDER else None
+
+
+def _key(icao):
+    return f'weather:{icao}'
+
+
+def _retry_key(icao):
+    return f'weather:retry:{icao}'
+
+
+def refresh(icaos):
+    """
+    Fetch icaos from the provider in one call and cache the results, including misses.
+
+    A failed fetch leaves the cached reports alone, stale ones are better than none,
+    and holds off asking for these airports again for WEATHER_RETRY_AFTER seconds.
+    """
+    icaos = sorted(icaos)
+    try:
+        fetched = get_provider().fetch(icaos)
+    except Exception:
+        logger.warning('Weather fetch failed for %s', ','.join(icaos), exc_info=True)
+        cache.set_many({_retry_key(icao): True for icao in icaos}, timeout=settings.WEATHER_RETRY_AFTER)
+        return {}
+    now = time.time()
+    # Airports without a report are cached as None so every page doesn't ask again
+    cache.set_many({_key(icao): (fetched.get(icao), now) for icao in icaos}, timeout=settings.WEATHER_STALE_TTL)
+    return fetched
+
+
+class BackgroundRefresher:
+    """One daemon thread that refetches stale airports, batching whatever queued up meanwhile."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.in_flight = set()
+        self.thread = None
+
+    def schedule(self, icaos):
+        with self.lock:
+            self.pending |= set(icaos) - self.in_flight
+            if self.pending and self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='weather-refresh', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+                self.in_flight, self.pending = self.pending, set()
+            refresh(self.in_flight)
+            with self.lock:
+                self.in_flight = set()
+
+    def join(self, timeout=None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+refresher = BackgroundRefresher()
+
+
+def conditions_for(icaos):
+    """
+    {icao: Conditions} for every airport on a page, from one cache read.
+
+    Fresh entries are returned as they are. Stale ones are returned too while the
+    background thread refetches them, so only airports never seen before wait on
+    the provider, and all of those are fetched together in a single call.
+    """
+    icaos = sorted({icao.upper() for icao in icaos if icao})
+    if not icaos or get_provider() is None:
+        return {}
+
+    now = time.time()
+    cached = cache.get_many([_key(icao) for icao in icaos])
+    conditions, stale, missing = {}, [], []
+    for icao in icaos:
+        entry = cached.get(_key(icao))
+        if entry is None:
+            missing.append(icao)
+            continue
+        report, fetched_at = entry
+        if report is not None:
+            conditions[icao] = report
+        if now - fetched_at > settings.WEATHER_TTL:
+            stale.append(icao)
+
+    if stale or missing:
+        # Airports whose last fetch failed wait out the back-off with what is cached. Only
+        # read for airports due a fetch, so pages served from fresh reports make one read.
+        retrying = cache.get_many([_retry_key(icao) for icao in stale + missing])
+        stale = [icao for icao in stale if _retry_key(icao) not in retrying]
+        missing = [icao for icao in missing if _retry_key(icao) not in retrying]
+
+    if stale:
+        refresher.schedule(stale)
+    if missing:
+        conditions.update(refresh(missing))
+    return conditions
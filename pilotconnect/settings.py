@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,8 +51,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware too
+    'connections.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Before sessions and auth, so everything after it runs as the request's club
+    'connections.tenancy.TenantMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,7 +71,8 @@ ROOT_URLCONF = 'pilotconnect.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also records render times for /metrics
+        'BACKEND': 'connections.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -94,6 +100,134 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        # LocMemCache and RedisCache that count hits and misses for /metrics
+        'BACKEND': 'connections.metrics.InstrumentedLocMemCache',
+        'LOCATION': 'pilotconnect',
+        'METRICS_ALIAS': 'default',
+    }
+}
+
+# Set PILOTCONNECT_SHARED_CACHE_URL (e.g. redis://localhost:6379/0, needs the redis package)
+# to give every worker process one view of state kept in the 'shared' cache, like rate limits
+if os.environ.get('PILOTCONNECT_SHARED_CACHE_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'connections.metrics.InstrumentedRedisCache',
+        'LOCATION': os.environ['PILOTCONNECT_SHARED_CACHE_URL'],
+        'METRICS_ALIAS': 'shared',
+    }
+
+
+# Rate limits
+# Token buckets per endpoint and scope, see connections/ratelimit.py. Each entry is
+# (burst, seconds): a bucket holds `burst` requests and refills completely over `seconds`.
+# With the local-memory cache every worker process keeps its own buckets.
+
+RATE_LIMIT_CACHE = 'shared' if 'shared' in CACHES else 'default'
+
+RATE_LIMITS = {
+    'send_message': {'user': (10, 60), 'recipient': (20, 60)},
+    'send_reply': {'user': (20, 60), 'recipient': (20, 60)},
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.0/topics/http/sessions/
+# Choose where sessions live with PILOTCONNECT_SESSION_PROFILE:
+#   db             - every request reads django_session (Django's default)
+#   cached_db      - reads come from the cache and writes go through to the database.
+#                    With the local-memory cache only use this with a single worker process,
+#                    otherwise a logout in one worker isn't seen by the others.
+#   signed_cookies - the session is kept in a signed cookie and never touches the database
+
+SESSION_PROFILES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+SESSION_PROFILE = os.environ.get('PILOTCONNECT_SESSION_PROFILE', 'db')
+
+SESSION_ENGINE = SESSION_PROFILES[SESSION_PROFILE]
+
+LOGIN_URL = 'login'
+
+
+# Weather
+# Conditions shown next to airports come from WEATHER_PROVIDER, see connections/weather.py.
+# Without one no conditions are shown. Production uses connections.weather.AviationWeatherProvider;
+# for development and tests, connections.weather.StubWeatherProvider works offline, point
+# PILOTCONNECT_WEATHER_STUB at a JSON file of reports keyed by ICAO to control what it returns.
+
+WEATHER_PROVIDER = os.environ.get('PILOTCONNECT_WEATHER_PROVIDER', '')
+WEATHER_STUB_PATH = os.environ.get('PILOTCONNECT_WEATHER_STUB')
+WEATHER_TTL = 600  # seconds a report is served as fresh
+WEATHER_STALE_TTL = 3600  # seconds a stale report is still shown while it is refetched
+WEATHER_RETRY_AFTER = 120  # seconds to wait after a failed fetch before asking the provider again
+WEATHER_TIMEOUT = 3
+
+
+# Home feed
+# Each user's home page is precomputed into a HomeFeed row, see connections/feed.py. Changes
+# are fanned out to the affected feeds by a background thread after they commit; feeds older
+# than FEED_MAX_AGE seconds (or never built) are recomputed when the page is loaded.
+
+FEED_ASYNC = True
+FEED_RADIUS_NM = 50
+FEED_MAX_AGE = 3600
+
+
+# Clubs
+# Each Club is served on its own domain, see connections/tenancy.py. Hosts that match no
+# club see the whole installation, as before clubs existed. Once every member belongs to a
+# club (see the assign_club command), set PILOTCONNECT_TENANT_FALLBACK=0 to answer them with
+# a 404 instead; the admin and /metrics stay reachable on any host.
+
+TENANT_FALLBACK = os.environ.get('PILOTCONNECT_TENANT_FALLBACK', '1') == '1'
+
+# Members can only log in on their own club's site
+AUTHENTICATION_BACKENDS = ['connections.tenancy.ClubMemberBackend']
+
+
+# Calendar feeds
+# Event .ics feeds are cached under the table versions they were built from, see
+# connections/ical.py; a change makes a new key, so the TTL only bounds how long old ones linger.
+
+ICAL_CACHE_TTL = 3600
+
+
+# Logging and metrics
+# Each request logs one JSON line to 'pilotconnect.requests' with its view, status, user and
+# timings (total, database, templates) plus cache hits and misses. /metrics serves the same
+# measurements in the Prometheus text format to scrapes sending `Authorization: Bearer <token>`
+# with the token in PILOTCONNECT_METRICS_TOKEN. Without a token /metrics is a 404.
+
+METRICS_TOKEN = os.environ.get('PILOTCONNECT_METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'connections.logs.JsonFormatter'},
+    },
+    'handlers': {
+        'json': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'pilotconnect.requests': {
+            'handlers': ['json'],
+            # Keep test output readable
+            'level': 'WARNING' if sys.argv[1:2] == ['test'] else os.environ.get('PILOTCONNECT_REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -113,6 +247,13 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing is slow on purpose. Tests and load runs create and log in many users,
+# so they use a fast hasher instead. Never set PILOTCONNECT_FAST_HASHER in production.
+
+if os.environ.get('PILOTCONNECT_FAST_HASHER') or sys.argv[1:2] == ['test']:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 